@@ -0,0 +1,313 @@
+# SPDX-FileCopyrightText: 2023 Ross Patterson <me@rpatterson.net>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Time archive updates and re-linking of generated feeds served from a local server.
+
+Generates RSS and Atom feeds of the given size, the item shapes modeled on the test
+fixtures under `src/feedarchiver/tests/remotes/`, serves them and their enclosures
+from a local HTTP server and times the same runs users do:
+
+- `update`: a full update of an empty archive, downloading everything
+- `incremental`: an update after new items were added to every feed
+- `unchanged`: an update when no feed has changed
+- `relink`: re-linking all enclosures in the archive
+
+Run from a checkout with the package installed, e.g.::
+
+  $ python ./benchmarks/archive.py --feeds 4 --items 500 --enclosure-bytes 65536
+
+Peak RSS is for the whole process, including the local server, and never decreases, so
+it's the peak of all the runs so far.
+"""
+
+import sys
+import os
+import time
+import pathlib
+import tempfile
+import threading
+import functools
+import argparse
+import logging
+import resource
+from http import server
+
+from feedarchiver import archive
+
+parser = argparse.ArgumentParser(description=__doc__.strip().split("\n\n")[0])
+parser.add_argument(
+    "--feeds",
+    type=int,
+    default=2,
+    help="the number of feeds, alternating RSS and Atom (default: %(default)s)",
+)
+parser.add_argument(
+    "--items",
+    type=int,
+    default=200,
+    help="the number of items in each feed (default: %(default)s)",
+)
+parser.add_argument(
+    "--new-items",
+    type=int,
+    default=20,
+    help="the number of items added to each feed for incremental updates "
+    "(default: %(default)s)",
+)
+parser.add_argument(
+    "--enclosures",
+    type=int,
+    default=1,
+    help="the number of enclosures in each item (default: %(default)s)",
+)
+parser.add_argument(
+    "--enclosure-bytes",
+    type=int,
+    default=16 * 1024,
+    help="the size of each enclosure (default: %(default)s)",
+)
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="the number of feeds to update at once (default: %(default)s)",
+)
+parser.add_argument(
+    "--engine",
+    choices=archive.Archive.ENGINES,
+    default="sync",
+    help="how to send requests (default: %(default)s)",
+)
+
+ARCHIVE_CONFIG = """\
+defaults:
+  base-url: "{base_url}"
+  enclosures:
+    - template: "\\
+      ./Music/Podcasts/{{utils.quote_sep(feed_parsed.feed.title).strip()}}\\
+      /{{enclosure_path.name}}"
+feeds:
+{feeds}
+"""
+
+
+class QuietHandler(server.SimpleHTTPRequestHandler):
+    """
+    Serve the generated feeds without logging every request.
+    """
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Don't log requests, they'd dominate the output.
+        """
+
+
+def build_rss(base_url, feed_idx, items, enclosures):
+    """
+    Generate an RSS feed with the given number of items and enclosures per item.
+    """
+    channel = "".join(f"""\
+<item>
+<guid isPermaLink="false">feed-{feed_idx}-item-{idx}</guid>
+<title>Item {idx} Episode Title</title>
+<description>The description of item {idx}.</description>
+<pubDate>Mon, 06 Sep 2021 16:45:00 +0000</pubDate>
+{"".join(
+    f'<enclosure url="{base_url}/media/{feed_idx}/{idx}-{enclosure_idx}.mp3" '
+    'type="audio/mpeg"/>'
+    for enclosure_idx in range(enclosures)
+)}
+</item>
+""" for idx in reversed(range(items)))
+    return f"""\
+<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">
+<channel>
+<title>Benchmark Feed {feed_idx}</title>
+<link>{base_url}/</link>
+<atom:link href="{base_url}/feed-{feed_idx}.rss" rel="self" \
+type="application/rss+xml"/>
+{channel}
+</channel>
+</rss>
+"""
+
+
+def build_atom(base_url, feed_idx, items, enclosures):
+    """
+    Generate an Atom feed with the given number of items and enclosures per item.
+    """
+    entries = "".join(f"""\
+<entry>
+<id>feed-{feed_idx}-item-{idx}</id>
+<title>Item {idx} Episode Title</title>
+<summary>The description of item {idx}.</summary>
+<updated>2021-09-06T16:45:00Z</updated>
+{"".join(
+    f'<link rel="enclosure" type="audio/mpeg" '
+    f'href="{base_url}/media/{feed_idx}/{idx}-{enclosure_idx}.mp3"/>'
+    for enclosure_idx in range(enclosures)
+)}
+</entry>
+""" for idx in reversed(range(items)))
+    return f"""\
+<?xml version="1.0" encoding="UTF-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+<title>Benchmark Feed {feed_idx}</title>
+<id>{base_url}/feed-{feed_idx}.atom</id>
+<updated>2021-09-06T16:45:00Z</updated>
+<link href="{base_url}/feed-{feed_idx}.atom" rel="self"/>
+{entries}
+</feed>
+"""
+
+
+def write_remotes(remote_path, base_url, parsed_args, items):
+    """
+    Write all the feeds with the given number of items and their enclosures.
+
+    Return the URLs of the feeds.
+    """
+    feed_urls = []
+    for feed_idx in range(parsed_args.feeds):
+        build_feed, suffix = (
+            (build_rss, ".rss") if feed_idx % 2 == 0 else (build_atom, ".atom")
+        )
+        feed_path = remote_path / f"feed-{feed_idx}{suffix}"
+        feed_path.write_text(
+            build_feed(base_url, feed_idx, items, parsed_args.enclosures),
+            encoding="utf-8",
+        )
+        feed_urls.append(f"{base_url}/{feed_path.name}")
+        media_path = remote_path / "media" / str(feed_idx)
+        media_path.mkdir(parents=True, exist_ok=True)
+        for idx in range(items):
+            for enclosure_idx in range(parsed_args.enclosures):
+                enclosure_path = media_path / f"{idx}-{enclosure_idx}.mp3"
+                if not enclosure_path.exists():
+                    enclosure_path.write_bytes(os.urandom(parsed_args.enclosure_bytes))
+    return feed_urls
+
+
+def get_peak_rss():
+    """
+    Return the peak resident set size of this process in MB.
+    """
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux but bytes on macOS
+    if sys.platform == "darwin":
+        return max_rss / 1024 / 1024
+    return max_rss / 1024
+
+
+def run_archive(
+    parsed_args,
+    archive_path,
+    command,
+    name,
+    items,
+    downloaded_items=0,
+):  # pylint: disable=too-many-arguments
+    """
+    Time one archive sub-command run and print the throughput.
+    """
+    feed_archive = archive.Archive(
+        archive_path,
+        jobs=parsed_args.jobs,
+        engine=parsed_args.engine,
+    )
+    start = time.perf_counter()
+    getattr(feed_archive, command)()
+    elapsed = time.perf_counter() - start
+    downloaded_mb = (
+        downloaded_items
+        * parsed_args.enclosures
+        * parsed_args.enclosure_bytes
+        / 1024
+        / 1024
+    )
+    print(
+        f"{name:>12}: {elapsed:8.3f}s {items / elapsed:10.1f} items/s "
+        f"{downloaded_mb / elapsed:8.2f} MB/s {get_peak_rss():8.1f} MB peak RSS",
+    )
+
+
+def run_benchmarks(parsed_args, remote_path, archive_path, base_url):
+    """
+    Generate the feeds and archive configuration, time each run and print the results.
+    """
+    feed_urls = write_remotes(remote_path, base_url, parsed_args, parsed_args.items)
+    (archive_path / archive.Archive.FEED_CONFIGS_BASENAME).write_text(
+        ARCHIVE_CONFIG.format(
+            base_url=base_url,
+            feeds="\n".join(f'  - remote-url: "{feed_url}"' for feed_url in feed_urls),
+        ),
+        encoding="utf-8",
+    )
+    print(
+        f"{parsed_args.feeds} feeds, {parsed_args.items} items, "
+        f"{parsed_args.enclosures} x {parsed_args.enclosure_bytes} byte "
+        f"enclosures, {parsed_args.jobs} jobs, {parsed_args.engine} engine",
+    )
+    total_items = parsed_args.feeds * parsed_args.items
+    run_archive(
+        parsed_args,
+        archive_path,
+        "update",
+        "update",
+        total_items,
+        total_items,
+    )
+
+    # Make sure the feed modification times change for conditional requests
+    time.sleep(1)
+    items = parsed_args.items + parsed_args.new_items
+    write_remotes(remote_path, base_url, parsed_args, items)
+    new_items = parsed_args.feeds * parsed_args.new_items
+    run_archive(
+        parsed_args,
+        archive_path,
+        "update",
+        "incremental",
+        new_items,
+        new_items,
+    )
+
+    total_items = parsed_args.feeds * items
+    run_archive(parsed_args, archive_path, "update", "unchanged", total_items)
+    run_archive(parsed_args, archive_path, "relink", "relink", total_items)
+
+
+def main(args=None):
+    """
+    Serve the generated feeds from a local server while running the benchmarks.
+    """
+    parsed_args = parser.parse_args(args=args)
+    # The generated feeds always have many more items than the archive
+    logging.basicConfig(level=logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        remote_path = pathlib.Path(tmp_dir) / "remote"
+        remote_path.mkdir()
+        archive_path = pathlib.Path(tmp_dir) / "archive"
+        archive_path.mkdir()
+        with server.ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            functools.partial(QuietHandler, directory=str(remote_path)),
+        ) as http_server:
+            threading.Thread(target=http_server.serve_forever, daemon=True).start()
+            try:
+                run_benchmarks(
+                    parsed_args,
+                    remote_path,
+                    archive_path,
+                    f"http://127.0.0.1:{http_server.server_address[1]}",
+                )
+            finally:
+                http_server.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2023 Ross Patterson <me@rpatterson.net>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Compare evaluating the feed format XPath strings against the compiled XPaths.
+
+Run from a checkout with the package installed, e.g.::
+
+  $ python ./benchmarks/xpath.py --items 5000
+"""
+
+import sys
+import timeit
+import argparse
+
+from lxml import etree  # nosec: B410
+
+from feedarchiver import formats
+
+parser = argparse.ArgumentParser(description=__doc__.strip())
+parser.add_argument(
+    "--items",
+    type=int,
+    default=5000,
+    help="the number of items in the generated feed (default: %(default)s)",
+)
+parser.add_argument(
+    "--repeat",
+    type=int,
+    default=5,
+    help="how many times to repeat each measurement (default: %(default)s)",
+)
+
+
+def build_feed(items):
+    """
+    Generate an RSS feed with the given number of items, each with an enclosure.
+    """
+    channel = "".join(f"""\
+<item>
+<guid>item-{idx}</guid>
+<title>Item {idx}</title>
+<link>https://foo.example.com/episodes/{idx}/</link>
+<itunes:image href="https://foo.example.com/episodes/{idx}/image.png"/>
+<enclosure url="https://foo.example.com/episodes/{idx}.mp3" type="audio/mpeg"/>
+</item>
+""" for idx in range(items))
+    return etree.fromstring(f"""\
+<rss xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd"><channel>
+<title>Benchmark feed</title>
+<link>https://foo.example.com/</link>
+{channel}
+</channel></rss>
+""".encode())
+
+
+def process_strings(feed_format, feed_root):
+    """
+    Process every item the way updates did before the XPaths were compiled.
+    """
+    items_parent = feed_root.xpath(feed_format.ITEMS_PARENT_XPATH)[0]
+    for item_elem in items_parent.xpath(feed_format.ITEMS_XPATH):
+        item_elem.xpath(feed_format.ITEM_ID_XPATH)
+        item_elem.xpath(" | ".join(feed_format.DOWNLOAD_ITEM_ASSET_URLS_XPATHS))
+        item_elem.xpath(" | ".join(feed_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS))
+
+
+def process_compiled(feed_format, feed_root):
+    """
+    Process every item using the compiled XPaths.
+    """
+    for item_elem in feed_format.iter_items(feed_root):
+        feed_format.get_item_id(item_elem)
+        formats.all_xpaths_results(
+            item_elem,
+            feed_format.DOWNLOAD_ITEM_ASSET_URLS_XPATHS,
+        )
+        formats.all_xpaths_results(
+            item_elem,
+            feed_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS,
+        )
+
+
+def main(args=None):
+    """
+    Time processing all items of a generated feed both ways and print the results.
+    """
+    parsed_args = parser.parse_args(args=args)
+    feed_root = build_feed(parsed_args.items)
+    feed_format = formats.RssFeedFormat(archive_feed=None)
+    results = {}
+    for name, process in (("strings", process_strings), ("compiled", process_compiled)):
+        results[name] = min(
+            timeit.repeat(
+                lambda process=process: process(feed_format, feed_root),
+                number=1,
+                repeat=parsed_args.repeat,
+            )
+        )
+        print(f"{name:>8}: {results[name]:.4f}s for {parsed_args.items} items")
+    print(f" speedup: {results['strings'] / results['compiled']:.2f}x")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
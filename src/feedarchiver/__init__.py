@@ -13,13 +13,13 @@ import pathlib
 import logging
 import argparse
 import json
-import pdb
 
 import argcomplete
 
-from . import utils
-
-from . import archive
+# Avoid importing anything but the standard library and `argcomplete` at module load.
+# Shell tab completion imports this module on every TAB press and the sub-commands
+# import the modules that do the actual work, which import the heavier dependencies,
+# such as `httpx`, `lxml` and `feedparser`, only when they actually run.
 
 logger = logging.getLogger(__name__)
 
@@ -55,27 +55,69 @@ parser.add_argument(
     type=pathlib.Path,
     default=pathlib.Path(),
 )
+parser.add_argument(
+    "--profile",
+    metavar="DIR",
+    help=(
+        "write `cProfile` statistics for each feed and for the whole run into a new "
+        "directory for each run under this directory"
+    ),
+    type=pathlib.Path,
+)
+parser.add_argument(
+    "--profile-sample",
+    metavar="FRACTION",
+    help="the fraction of runs to profile when `--profile` is given",
+    type=float,
+    default=1.0,
+)
 # Define CLI sub-commands
 subparsers = parser.add_subparsers(
     dest="command",
     required=True,
     help="sub-command",
 )
+# Options shared by the sub-commands that process several feeds at once, defined before
+# the sub-command functions so that their defaults can't drift apart
+jobs_parser = argparse.ArgumentParser(add_help=False)
+jobs_parser.add_argument(
+    "--jobs",
+    "-j",
+    help="the number of feeds to process at once",
+    type=int,
+    default=1,
+)
 
 
 def update(
     archive_dir=parser.get_default("--archive-dir"),
     recreate=parser.get_default("--recreate"),
-):  # pylint: disable=missing-function-docstring
-    feed_archive = archive.Archive(archive_dir, recreate)
+    jobs=jobs_parser.get_default("jobs"),
+    engine="sync",
+    profile=None,
+    profile_sample=parser.get_default("profile_sample"),
+):  # pylint: disable=too-many-arguments
+    """
+    Request the URL of each feed in the archive and update contents accordingly.
+    """
+    from . import archive  # pylint: disable=import-outside-toplevel
+
+    feed_archive = archive.Archive(
+        archive_dir,
+        recreate,
+        jobs=jobs,
+        engine=engine,
+        profile_dir=profile,
+        profile_sample=profile_sample,
+    )
     return feed_archive.update()
 
 
-update.__doc__ = archive.Archive.update.__doc__
 parser_update = subparsers.add_parser(
     "update",
     help=update.__doc__.strip(),  # type: ignore
     description=update.__doc__.strip(),  # type: ignore
+    parents=[jobs_parser],
 )
 # Make the function for the sub-command specified in the CLI argument available in the
 # argument parser for delegation below.
@@ -86,27 +128,79 @@ parser_update.add_argument(
     help="ignore existing feed XML in the archive and rewrite it",
     action="store_true",
 )
-
-# Register shell tab completion
-argcomplete.autocomplete(parser)
+parser_update.add_argument(
+    "--engine",
+    help=(
+        "how to send requests, the `async` engine sends all requests from one event "
+        "loop while processing feeds in `--jobs` worker threads"
+    ),
+    # Keep in sync with `archive.Archive.ENGINES`
+    choices=("sync", "async"),
+    default="sync",
+)
 
 
 def relink(
     archive_dir=parser.get_default("--archive-dir"),
-):  # pylint: disable=missing-function-docstring
-    feed_archive = archive.Archive(archive_dir)
+    jobs=jobs_parser.get_default("jobs"),
+    profile=None,
+    profile_sample=parser.get_default("profile_sample"),
+):
+    """
+    Re-link enclosures to the correct locations for the current configuration.
+    """
+    from . import archive  # pylint: disable=import-outside-toplevel
+
+    feed_archive = archive.Archive(
+        archive_dir,
+        jobs=jobs,
+        profile_dir=profile,
+        profile_sample=profile_sample,
+    )
     return feed_archive.relink()
 
 
-relink.__doc__ = archive.Archive.relink.__doc__
 parser_relink = subparsers.add_parser(
     "relink",
     help=relink.__doc__.strip(),  # type: ignore
     description=relink.__doc__.strip(),  # type: ignore
+    parents=[jobs_parser],
 )
 parser_relink.set_defaults(command=relink)
 
 
+def daemon(
+    archive_dir=parser.get_default("--archive-dir"),
+    jobs=jobs_parser.get_default("jobs"),
+    profile=None,
+    profile_sample=parser.get_default("profile_sample"),
+):
+    """
+    Keep updating each feed on its own interval until stopped.
+    """
+    from . import archive  # pylint: disable=import-outside-toplevel
+
+    feed_archive = archive.Archive(
+        archive_dir,
+        jobs=jobs,
+        profile_dir=profile,
+        profile_sample=profile_sample,
+    )
+    return feed_archive.daemon()
+
+
+parser_daemon = subparsers.add_parser(
+    "daemon",
+    help=daemon.__doc__.strip(),  # type: ignore
+    description=daemon.__doc__.strip(),  # type: ignore
+    parents=[jobs_parser],
+)
+parser_daemon.set_defaults(command=daemon)
+
+# Register shell tab completion once all sub-commands and options are defined
+argcomplete.autocomplete(parser)
+
+
 def config_cli_logging(
     root_level=logging.INFO,
     log_level=parser.get_default("--log-level"),
@@ -119,6 +213,8 @@ def config_cli_logging(
     logging.basicConfig(level=root_level)
     # If the CLI option was not specified, fallback to the environment variable
     if log_level is None:  # pragma: no cover
+        from . import utils  # pylint: disable=import-outside-toplevel
+
         log_level = "INFO"
         if utils.DEBUG:
             log_level = "DEBUG"
@@ -135,7 +231,11 @@ def main(args=None):  # pylint: disable=missing-function-docstring
     try:
         _main(args=args)
     except Exception:  # pragma: no cover
+        from . import utils  # pylint: disable=import-outside-toplevel
+
         if utils.POST_MORTEM:
+            import pdb  # pylint: disable=import-outside-toplevel
+
             pdb.post_mortem()
         raise
 
@@ -7,11 +7,21 @@ An archive of RSS/Atom syndication feeds.
 """
 
 import os
+import time
+import random
 import pathlib
+import shutil
 import urllib.parse
 import logging
+import functools
+import threading
+import contextlib
 import tracemalloc
+import cProfile
+import pstats
 import pdb
+import asyncio
+from concurrent import futures
 
 import yaml
 import httpx
@@ -22,6 +32,7 @@ from lxml.html import builder  # nosec B410
 from . import utils
 from . import feed
 from . import enclosures
+from . import hosts
 from .utils import mimetypes
 
 logger = logging.getLogger(__name__)
@@ -36,15 +47,60 @@ class Archive:  # pylint: disable=too-many-instance-attributes
 
     FEED_CONFIGS_BASENAME = ".feed-archiver.yml"
 
+    # The engines that may be used to send requests and process feeds
+    ENGINES = ("sync", "async")
+
+    # Where profile statistics are written within the directory for each profiled run
+    PROFILE_RUN_BASENAME = "run.pstats"
+    PROFILE_FEEDS_DIRNAME = "feeds"
+
+    # How many seconds the `daemon` sub-command waits at most between checking for
+    # feeds due for update, finished feed updates and configuration changes
+    DAEMON_POLL_INTERVAL = 10.0
+
+    # Prometheus node exporter textfile collector metrics written for each run
+    METRICS_BASENAME = "feed-archiver-{command}.prom"
+    METRICS_PREFIX = "feed_archiver"
+    FEED_METRICS = {
+        "duration_seconds": "How long the sub-command took for the feed.",
+        "success": "Whether the sub-command completed for the feed without errors.",
+        "fetch_seconds": "How long until the remote feed response started.",
+        "parse_seconds": "How long streaming and parsing the remote feed XML took.",
+        "new_items": "The number of items added to the archived feed.",
+        "download_bytes": "The number of bytes downloaded for the feed's items.",
+        "download_errors": "The number of the feed's item downloads that failed.",
+        "links": "The number of enclosure links the plugins added.",
+    }
+
+    # Write `*.gz` sidecars of feeds and the index for nginx's `gzip_static` by default
+    PRECOMPRESS = ("gzip",)
+
     # Initialized when the configuration is loaded prior to update
     global_config = None
+    precompress_encodings = None
     enclosure_plugins = None
     enclosure_fallack_plugins = None
+    host_scheduler = None
     # The default base URL for assembling absolute URLs
     url = url_split = None
     archive_feeds = None
-
-    def __init__(self, root_dir, recreate=False):
+    metrics_path = None
+    # Initialized while the async engine's event loop is running
+    loop = None
+    async_client = None
+    # Initialized while profiling a run
+    profile_path = None
+    profiler = profiler_thread = None
+
+    def __init__(
+        self,
+        root_dir,
+        recreate=False,
+        jobs=1,
+        engine="sync",
+        profile_dir=None,
+        profile_sample=1.0,
+    ):  # pylint: disable=too-many-arguments
         """
         Instantiate a representation of an archive from a file-system path.
         """
@@ -59,6 +115,30 @@ class Archive:  # pylint: disable=too-many-instance-attributes
             raise ValueError(f"Feeds definition path is not a file: {self.config_path}")
 
         self.recreate = recreate
+        if not isinstance(jobs, int) or jobs < 1:
+            raise ValueError(f"Number of jobs must be a positive integer: {jobs!r}")
+        self.jobs = jobs
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown engine: {engine!r}")
+        self.engine = engine
+        if (
+            isinstance(profile_sample, bool)
+            or not isinstance(profile_sample, (int, float))
+            or not 0 < profile_sample <= 1
+        ):
+            raise ValueError(
+                f"Profile sample must be a fraction greater than 0 and at most 1: "
+                f"{profile_sample!r}",
+            )
+        # Decide for each run whether to profile so that profiling may be left on in
+        # production for only a fraction of runs, see `is_profiled()`.
+        self.profile_dir = None
+        if profile_dir is not None:
+            self.profile_dir = pathlib.Path(profile_dir)
+        self.profile_sample = profile_sample
+
+        # Set to stop the `daemon` sub-command once the current feed updates finish
+        self.daemon_stop = threading.Event()
 
         self.client = httpx.Client(follow_redirects=True)
         # Avoid bot detection, real-world `User-Agent` HTTP header values
@@ -67,6 +147,9 @@ class Archive:  # pylint: disable=too-many-instance-attributes
     def load_config(self):
         """
         Read and deserialize the archive feed configs and do necessary pre-processing.
+
+        Load and validate everything before changing the archive so that a problem with
+        a changed configuration leaves the archive as it was, such as for the `daemon`.
         """
         logger.debug(
             "Retrieving feed configurations: %r",
@@ -76,26 +159,60 @@ class Archive:  # pylint: disable=too-many-instance-attributes
             archive_config = yaml.safe_load(feeds_opened)
 
         # The first row after the header defines defaults and/or global options
-        self.global_config = archive_config["defaults"]
-        self.url = self.global_config["base-url"]
-        self.url_split = urllib.parse.urlsplit(self.global_config["base-url"])
-        (
-            self.enclosure_plugins,
-            self.enclosure_fallack_plugins,
-        ) = enclosures.load_plugins(self, self.global_config)
+        global_config = archive_config["defaults"]
+        url_split = urllib.parse.urlsplit(global_config["base-url"])
+        host_scheduler = hosts.HostScheduler(global_config)
+        precompress_encodings = global_config.get("precompress", self.PRECOMPRESS)
+        for encoding in precompress_encodings:
+            if encoding not in utils.PRECOMPRESS_SUFFIXES:
+                raise ValueError(
+                    f"`precompress` encodings must be one of "
+                    f"{', '.join(utils.PRECOMPRESS_SUFFIXES)}: {encoding!r}",
+                )
+            if encoding == "br" and utils.brotli is None:  # pragma: no cover
+                raise ValueError(
+                    "`precompress` Brotli encoding requires the `brotli` package, "
+                    "e.g. `$ pip install feed-archiver[brotli]`",
+                )
+        metrics_path = None
+        if "metrics-dir" in global_config:
+            metrics_path = self.root_path / global_config["metrics-dir"]
+        # Start each run with fresh plugin caches, such as the Sonarr library
+        shared_plugins = {}
+        archive_plugins = enclosures.load_plugins(
+            self,
+            global_config,
+            global_config,
+            shared_plugins,
+        )
 
         feed_configs = archive_config["feeds"]
         if not feed_configs:
             raise ValueError(f"No feeds defined: {str(self.config_path)!r}")
-
-        self.archive_feeds = []
+        previous_feeds = {
+            archive_feed.url: archive_feed for archive_feed in self.archive_feeds or ()
+        }
+        archive_feeds = []
         for feed_config in feed_configs:
             archive_feed = feed.ArchiveFeed(
                 archive=self,
                 config=feed_config,
             )
-            archive_feed.load_config()
-            self.archive_feeds.append(archive_feed)
+            archive_feed.load_config(global_config, archive_plugins, shared_plugins)
+            if archive_feed.url in previous_feeds:
+                archive_feed.resume(previous_feeds[archive_feed.url])
+            archive_feeds.append(archive_feed)
+
+        # All valid, switch to the new configuration
+        self.global_config = global_config
+        self.url = global_config["base-url"]
+        self.url_split = url_split
+        self.host_scheduler = host_scheduler
+        self.precompress_encodings = precompress_encodings
+        self.metrics_path = metrics_path
+        enclosures.replace_plugins(shared_plugins)
+        self.enclosure_plugins, self.enclosure_fallack_plugins = archive_plugins
+        self.archive_feeds = archive_feeds
 
     def response_to_path(self, url_response, url_result=None, request=None):
         """
@@ -238,37 +355,347 @@ class Archive:  # pylint: disable=too-many-instance-attributes
     def run_feeds_command(self, command, *args, **kwargs):
         """
         Call the sub-command for each feed handling exceptions and aggregating results.
+
+        If more than one job is requested, run the sub-command for that many feeds at
+        once in a pool of worker threads.
         """
+        run_start = time.perf_counter()
         self.load_config()
+        if self.engine == "async":
+            feeds_results = asyncio.run(
+                self.run_feeds_command_async(command, *args, **kwargs),
+            )
+        elif self.jobs > 1:
+            with futures.ThreadPoolExecutor(
+                max_workers=self.jobs,
+                thread_name_prefix="feed-archiver",
+            ) as executor:
+                feed_futures = [
+                    executor.submit(
+                        self.run_feed_command,
+                        archive_feed,
+                        command,
+                        *args,
+                        **kwargs,
+                    )
+                    for archive_feed in self.archive_feeds
+                ]
+                feeds_results = [feed_future.result() for feed_future in feed_futures]
+        else:
+            feeds_results = [
+                self.run_feed_command(archive_feed, command, *args, **kwargs)
+                for archive_feed in self.archive_feeds
+            ]
+
+        if self.metrics_path is not None:
+            self.write_metrics(command, time.perf_counter() - run_start)
+
+        # Aggregate results in the order the feeds are configured
         results = {}
-        for archive_feed in self.archive_feeds:
-            feed_command = getattr(archive_feed, command)
-            try:
-                feed_results = feed_command(*args, **kwargs)
-            except Exception:  # pylint: disable=broad-except
-                logger.exception(
-                    "Unhandled exception updating feed: %r",
-                    archive_feed.url,
-                )
-                if utils.POST_MORTEM:  # pragma: no cover
-                    pdb.post_mortem()
-                continue
+        for archive_feed, feed_results in zip(self.archive_feeds, feeds_results):
             if feed_results:
                 results[archive_feed.url] = feed_results
-            if utils.PYTHONTRACEMALLOC:  # pragma: no cover
-                # Optionally compare memory consumption
-                self.tracemalloc_snapshot = utils.compare_memory_snapshots(archive_feed)
         if results:
             return results
         return None
 
+    async def run_feeds_command_async(self, command, *args, **kwargs):
+        """
+        Call the sub-command for each feed sending all requests from one event loop.
+
+        All requests are sent and all responses are streamed from this event loop using
+        one `httpx.AsyncClient`.  Only the XML processing and filesystem work of each
+        feed is done in a pool of worker threads so that the number of requests in
+        flight is limited by the feeds' `download-concurrency` and the host limits
+        rather than by the number of threads.  As many feeds are processed at once as
+        there are jobs.
+        """
+        self.loop = asyncio.get_running_loop()
+        feeds_semaphore = asyncio.Semaphore(self.jobs)
+        try:
+            async with httpx.AsyncClient(
+                follow_redirects=True,
+                headers=self.client.headers,
+            ) as self.async_client:
+                with futures.ThreadPoolExecutor(
+                    max_workers=self.jobs,
+                    thread_name_prefix="feed-archiver",
+                ) as executor:
+                    return await asyncio.gather(
+                        *(
+                            self.run_feed_command_async(
+                                executor,
+                                feeds_semaphore,
+                                archive_feed,
+                                command,
+                                *args,
+                                **kwargs,
+                            )
+                            for archive_feed in self.archive_feeds
+                        )
+                    )
+        finally:
+            self.loop = self.async_client = None
+
+    async def run_feed_command_async(
+        self,
+        executor,
+        feeds_semaphore,
+        archive_feed,
+        command,
+        *args,
+        **kwargs,
+    ):  # pylint: disable=too-many-arguments
+        """
+        Call the sub-command for one feed from the engine event loop.
+
+        Sub-commands that send no requests, and so have no `async` variant, are run
+        whole in the worker threads.
+        """
+        async with feeds_semaphore:
+            feed_command_async = getattr(archive_feed, f"{command}_async", None)
+            if feed_command_async is None:
+                return await self.loop.run_in_executor(
+                    executor,
+                    functools.partial(
+                        self.run_feed_command,
+                        archive_feed,
+                        command,
+                        *args,
+                        **kwargs,
+                    ),
+                )
+            feed_results = None
+            with self.handle_feed_command(archive_feed):
+                feed_results = await feed_command_async(executor, *args, **kwargs)
+            return feed_results
+
+    def run_feed_command(self, archive_feed, command, *args, **kwargs):
+        """
+        Call the sub-command for one feed, log any exception and return the results.
+        """
+        feed_results = None
+        with self.handle_feed_command(archive_feed) as feed_profiler:
+            feed_results = self.run_profiled(
+                feed_profiler,
+                getattr(archive_feed, command),
+                *args,
+                **kwargs,
+            )
+        return feed_results
+
+    @contextlib.contextmanager
+    def handle_feed_command(self, archive_feed):
+        """
+        Measure and profile the sub-command for one feed and log any exception.
+
+        Yield the feed's profiler for `run_profiled()`, `None` if not profiling this
+        run.  Exceptions are logged rather than raised so that the other feeds continue.
+        """
+        # Measure only the latest run when feeds are run repeatedly by the daemon
+        archive_feed.metrics.clear()
+        feed_start = time.perf_counter()
+        try:
+            with self.profile_feed(archive_feed) as feed_profiler:
+                yield feed_profiler
+        except Exception:  # pylint: disable=broad-except
+            logger.exception(
+                "Unhandled exception updating feed: %r",
+                archive_feed.url,
+            )
+            if utils.POST_MORTEM:  # pragma: no cover
+                pdb.post_mortem()
+        else:
+            archive_feed.count_metric("success")
+            if utils.PYTHONTRACEMALLOC:  # pragma: no cover
+                # Optionally compare memory consumption
+                self.tracemalloc_snapshot = utils.compare_memory_snapshots(archive_feed)
+        finally:
+            archive_feed.count_metric(
+                "duration_seconds",
+                time.perf_counter() - feed_start,
+            )
+
+    def write_metrics(self, command, run_duration):
+        """
+        Write the metrics of this run in the Prometheus text format.
+
+        Write a temporary file and rename it into place so that the node exporter never
+        reads a partially written file.
+        """
+        run_labels = format_metric_labels(command=command)
+        lines = [
+            f"# HELP {self.METRICS_PREFIX}_run_duration_seconds "
+            "How long the whole run took.",
+            f"# TYPE {self.METRICS_PREFIX}_run_duration_seconds gauge",
+            f"{self.METRICS_PREFIX}_run_duration_seconds{run_labels} {run_duration}",
+            f"# HELP {self.METRICS_PREFIX}_run_timestamp_seconds "
+            "When the run finished.",
+            f"# TYPE {self.METRICS_PREFIX}_run_timestamp_seconds gauge",
+            f"{self.METRICS_PREFIX}_run_timestamp_seconds{run_labels} {time.time()}",
+        ]
+        for metric_name, metric_help in self.FEED_METRICS.items():
+            lines.extend(
+                [
+                    f"# HELP {self.METRICS_PREFIX}_feed_{metric_name} {metric_help}",
+                    f"# TYPE {self.METRICS_PREFIX}_feed_{metric_name} gauge",
+                ],
+            )
+            lines.extend(
+                f"{self.METRICS_PREFIX}_feed_{metric_name}"
+                f"{format_metric_labels(command=command, feed=archive_feed.url)} "
+                f"{archive_feed.metrics[metric_name]}"
+                for archive_feed in self.archive_feeds
+            )
+
+        metrics_file_path = self.metrics_path / self.METRICS_BASENAME.format(
+            command=command,
+        )
+        logger.debug("Writing metrics: %s", metrics_file_path)
+        self.metrics_path.mkdir(parents=True, exist_ok=True)
+        tmp_path = metrics_file_path.with_name(f".{metrics_file_path.name}~")
+        tmp_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp_path, metrics_file_path)
+
+    @contextlib.contextmanager
+    def profile_run(self, command):
+        """
+        Profile the whole run of the sub-command if profiling this run.
+
+        Write the profile statistics of each feed and the aggregate of all feeds and the
+        rest of the run, such as loading the configuration, into a new directory for
+        this run.  For the `async` engine, the event loop runs in this thread so the
+        time spent sending requests is only in the aggregate.
+        """
+        if not self.is_profiled():
+            yield
+            return
+        self.profile_path = self.make_profile_path(command)
+        self.profiler = cProfile.Profile()
+        self.profiler_thread = threading.current_thread()
+        self.profiler.enable()
+        try:
+            yield
+        finally:
+            self.profiler.disable()
+            run_stats = pstats.Stats(self.profiler)
+            for feed_stats_path in sorted(
+                (self.profile_path / self.PROFILE_FEEDS_DIRNAME).glob("*.pstats"),
+            ):
+                run_stats.add(str(feed_stats_path))
+            run_stats.dump_stats(self.profile_path / self.PROFILE_RUN_BASENAME)
+            logger.info("Wrote profile statistics: %s", self.profile_path)
+            self.profile_path = self.profiler = self.profiler_thread = None
+
+    def is_profiled(self):
+        """
+        Decide whether to profile one run, or one feed update of the `daemon`.
+        """
+        return (
+            self.profile_dir is not None
+            and random.random() < self.profile_sample  # nosec B311
+        )
+
+    def make_profile_path(self, command):
+        """
+        Create a new directory for the profile statistics of one run and return it.
+
+        Runs may start within the same second, such as feed updates of the `daemon`,
+        so add a counter to the name rather than reuse the directory of another run.
+        """
+        run_name = f"{time.strftime('%Y%m%dT%H%M%S')}-{command}"
+        profile_path = self.profile_dir / run_name
+        run_idx = 1
+        while True:
+            try:
+                profile_path.mkdir(parents=True)
+            except FileExistsError:
+                run_idx += 1
+                profile_path = self.profile_dir / f"{run_name}-{run_idx}"
+                continue
+            break
+        (profile_path / self.PROFILE_FEEDS_DIRNAME).mkdir()
+        return profile_path
+
+    @contextlib.contextmanager
+    def profile_feed(self, archive_feed, profile_path=None):
+        """
+        Yield a profiler for the sub-command of one feed if profiling this run.
+
+        The feed's work may be run with the profiler in several steps from different
+        threads using `run_profiled()`, as the `async` engine does.  Work the feed runs
+        in other threads at the same time, such as downloads, is profiled by profilers
+        of those threads, see `ArchiveFeed.run_worker_profiled()`.  Write the statistics
+        of all of them once the sub-command is done.
+        """
+        if profile_path is None:
+            profile_path = self.profile_path
+        if profile_path is None or archive_feed.profiler is not None:
+            # Not profiling or already profiling the feed, such as a `daemon` update
+            yield archive_feed.profiler
+            return
+        archive_feed.profiler = cProfile.Profile()
+        try:
+            yield archive_feed.profiler
+        finally:
+            feed_stats = pstats.Stats()
+            for profiler in [
+                archive_feed.profiler,
+                *archive_feed.worker_profilers.values(),
+            ]:
+                profiler.create_stats()
+                # Statistics can't be added from profilers that weren't used
+                if profiler.stats:
+                    feed_stats.add(profiler)
+            feed_stats.dump_stats(
+                profile_path
+                / self.PROFILE_FEEDS_DIRNAME
+                / f"{utils.quote_basename(archive_feed.url)}.pstats",
+            )
+            archive_feed.profiler = None
+            archive_feed.worker_profilers.clear()
+
+    def run_profiled(self, feed_profiler, func, *args, **kwargs):
+        """
+        Call the function with any feed profiler enabled and return the result.
+        """
+        if feed_profiler is None:
+            return func(*args, **kwargs)
+        # Only one profiler may be active in a thread, pause the run's profiler when
+        # feeds are processed in the same thread so that time is counted only once.
+        is_run_thread = threading.current_thread() is self.profiler_thread
+        if is_run_thread:
+            self.profiler.disable()
+        try:
+            try:
+                feed_profiler.enable()
+            except ValueError:  # pragma: no cover
+                # Python 3.12+ allows only one active profiler for all threads, so leave
+                # the calls from this thread to the one already active.
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                feed_profiler.disable()
+        finally:
+            if is_run_thread:
+                self.profiler.enable()
+
     # Sub-commands
 
     def update(self):
         """
         Request the URL of each feed in the archive and update contents accordingly.
         """
-        feeds_results = self.run_feeds_command("update")
+        with self.profile_run("update"):
+            feeds_results = self.run_feeds_command("update")
+            self.update_index()
+        return feeds_results
+
+    def update_index(self):
+        """
+        Write the HTML index of all the feeds in the archive.
+        """
         html = builder.HTML(
             builder.HEAD(
                 builder.TITLE("Feed Archive Index"),
@@ -280,32 +707,245 @@ class Archive:  # pylint: disable=too-many-instance-attributes
                 ),
                 builder.UL(
                     *(
-                        builder.LI(
-                            builder.A(
-                                archive_feed.config.get(
-                                    "title",
-                                    archive_feed.config.get(
-                                        "name",
-                                        str(archive_feed.path),
-                                    ),
-                                ),
-                                href=str(archive_feed.path),
-                            ),
-                        )
+                        self.build_index_item(archive_feed)
                         for archive_feed in self.archive_feeds
+                        # Skip feeds not updated yet, such as after the daemon reloads
+                        if archive_feed.path is not None
                     )
                 ),
             ),
         )
-        logger.info(
-            "Writing HTML index: %s",
-            self.root_path / "index.html",
+        index_path = self.root_path / self.INDEX_BASENAME
+        index_bytes = etree.tostring(html, pretty_print=True)
+        # Leave the index and its sidecars alone if nothing changed
+        if index_path.is_file() and index_path.read_bytes() == index_bytes:
+            logger.debug("HTML index unchanged: %s", index_path)
+        else:
+            logger.info("Writing HTML index: %s", index_path)
+            index_path.write_bytes(index_bytes)
+        self.precompress(index_path)
+
+    def precompress(self, path, is_changed=False):
+        """
+        Write compressed sidecars of the file for static web servers to serve as is.
+
+        Such as `*.gz` for nginx's `gzip_static` and `*.br` for `brotli_static`.  Unless
+        the caller knows the file has changed, skip sidecars whose modification time
+        already matches the file, since they're given the file's modification time when
+        written.  Remove sidecars for encodings no longer configured so that they're
+        never served stale.
+        """
+        path_stat = path.stat()
+        for encoding, suffix in utils.PRECOMPRESS_SUFFIXES.items():
+            sidecar_path = path.with_name(f"{path.name}{suffix}")
+            if encoding not in self.precompress_encodings:
+                with contextlib.suppress(FileNotFoundError):
+                    sidecar_path.unlink()
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                if (
+                    not is_changed
+                    and sidecar_path.stat().st_mtime_ns == path_stat.st_mtime_ns
+                ):
+                    continue
+            logger.debug("Writing %s sidecar: %r", encoding, str(sidecar_path))
+            tmp_path = sidecar_path.parent / self.truncate_path_parts(
+                pathlib.Path(f".{sidecar_path.name}~"),
+            )
+            try:
+                with path.open("rb") as source_opened, tmp_path.open(
+                    "wb",
+                ) as tmp_opened:
+                    for compressed in utils.iter_compressed(source_opened, encoding):
+                        tmp_opened.write(compressed)
+                os.utime(tmp_path, ns=(path_stat.st_atime_ns, path_stat.st_mtime_ns))
+                os.replace(tmp_path, sidecar_path)
+            except BaseException:  # pragma: no cover
+                with contextlib.suppress(FileNotFoundError):
+                    tmp_path.unlink()
+                raise
+
+    @staticmethod
+    def build_index_item(archive_feed):
+        """
+        Return the HTML index list item linking to one archived feed.
+
+        Also link to the feed of only the latest items next to the full archive if
+        there is one.
+        """
+        index_item = builder.LI(
+            builder.A(
+                archive_feed.config.get(
+                    "title",
+                    archive_feed.config.get(
+                        "name",
+                        str(archive_feed.path),
+                    ),
+                ),
+                href=str(archive_feed.path),
+            ),
         )
-        etree.ElementTree(html).write(self.root_path / "index.html", pretty_print=True)
-        return feeds_results
+        latest_path = archive_feed.get_latest_path()
+        if archive_feed.latest_items and latest_path.exists():
+            index_item[-1].tail = " ("
+            index_item.append(
+                builder.A(
+                    f"latest {archive_feed.latest_items} items",
+                    href=str(latest_path),
+                ),
+            )
+            index_item[-1].tail = ")"
+        return index_item
 
     def relink(self):
         """
         Re-link enclosures to the correct locations for the current configuration.
         """
-        return self.run_feeds_command("relink")
+        with self.profile_run("relink"):
+            return self.run_feeds_command("relink")
+
+    def daemon(self):
+        """
+        Keep updating each feed on its own interval until stopped.
+
+        Reuse the HTTP client connections and plugins between updates and reload the
+        configuration when the file changes.
+        """
+        self.run_daemon()
+
+    def run_daemon(self):
+        """
+        Schedule feed updates and reload the configuration until stopped.
+        """
+        daemon_start = time.perf_counter()
+        config_mtime = None
+        # The next time each feed is due for update and any feeds updating now with
+        # when they started
+        next_updates = {}
+        feed_futures = {}
+        logger.info("Starting daemon: %r", str(self.root_path))
+        try:
+            with futures.ThreadPoolExecutor(
+                max_workers=self.jobs,
+                thread_name_prefix="feed-archiver",
+            ) as executor:
+                while not self.daemon_stop.is_set():
+                    config_mtime = self.reload_config(config_mtime)
+                    now = time.monotonic()
+                    self.submit_due_feeds(executor, now, next_updates, feed_futures)
+                    # Wait until the next feed is due, at most the poll interval
+                    self.daemon_stop.wait(
+                        min(
+                            [self.DAEMON_POLL_INTERVAL]
+                            + [
+                                next_updates[archive_feed.url] - now
+                                for archive_feed in self.archive_feeds
+                                if archive_feed.url not in feed_futures
+                            ],
+                        ),
+                    )
+
+                    finished_urls = [
+                        feed_url
+                        for feed_url, (_, _, feed_future) in feed_futures.items()
+                        if feed_future.done()
+                    ]
+                    if not finished_urls:
+                        continue
+                    for feed_url in finished_urls:
+                        archive_feed, feed_start, _ = feed_futures.pop(feed_url)
+                        # Use the interval learned by the update, if adaptive
+                        next_updates[feed_url] = (
+                            feed_start + archive_feed.update_interval
+                        )
+                    self.update_index()
+                    if self.metrics_path is not None:
+                        self.write_metrics("daemon", time.perf_counter() - daemon_start)
+        except KeyboardInterrupt:  # pragma: no cover
+            logger.info("Stopping daemon after current feed updates finish")
+
+    def reload_config(self, config_mtime):
+        """
+        Load the configuration if the file changed and return the new modified time.
+
+        Problems with the changed configuration are logged and the feeds already loaded
+        continue to be updated.
+        """
+        new_config_mtime = self.config_path.stat().st_mtime_ns
+        if new_config_mtime == config_mtime:
+            return config_mtime
+        logger.info("Loading configuration: %r", str(self.config_path))
+        try:
+            self.load_config()
+        except Exception:  # pylint: disable=broad-except
+            if config_mtime is None:
+                raise
+            logger.exception(
+                "Problem reloading configuration, continuing: %r",
+                str(self.config_path),
+            )
+        return new_config_mtime
+
+    def submit_due_feeds(self, executor, now, next_updates, feed_futures):
+        """
+        Start updating the feeds that are due and not already updating.
+        """
+        for archive_feed in self.archive_feeds:
+            if archive_feed.url in feed_futures:
+                continue
+            if next_updates.get(archive_feed.url, now) > now:
+                continue
+            next_updates[archive_feed.url] = now + archive_feed.update_interval
+            feed_futures[archive_feed.url] = (
+                archive_feed,
+                now,
+                executor.submit(self.run_daemon_update, archive_feed),
+            )
+
+    def run_daemon_update(self, archive_feed):
+        """
+        Update one feed from the `daemon`, profiled as a run of its own if sampled.
+
+        The `daemon` never finishes so profiling it as one run would never write any
+        statistics.
+        """
+        # Don't use what the plugins kept from previous updates past their expiry
+        for enclosure_plugin in (
+            archive_feed.enclosure_plugins + archive_feed.enclosure_fallack_plugins
+        ):
+            enclosure_plugin.reset()
+        if not self.is_profiled():
+            return self.run_feed_command(archive_feed, "update")
+        profile_path = self.make_profile_path("update")
+        try:
+            with self.profile_feed(archive_feed, profile_path):
+                return self.run_feed_command(archive_feed, "update")
+        finally:
+            # The whole run is the one feed update
+            shutil.copyfile(
+                profile_path
+                / self.PROFILE_FEEDS_DIRNAME
+                / f"{utils.quote_basename(archive_feed.url)}.pstats",
+                profile_path / self.PROFILE_RUN_BASENAME,
+            )
+            logger.info("Wrote profile statistics: %s", profile_path)
+
+
+def format_metric_labels(**labels):
+    """
+    Format the labels of a metric sample in the Prometheus text format.
+    """
+    formatted_labels = ",".join(
+        f'{label_name}="{escape_metric_label(label_value)}"'
+        for label_name, label_value in labels.items()
+    )
+    return f"{{{formatted_labels}}}"
+
+
+def escape_metric_label(label_value):
+    """
+    Escape a metric label value for the Prometheus text format.
+    """
+    return (
+        str(label_value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
@@ -7,26 +7,73 @@ Plugins for linking feed item enclosures into media libraries.
 """
 
 import re
+import json
 import pprint
+import functools
+import threading
+import logging
 
 try:
     from importlib_metadata import entry_points  # type: ignore
 except ImportError:  # pragma: no cover
     from importlib.metadata import entry_points  # type: ignore
 
+logger = logging.getLogger(__name__)
 
-def load_plugins(parent, parent_config):
+# Plugin instances shared by all feeds with identical effective plugin configs
+PLUGINS: dict = {}
+PLUGINS_LOCK = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def get_entry_points():
+    """
+    Resolve the registered enclosure plugins once per process.
+    """
+    return entry_points(group="feedarchiver.enclosures")
+
+
+def replace_plugins(shared_plugins):
+    """
+    Share only the given plugin instances from now on, such as after reloading.
+
+    Discards the other shared plugin instances, such as to start from cold plugin
+    caches.
+    """
+    with PLUGINS_LOCK:
+        PLUGINS.clear()
+        PLUGINS.update(shared_plugins)
+
+
+def compile_template(template, name):
+    """
+    Compile a Python f-string template to a code object to evaluate for each enclosure.
+
+    Done once when loading the configuration so that the template isn't re-tokenized
+    and re-compiled for every enclosure of every item.
+    """
+    if not isinstance(template, str):  # pragma: no cover
+        raise ValueError(f"`{name}` for plugin must be a string: {template!r}")
+    try:
+        return compile(f"f{template!r}", f"<{name}>", "eval")
+    except SyntaxError as exc:
+        raise ValueError(f"Invalid `{name}` template for plugin: {template!r}") from exc
+
+
+def load_plugins(parent, parent_config, global_config, shared_plugins=None):
     """
     Pre-process and validate the enclosure plugin configurations.
+
+    Use the archive's shared plugins unless others are given, such as when the archive
+    is loading a changed configuration.
     """
-    archive = getattr(parent, "archive", parent)
-    defaults = archive.global_config.get("plugins", {}).get("enclosures", {})
+    defaults = global_config.get("plugins", {}).get("enclosures", {})
     configs = parent_config.get("enclosures", [])
     if not isinstance(configs, list):  # pragma: no cover
         raise ValueError(
             f"`enclosures` must be a list/array:\n{pprint.pformat(configs)}"
         )
-    entrypoints = entry_points(group="feedarchiver.enclosures")
+    entrypoints = get_entry_points()
     plugins = []
     fallack_plugins = []
     for config in configs:
@@ -43,19 +90,13 @@ def load_plugins(parent, parent_config):
                 "enclosure plugin config must define either both ``match-pattern`` and"
                 " ``match-string`` or neither",
             )
-        if "match-pattern" in config:
-            config["match-re"] = re.compile(config["match-pattern"])
-
-        # Load, instantiate, and configure the plugin
-        plugin_class = entrypoints[name].load()
         # Override global defaults for this plugin with values from this specific
         # instance
         config = dict(
             defaults.get(name, {}),
             **config,
         )
-        plugin = plugin_class(parent, config)
-        plugin.load_config()
+        plugin = get_plugin(parent, name, config, shared_plugins)
 
         if plugin.config.get("fallback", False):
             fallack_plugins.append(plugin)
@@ -65,6 +106,35 @@ def load_plugins(parent, parent_config):
     return plugins, fallack_plugins
 
 
+def get_plugin(parent, name, config, shared_plugins=None):
+    """
+    Return the shared plugin instance for the effective config, creating as needed.
+
+    Share plugin instances, and thus any of their caches or API clients, between all the
+    feeds in the process with identical plugin configs.  A shared plugin's `parent` is
+    the archive or feed that first loaded it.
+    """
+    if shared_plugins is None:
+        shared_plugins = PLUGINS
+    config_key = (name, json.dumps(config, sort_keys=True, default=repr))
+    with PLUGINS_LOCK:
+        if config_key in shared_plugins:
+            logger.debug("Re-using shared %r enclosure plugin", name)
+            return shared_plugins[config_key]
+        if "match-pattern" in config:
+            config["match-re"] = re.compile(config["match-pattern"])
+            config["match-code"] = compile_template(
+                config["match-string"],
+                "match-string",
+            )
+        # Load, instantiate, and configure the plugin
+        plugin_class = get_entry_points()[name].load()
+        plugin = plugin_class(parent, config)
+        plugin.load_config()
+        shared_plugins[config_key] = plugin
+        return plugin
+
+
 class EnclosurePlugin:
     """
     A plugin for linking feed item enclosures into media libraries.
@@ -85,6 +155,22 @@ class EnclosurePlugin:
             "Enclosure plugin subclasses must implement the `load_config` method"
         )
 
+    def prefetch(self, matches):
+        """
+        Optionally prepare to link the enclosures of all of a feed's new items at once.
+
+        Called with the `match-pattern` matches for the enclosures of all the new items
+        in a feed before linking any of them, such as to request data concurrently.
+        """
+
+    def reset(self):
+        """
+        Optionally discard anything kept from previous updates, such as cached data.
+
+        Called before each update of a feed by the `daemon` which otherwise keeps the
+        plugins for as long as the configuration is unchanged.
+        """
+
     def __call__(self, *args, **kwargs):  # pragma: no cover
         """
         Determine the paths that should be linked to the feed item enclosure.
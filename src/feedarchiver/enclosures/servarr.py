@@ -6,11 +6,17 @@
 Link enclosures about a TV series episode next to the video file as external audio.
 """
 
+import time
+import json
 import functools
 import pathlib
 import re
 import socket
+import sqlite3
+import contextlib
+import urllib.parse
 import logging
+from concurrent import futures
 
 try:
     from functools import cached_property  # type: ignore
@@ -32,10 +38,18 @@ class SonarrEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
     """
 
     MULTI_EPISODE_RE = re.compile("[Ee& -]")
+    # Persist Sonarr API responses between runs, keyed by request, under the archive
+    CACHE_BASENAME = ".feed-archiver-sonarr.sqlite"
+    # How many seconds cached responses are used before requesting them again
+    CACHE_TTL = 24 * 60 * 60
+    # How many Sonarr API requests to send at once when prefetching
+    PREFETCH_CONCURRENCY = 4
 
     url = "http://localhost:8989"
     client = None
     client_get = None
+    cache_ttl = CACHE_TTL
+    cache_path = None
 
     @tenacity.retry(
         retry=tenacity.retry_if_exception_type(
@@ -62,47 +76,187 @@ class SonarrEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
         api_key = self.config["api-key"]
         if not isinstance(api_key, str):  # pragma: no cover
             raise ValueError(f"Sonarr `api_key` must be a string: {api_key!r}")
+        self.cache_ttl = self.config.get("cache-ttl", self.cache_ttl)
+        if isinstance(self.cache_ttl, bool) or not isinstance(
+            self.cache_ttl,
+            (int, float),
+        ):  # pragma: no cover
+            raise ValueError(
+                f"Sonarr `cache-ttl` must be a number of seconds: {self.cache_ttl!r}"
+            )
+        archive = getattr(self.parent, "archive", self.parent)
+        self.cache_path = archive.root_path / self.CACHE_BASENAME
+        self.reset()
         self.client = arrapi.SonarrAPI(self.url, api_key)
         self.client_get = self.client._raw._get  # pylint: disable=protected-access
 
+    def reset(self):
+        """
+        Discard the responses requested by previous updates and anything derived.
+        """
+        # Responses requested during this run, never stale
+        self.responses = {}
+        self.__dict__.pop("series_by_title", None)
+        # The caches are shared by all instances, other instances request again
+        self.get_episode_files_seasons.cache_clear()
+        self.get_episode_paths.cache_clear()
+
+    def connect_cache(self):
+        """
+        Open the persistent cache of Sonarr API responses, creating it as needed.
+        """
+        connection = sqlite3.connect(str(self.cache_path), timeout=30)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(request TEXT PRIMARY KEY, expires REAL, response TEXT)",
+        )
+        return connection
+
+    def get_cached(self, path, refresh=False, **params):
+        """
+        Return the Sonarr API response from the cache or request and cache it.
+
+        If `refresh` is true, ignore cached responses from previous runs, such as when a
+        lookup in the cached response misses.  Responses requested during this run are
+        always used, until reset before the next `daemon` update.
+        """
+        request = f"{self.url}/{path}?{urllib.parse.urlencode(sorted(params.items()))}"
+        if request in self.responses:
+            return self.responses[request]
+        if not refresh and self.cache_ttl > 0 and self.cache_path.exists():
+            with contextlib.closing(self.connect_cache()) as connection:
+                row = connection.execute(
+                    "SELECT response FROM responses WHERE request = ? AND expires > ?",
+                    (request, time.time()),
+                ).fetchone()
+            if row is not None:
+                logger.debug("Using cached Sonarr response: %r", request)
+                return json.loads(row[0])
+
+        response = self.client_get(path, **params)
+        self.responses[request] = response
+        if self.cache_ttl > 0:
+            with contextlib.closing(self.connect_cache()) as connection, connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?)",
+                    (request, time.time() + self.cache_ttl, json.dumps(response)),
+                )
+        return response
+
+    def get_series_by_title(self, refresh=False):
+        """
+        Request or lookup in the cache and collate the full list of series titles.
+        """
+        return {
+            series["title"]: series["id"]
+            for series in self.get_cached("series", refresh=refresh)
+        }
+
     @cached_property
     def series_by_title(self):
         """
         Request, collate and cache the full list of series titles to share across calls.
         """
-        return {series["title"]: series["id"] for series in self.client_get("series")}
+        return self.get_series_by_title()
 
-    # NOTE: These functions will cache globally, for the life of the process.  This
-    # should be fine as `$ feedarchiver update` is expected to be run periodically, such
-    # as by `# cron`.
+    # NOTE: These functions cache globally until reset, such as before each update by
+    # the `$ feedarchiver daemon`.
     @functools.lru_cache(maxsize=None)  # pylint: disable=method-cache-max-size-none
-    def get_episode_files_seasons(self, series_id):
+    def get_episode_files_seasons(self, series_id, refresh=False):
         """
         Request, correlate and cache episode file DB ids to season and episode numbers.
         """
         episode_files_episodes = {}
-        for episode in self.client_get("episode", seriesId=series_id):
+        for episode in self.get_cached("episode", refresh=refresh, seriesId=series_id):
             episode_files_episodes.setdefault(episode["episodeFileId"], []).append(
                 (episode["seasonNumber"], episode["episodeNumber"])
             )
         return episode_files_episodes
 
     @functools.lru_cache(maxsize=None)  # pylint: disable=method-cache-max-size-none
-    def get_episode_paths(self, series_id):
+    def get_episode_paths(self, series_id, refresh=False):
         """
         Request, collate and cache series episode file paths by season and episode.
         """
-        episode_files_episodes = self.get_episode_files_seasons(series_id)
+        episode_files_episodes = self.get_episode_files_seasons(series_id, refresh)
         episode_paths = {}
-        for episode_file in self.client_get("episodeFile", seriesId=series_id):
-            for season_number, episode_number in episode_files_episodes[
-                episode_file["id"]
-            ]:
-                episode_paths.setdefault(season_number, {})[
-                    episode_number
-                ] = episode_file["path"]
+        for episode_file in self.get_cached(
+            "episodeFile",
+            refresh=refresh,
+            seriesId=series_id,
+        ):
+            # Cached responses may have expired at different times
+            for season_number, episode_number in episode_files_episodes.get(
+                episode_file["id"],
+                [],
+            ):
+                episode_paths.setdefault(season_number, {})[episode_number] = (
+                    episode_file["path"]
+                )
         return episode_paths
 
+    def prefetch(self, matches):
+        """
+        Request the episodes and episode files of all matched series at once.
+
+        Then also request the series of any episodes that are missing so that linking
+        doesn't have to.  All requests share the API client's pooled HTTP session.
+        """
+        series_episodes = {}
+        for match in matches:
+            try:
+                series_id, season_number, episode_numbers, _ = self.validate_params(
+                    match,
+                )
+            except ValueError:  # pragma: no cover
+                # Reported when linking the enclosure
+                continue
+            series_episodes.setdefault(series_id, set()).update(
+                (season_number, episode_number) for episode_number in episode_numbers
+            )
+        with futures.ThreadPoolExecutor(
+            max_workers=self.PREFETCH_CONCURRENCY,
+            thread_name_prefix="feed-archiver-sonarr",
+        ) as executor:
+            self.prefetch_requests(
+                executor,
+                [
+                    (path, {"seriesId": series_id})
+                    for series_id in series_episodes
+                    for path in ("episode", "episodeFile")
+                ],
+            )
+            missing_series_ids = [
+                series_id
+                for series_id, episodes in series_episodes.items()
+                if any(
+                    episode_number
+                    not in self.get_episode_paths(series_id).get(season_number, {})
+                    for season_number, episode_number in episodes
+                )
+            ]
+            # Refresh responses cached by previous runs and request the series to
+            # simulate the paths of episodes that are still missing.
+            self.prefetch_requests(
+                executor,
+                [
+                    (path, {"seriesId": series_id, "refresh": True})
+                    for series_id in missing_series_ids
+                    for path in ("episode", "episodeFile")
+                ]
+                + [(f"series/{series_id}", {}) for series_id in missing_series_ids],
+            )
+
+    def prefetch_requests(self, executor, requests):
+        """
+        Request or lookup in the cache all the given Sonarr API paths at once.
+        """
+        for response_future in [
+            executor.submit(self.get_cached, path, **params)
+            for path, params in requests
+        ]:
+            response_future.result()
+
     def __call__(self, enclosure_path, match, *args, **kwargs):
         """
         Lookup the episode and link the enclosure next to the video file.
@@ -113,6 +267,12 @@ class SonarrEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
 
         # Combine all the parameters to lookup the episode file
         episode_paths = self.get_episode_paths(series_id)
+        if season_number not in episode_paths or any(
+            episode_number not in episode_paths[season_number]
+            for episode_number in episode_numbers
+        ):
+            # The episode may be missing from a response cached by a previous run
+            episode_paths = self.get_episode_paths(series_id, refresh=True)
         if season_number not in episode_paths:  # pragma: no cover
             logger.error(
                 "Sonarr `season_number` not in series %s episodes: S%s",
@@ -135,7 +295,7 @@ class SonarrEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
                         episode_number,
                     )
                 # Simulate the episode path
-                series = self.client_get(f"series/{series_id}")
+                series = self.get_cached(f"series/{series_id}")
                 episode_path = pathlib.Path(
                     series["path"],
                     f"Season {season_number:02d}",
@@ -195,6 +355,9 @@ class SonarrEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
         series_id = params.get("series_id")
         if not series_id:  # pragma: no cover
             series_title = params.get("series_title")
+            if series_title not in self.series_by_title:
+                # The series may be missing from a response cached by a previous run
+                self.series_by_title = self.get_series_by_title(refresh=True)
             if series_title not in self.series_by_title:  # pragma: no cover
                 raise ValueError(
                     f"Sonarr `series_title` not in library: {series_title!r}",
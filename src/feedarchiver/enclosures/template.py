@@ -31,10 +31,7 @@ class TemplateEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
         Pre-process and validate the plugin config prior to linking each enclosure.
         """
         self.template = self.config.get("template", self.template)
-        if not isinstance(self.template, str):  # pragma: no cover
-            raise ValueError(
-                f"Format `template` for plugin must be a string: {self.template!r}"
-            )
+        self.template_code = enclosures.compile_template(self.template, "template")
 
     def __call__(
         self,
@@ -53,8 +50,8 @@ class TemplateEnclosurePlugin(enclosures.EnclosurePlugin):  # noqa: V102
         # https://python-forum.io/thread-24481.html
         return [
             eval(  # nosec: B307, pylint: disable=eval-used
-                f"f{self.template!r}",
+                self.template_code,
                 globals(),
-                dict(locals(), **kwargs),
+                dict(kwargs, self=self, args=args, kwargs=kwargs),
             )
         ]
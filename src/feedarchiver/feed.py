@@ -7,13 +7,24 @@ An RSS/Atom syndication feed in an archive.
 """
 
 import os
+import time
+import statistics
 import copy
 import re
+import json
+import collections
+import threading
 import urllib
 import email.utils
 import pathlib
 import logging
+import functools
+import contextlib
+import cProfile
+import asyncio
+import queue
 import pdb
+from concurrent import futures
 
 from lxml import etree  # nosec B410
 
@@ -32,14 +43,52 @@ class ArchiveFeed:
 
     URL_SCHEME_RE = re.compile(r"^(?P<scheme>[a-zA-Z][a-zA-Z0-9+.-]*):$")
     NAMESPACE = "https://github.com/rpatterson/feed-archiver"
+    # How many of a feed item's enclosures and assets to download at once by default
+    DOWNLOAD_CONCURRENCY = 4
+    # The `async` engine writes downloads to files in the executor in chunks this large
+    ASYNC_WRITE_BYTES = 1024 * 1024
+    # The `async` engine queues the remote feed for parsing in chunks this large
+    ASYNC_PARSE_BYTES = 64 * 1024
+    # Only write the archived feed once per update by default, see `checkpoint-items`
+    CHECKPOINT_ITEMS = 0
+    # Merge new items into archived feeds this large as they're parsed, in bytes
+    STREAM_ARCHIVE_BYTES = 32 * 1024 * 1024
+    # Marks where new items are merged into the archived feed when serializing
+    MERGE_PLACEHOLDER = "feed-archiver-merge-items"
+    # Keep all items in the one archived feed document by default, see `page-items`
+    PAGE_ITEMS = 0
+    # Archive page documents are named after the feed with this and the page number
+    PAGE_INFIX = "-page-"
+    # Don't write a feed of only the latest items by default, see `latest-items`
+    LATEST_ITEMS = 0
+    # The feed of the latest items is named after the feed with this
+    LATEST_INFIX = "-latest"
+    # How many seconds between updates of the feed by the `daemon` sub-command
+    UPDATE_INTERVAL = 60 * 60
+    # Learn how often a feed publishes from the dates of this many of the latest items
+    CADENCE_ITEMS = 10
+    # How many times to update a feed for each item it's expected to publish
+    UPDATES_PER_ITEM = 2
+    # Persist state between updates, such as response headers, next to the feed
+    STATE_SUFFIX = ".feed-archiver.json"
+    # Response headers used to make conditional requests on the next update
+    VALIDATOR_HEADERS = {
+        "ETag": "If-None-Match",
+        "Last-Modified": "If-Modified-Since",
+    }
 
     # Initialized when the configuration is loaded prior to update
     url = None
+    download_concurrency = DOWNLOAD_CONCURRENCY
+    update_interval = min_update_interval = max_update_interval = UPDATE_INTERVAL
     enclosure_plugins = None
     enclosure_fallack_plugins = None
     # Initialized on update from the response to the request for the URL from the feed
     # config in order to use response headers to derrive the best path.
     path = None
+    # The profiler of the feed's current sub-command when profiling, see
+    # `Archive.profile_feed()`
+    profiler = None
 
     def __init__(self, archive, config):
         """
@@ -51,57 +100,324 @@ class ArchiveFeed:
 
         self.archive = archive
         self.config = config
+        # Archive paths of URLs already downloaded, relative to the archive root
+        self.download_paths = {}
+        # The richly parsed items being linked by enclosure plugins by item ID
+        self.items_parsed = {}
+        # What's been learned about how often the feed publishes new items
+        self.schedule = {}
+        # The documents written since their sidecars were last written
+        self.written_paths = set()
+        # Profilers of the worker threads the current sub-command used by thread
+        self.worker_profilers = {}
+        # Measurements of this run for the archive metrics, see `count_metric()`
+        self.metrics = collections.Counter()
+        self.metrics_lock = threading.Lock()
 
-    def load_config(self):
+    def load_config(
+        self,
+        global_config=None,
+        archive_plugins=None,
+        shared_plugins=None,
+    ):
         """
         Pre-process and validate the feed config prior to running the actual update.
+
+        Use the archive's global config and plugins unless others are given, such as
+        when the archive is loading a changed configuration.
         """
+        if global_config is None:
+            global_config = self.archive.global_config
+        if archive_plugins is None:
+            archive_plugins = (
+                self.archive.enclosure_plugins,
+                self.archive.enclosure_fallack_plugins,
+            )
         self.url = self.config["remote-url"]
-        self.enclosure_plugins = self.archive.enclosure_plugins[:]
-        self.enclosure_fallack_plugins = self.archive.enclosure_fallack_plugins[:]
+        self.download_concurrency = self.config.get(
+            "download-concurrency",
+            global_config.get(
+                "download-concurrency",
+                self.DOWNLOAD_CONCURRENCY,
+            ),
+        )
+        if (
+            not isinstance(self.download_concurrency, int)
+            or self.download_concurrency < 1
+        ):
+            raise ValueError(
+                "`download-concurrency` must be a positive integer: "
+                f"{self.download_concurrency!r}"
+            )
+        self.checkpoint_items = self.config.get(
+            "checkpoint-items",
+            global_config.get(
+                "checkpoint-items",
+                self.CHECKPOINT_ITEMS,
+            ),
+        )
+        if (
+            not isinstance(self.checkpoint_items, int) or self.checkpoint_items < 0
+        ):  # pragma: no cover
+            raise ValueError(
+                "`checkpoint-items` must be a non-negative integer: "
+                f"{self.checkpoint_items!r}"
+            )
+        self.page_items = self.config.get(
+            "page-items",
+            global_config.get("page-items", self.PAGE_ITEMS),
+        )
+        if (
+            not isinstance(self.page_items, int) or self.page_items < 0
+        ):  # pragma: no cover
+            raise ValueError(
+                f"`page-items` must be a non-negative integer: {self.page_items!r}"
+            )
+        self.latest_items = self.config.get(
+            "latest-items",
+            global_config.get("latest-items", self.LATEST_ITEMS),
+        )
+        if (
+            not isinstance(self.latest_items, int) or self.latest_items < 0
+        ):  # pragma: no cover
+            raise ValueError(
+                f"`latest-items` must be a non-negative integer: {self.latest_items!r}"
+            )
+        self.stream_archive_bytes = self.config.get(
+            "stream-archive-bytes",
+            global_config.get(
+                "stream-archive-bytes",
+                self.STREAM_ARCHIVE_BYTES,
+            ),
+        )
+        if (
+            not isinstance(self.stream_archive_bytes, int)
+            or self.stream_archive_bytes < 0
+        ):  # pragma: no cover
+            raise ValueError(
+                "`stream-archive-bytes` must be a non-negative integer: "
+                f"{self.stream_archive_bytes!r}"
+            )
+        self.update_interval = self.load_interval_config(
+            global_config,
+            "update-interval",
+            self.UPDATE_INTERVAL,
+        )
+        self.min_update_interval = self.load_interval_config(
+            global_config,
+            "min-update-interval",
+            self.update_interval,
+        )
+        self.max_update_interval = self.load_interval_config(
+            global_config,
+            "max-update-interval",
+            self.update_interval,
+        )
+        if self.min_update_interval > self.max_update_interval:
+            raise ValueError(
+                "`min-update-interval` must not be greater than `max-update-interval`: "
+                f"{self.min_update_interval!r} > {self.max_update_interval!r}"
+            )
+        if self.is_adaptive:
+            # Resume the interval learned before the daemon was restarted
+            self.schedule = self.load_state().get("schedule", {})
+            self.update_interval = self.clamp_update_interval(
+                self.schedule.get("interval", self.update_interval),
+            )
+        self.enclosure_plugins = archive_plugins[0][:]
+        self.enclosure_fallack_plugins = archive_plugins[1][:]
         enclosure_plugins, enclosure_fallack_plugins = enclosures.load_plugins(
             self,
             self.config,
+            global_config,
+            shared_plugins,
         )
         self.enclosure_plugins.extend(enclosure_plugins)
         self.enclosure_fallack_plugins.extend(enclosure_fallack_plugins)
 
+    def resume(self, previous_feed):
+        """
+        Continue from the same feed loaded from the previous configuration.
+
+        Keep the archive path, the metrics and the learned schedule of the feed so that
+        reloading the configuration doesn't drop it from the index or the metrics.
+        """
+        self.path = previous_feed.path
+        self.metrics = previous_feed.metrics
+        self.metrics_lock = previous_feed.metrics_lock
+        if self.is_adaptive and previous_feed.schedule:
+            self.schedule = previous_feed.schedule
+            self.update_interval = self.clamp_update_interval(
+                self.schedule.get("interval", self.update_interval),
+            )
+
+    def load_interval_config(self, global_config, key, default):
+        """
+        Return the positive number of seconds from the feed config or the defaults.
+        """
+        interval = self.config.get(
+            key,
+            global_config.get(key, default),
+        )
+        if (
+            isinstance(interval, bool)
+            or not isinstance(interval, (int, float))
+            or interval <= 0
+        ):
+            raise ValueError(
+                f"`{key}` must be a positive number of seconds: {interval!r}",
+            )
+        return interval
+
+    @property
+    def is_adaptive(self):
+        """
+        Return true if the update interval of this feed is learned between bounds.
+        """
+        return self.min_update_interval < self.max_update_interval
+
     # Sub-commands
 
     # TODO: Refactor to reduce complexity and improve readability and testibility
-    def update(  # noqa: MC0001
+    def update(self):
+        """
+        Request the URL of one feed in the archive and update contents accordingly.
+
+        Download the URLs that each step of `iter_update()` yields in between steps.
+        """
+        state = self.load_state()
+        remote_response, remote_tree = self.request_remote_tree(
+            self.get_conditional_headers(state),
+        )
+        update_steps = self.iter_update(state, remote_response, remote_tree)
+        download_results = None
+        while True:
+            is_done, step_value = send_update_step(update_steps, download_results)
+            if is_done:
+                return step_value
+            download_results = self.download_urls_concurrently(step_value)
+
+    async def update_async(self, executor):
+        """
+        Update the feed sending all requests from the engine event loop.
+
+        Run each step of `iter_update()`, the XML processing and filesystem work, in the
+        executor's worker threads and download the URLs each step yields from the event
+        loop in between steps.
+        """
+        loop = asyncio.get_running_loop()
+        state = await loop.run_in_executor(
+            executor,
+            self.run_worker_profiled,
+            self.load_state,
+        )
+        remote_response, remote_tree = await self.request_remote_tree_async(
+            executor,
+            self.get_conditional_headers(state),
+        )
+        update_steps = self.iter_update(state, remote_response, remote_tree)
+        download_results = None
+        while True:
+            is_done, step_value = await loop.run_in_executor(
+                executor,
+                self.archive.run_profiled,
+                self.profiler,
+                send_update_step,
+                update_steps,
+                download_results,
+            )
+            if is_done:
+                return step_value
+            download_results = await self.download_urls_async(step_value)
+
+    def iter_update(  # noqa: MC0001
         self,
+        state,
+        remote_response,
+        remote_tree,
     ):  # pylint: disable=too-many-locals,too-many-statements,too-many-branches
         """
-        Request the URL of one feed in the archive and update contents accordingly.
+        Update the archived feed from the remote feed response, a step at a time.
+
+        Yield the unique URLs to download at each step and expect the download paths or
+        exceptions by URL to be sent back in so that the engines can send the requests
+        however they do, such as from the `async` engine's event loop.  Download the
+        URLs of all new items at once, or of each `checkpoint-items` items, and return
+        the results of the update.
         """
-        logger.debug("Requesting feed: %r", self.url)
-        remote_response = self.archive.client.get(self.url)
+        self.download_paths = dict(state.get("downloads", {}))
+        # Never use the richly parsed items of a previous update
+        self.items_parsed = {}
+        if remote_tree is None:
+            # The feed hasn't changed since the last update, nothing to do
+            logger.info("Feed unchanged since last update: %r", self.url)
+            self.update_not_modified(state)
+            return None
         # Maybe update the extension based on the headers
         self.path = self.archive.root_path / self.archive.response_to_path(
             remote_response,
         )
-        remote_tree = self.load_remote_tree(remote_response)
+        archive_mtime_ns = self.path.stat().st_mtime_ns if self.path.exists() else None
         remote_root = remote_tree.getroot()
         remote_format = formats.FeedFormat.from_tree(self, remote_tree)
+        remote_item_elems = list(remote_format.iter_items(remote_root))
+
+        # Avoid parsing the archived feed if the index shows all items are archived
+        archived_item_ids = self.load_item_ids(state)
+        if archived_item_ids is not None and all(
+            remote_format.get_item_id(remote_item_elem) in archived_item_ids
+            for remote_item_elem in remote_item_elems
+        ):
+            logger.info("No new items in feed: %r", self.url)
+            if self.is_documents_stale(state):
+                self.write_archive_documents()
+            self.update_archive_metadata(remote_response, archive_mtime_ns)
+            self.precompress_archive()
+            self.learn_update_interval(0)
+            self.save_state(remote_response, archived_item_ids)
+            return None
 
         # Assemble the archive version of the feed XML
         download_paths = {}
-        archive_tree = self.get_archive_tree(
-            remote_tree,
-            download_paths,
-            remote_format=remote_format,
-        )
-        archive_root = archive_tree.getroot()
-        archived_items_parent = remote_format.get_items_parent(archive_root)
-
-        remote_item_elems = list(remote_format.iter_items(remote_root))
-        archive_item_elems = list(remote_format.iter_items(archive_root))
-        if (len(remote_item_elems) - len(archive_item_elems)) > 4:
+        # New items to merge into the archived feed if it's too large to load whole
+        merge_item_elems = []
+        is_streamed = self.is_archive_streamed()
+        if is_streamed and archived_item_ids is None:
+            # Missing or stale index, rebuild it from the archived feed
+            archived_item_ids = self.load_archive_item_ids(remote_format)
+            is_streamed = archived_item_ids is not None
+        if is_streamed:
+            logger.debug("Streaming archive XML: %r", self.url)
+            archive_tree = None
+            # Enclosure plugins get the feed-level elements without the archived items
+            archived_items_parent = utils.copy_empty_items_parent(
+                remote_format,
+                remote_format.get_items_parent(remote_root),
+            )
+        else:
+            archive_tree = yield from self.iter_archive_tree(
+                remote_tree,
+                download_paths,
+                remote_format=remote_format,
+            )
+            archive_root = archive_tree.getroot()
+            archived_items_parent = remote_format.get_items_parent(archive_root)
+            if archived_item_ids is None:
+                # Missing or stale index, rebuild it from the archived feed and pages
+                archived_item_ids = {
+                    remote_format.get_item_id(archive_item_elem)
+                    for archive_item_elem in remote_format.iter_items(archive_root)
+                }
+                for page_path in self.list_page_paths():
+                    archived_item_ids.update(
+                        self.load_archive_item_ids(remote_format, page_path) or (),
+                    )
+            self.update_self(remote_format, archive_root)
+        if (len(remote_item_elems) - len(archived_item_ids)) > 4:
             logger.warning(
                 "Many more items in remote than archive: %s > %s",
                 len(remote_item_elems),
-                len(archive_item_elems),
+                len(archived_item_ids),
             )
 
         logger.info(
@@ -109,62 +425,69 @@ class ArchiveFeed:
             self.url,
             str(self.path),
         )
-        self.update_self(remote_format, archive_root)
-        # Iterate through the remote feed to make updates to the archived feed as
+        new_item_elems = [
+            remote_item_elem
+            for remote_item_elem in remote_item_elems
+            if remote_format.get_item_id(remote_item_elem) not in archived_item_ids
+        ]
+        published = []
+        if new_item_elems and self.is_adaptive:
+            # Read the dates of the new items before they're moved into the archived
+            # feed below
+            published = utils.parse_published_timestamps(
+                remote_format,
+                remote_format.get_items_parent(remote_root),
+                new_item_elems,
+            )
+        # Iterate through the new items to make updates to the archived feed as
         # appropriate.
-        archived_item_ids = set()
         updated_items = {}
+        is_complete = True
+        # How many items have been added since the archived feed was last written
+        unwritten_items = 0
+        is_written = False
         # What is the lowest child index for the first item, used to insert new items at
         # the top
-        first_item_idx = 0
-        for first_item_idx, item_sibling in enumerate(
-            archived_items_parent.iterchildren(),
-        ):
-            if not isinstance(item_sibling.tag, str):
-                # Ignore comments or other unusual XML detritus/artifacts
-                # `ValueError: Invalid tag name '<cyfunction Comment at 0x...>'`
-                continue
-            item_sibling_tag = etree.QName(item_sibling.tag).localname
-            if item_sibling_tag.lower() == remote_format.ITEM_TAG:
-                break
-        else:
-            first_item_idx += 1
+        first_item_idx = self.get_first_item_idx(remote_format, archived_items_parent)
         # Ensure that the order of new feed items is preserved
-        remote_item_elems.reverse()
-        for remote_item_elem in remote_item_elems:
-            logger.debug(
-                "Processing remote feed item:\n%s",
-                etree.tostring(remote_item_elem).decode(),
+        new_item_elems.reverse()
+        # Download the URLs of as many items at once as are written at once
+        chunk_items = self.checkpoint_items or len(new_item_elems) or 1
+        for chunk_start in range(0, len(new_item_elems), chunk_items):
+            chunk_item_elems = new_item_elems[chunk_start : chunk_start + chunk_items]
+            chunk_item_urls = [
+                self.list_item_urls(remote_format, remote_item_elem)
+                for remote_item_elem in chunk_item_elems
+            ]
+            download_results = yield self.get_unique_urls(
+                url_result
+                for item_asset_urls, item_enclosure_urls in chunk_item_urls
+                for url_result in item_asset_urls + item_enclosure_urls
             )
-            if utils.PYTHONTRACEMALLOC:  # pragma: no cover
-                # Optionally compare memory consumption
-                self.tracemalloc_snapshot = utils.compare_memory_snapshots(self)
-
-            remote_item_id = remote_format.get_item_id(remote_item_elem)
-            if remote_item_id in archived_item_ids:
-                # This item was already seen in the archived feed, we don't need to
-                # update the archive or search further in the archived feed.
+            # Re-write the URLs of all the items before richly parsing any of them
+            downloaded_items = []
+            for remote_item_elem, (item_asset_urls, item_enclosure_urls) in zip(
+                chunk_item_elems,
+                chunk_item_urls,
+            ):
                 logger.debug(
-                    "Skipping remote feed item already in archived feed: %r",
-                    remote_item_id,
+                    "Processing remote feed item:\n%s",
+                    etree.tostring(remote_item_elem).decode(),
                 )
-                continue
-            for archived_item_elem in archive_item_elems:
-                archived_item_ids.add(remote_format.get_item_id(archived_item_elem))
-                if remote_item_id in archived_item_ids:
-                    # Found this item in the archived feed, we don't need to update the
-                    # archive and we can stop searching the archived feed for now.
-                    # Optimization for the common case where a feed only contains the
-                    # most recent items ATM but accrues a lot of items in the archive
-                    # over time.
+                if utils.PYTHONTRACEMALLOC:  # pragma: no cover
+                    # Optionally compare memory consumption
+                    self.tracemalloc_snapshot = utils.compare_memory_snapshots(self)
+
+                remote_item_id = remote_format.get_item_id(remote_item_elem)
+                if remote_item_id in archived_item_ids:  # pragma: no cover
+                    # A duplicate of an item added above, no need to add it again
                     logger.debug(
                         "Skipping remote feed item already in archived feed: %r",
                         remote_item_id,
                     )
-                    break
-            else:
-                # The remote item ID was not found in the archived feed, update the feed
-                # by adding this remote item.
+                    continue
+                # The remote item ID was not found in the archived feed, update the
+                # feed by adding this remote item.
                 logger.info(
                     "Adding feed item to archive: %r -> %r",
                     remote_item_id,
@@ -172,11 +495,13 @@ class ArchiveFeed:
                 )
 
                 item_download_paths = self.download_item_enclosures(
-                    remote_format,
-                    remote_item_elem,
                     remote_item_id,
+                    item_asset_urls,
+                    item_enclosure_urls,
+                    download_results,
                 )
                 if item_download_paths is None:
+                    is_complete = False
                     continue
                 (
                     item_asset_paths,
@@ -185,7 +510,20 @@ class ArchiveFeed:
                 download_paths.update(item_asset_paths)
                 download_paths.update(item_enclosure_paths)
                 updated_items[remote_item_id] = remote_item_elem
+                archived_item_ids.add(remote_item_id)
+                self.count_metric("new_items")
+                downloaded_items.append((remote_item_elem, item_enclosure_paths))
 
+            # Enclosure plugins get the items with the URLs of their archive downloads
+            self.parse_items(
+                remote_format,
+                archived_items_parent,
+                [remote_item_elem for remote_item_elem, _ in downloaded_items],
+            )
+            self.prefetch_plugins(
+                remote_format, archived_items_parent, downloaded_items
+            )
+            for remote_item_elem, item_enclosure_paths in downloaded_items:
                 self.link_item_enclosures(
                     remote_format=remote_format,
                     feed_elem=archived_items_parent,
@@ -193,13 +531,36 @@ class ArchiveFeed:
                     item_enclosure_paths=item_enclosure_paths,
                 )
 
-                archived_items_parent.insert(first_item_idx, remote_item_elem)
-                # Pretty format the feed for readability
-                etree.indent(archive_tree)
-                # Update the archived feed file
-                archive_tree.write(str(self.path))
+                if archive_tree is None:
+                    merge_item_elems.append(remote_item_elem)
+                else:
+                    archived_items_parent.insert(first_item_idx, remote_item_elem)
+                unwritten_items += 1
+                if self.checkpoint_items and unwritten_items >= self.checkpoint_items:
+                    # Optionally limit how many items are lost if interrupted
+                    self.write_archive_items(
+                        remote_format,
+                        archive_tree,
+                        merge_item_elems,
+                    )
+                    unwritten_items = 0
+                    is_written = True
+                    # Paging may have added feed-level elements before the first item
+                    first_item_idx = self.get_first_item_idx(
+                        remote_format,
+                        archived_items_parent,
+                    )
 
-        update_download_metadata(remote_response, self.path)
+        if unwritten_items:
+            # Update the archived feed file once for all the added items
+            self.write_archive_items(remote_format, archive_tree, merge_item_elems)
+        elif not is_written and self.is_documents_stale(state):
+            self.write_archive_documents(remote_format, archive_tree)
+        self.update_archive_metadata(remote_response, archive_mtime_ns)
+        self.precompress_archive()
+        self.learn_update_interval(len(updated_items), published)
+        # Only skip the next update if the feed is unchanged and nothing needs a retry
+        self.save_state(remote_response if is_complete else None, archived_item_ids)
 
         if updated_items or download_paths:
             return list(updated_items.keys()), {
@@ -209,15 +570,77 @@ class ArchiveFeed:
             }
         return None
 
+    def update_not_modified(self, state):
+        """
+        Update what's derived from the archived feed when the remote feed is unchanged.
+        """
+        self.path = self.archive.root_path / state["path"]
+        is_state_modified = False
+        if self.is_documents_stale(state):
+            item_ids = self.load_item_ids(state)
+            self.write_archive_documents()
+            self.precompress_archive()
+            state["documents"] = self.get_documents_config()
+            if item_ids is not None:
+                # Paging may have re-written the archived feed
+                self.index_items(state, item_ids)
+            is_state_modified = True
+        if self.is_adaptive:
+            self.learn_update_interval(0)
+            state["schedule"] = self.schedule
+            is_state_modified = True
+        if is_state_modified:
+            self.write_state(state)
+
     # TODO: Refactor to reduce complexity and improve readability and testibility
-    def relink(self):  # noqa: MC0001
+    def relink(self):
         """
         Re-link enclosures to the correct locations for this feed.
         """
-        # Parse this feed's archive XML
         self.path = self.find_archive_path()
-        archive_tree = self.load_archive_tree()
+        linked_enclosures = {}
+        for archive_path in [self.path] + self.list_page_paths():
+            linked_enclosures.update(self.relink_archive_tree(archive_path))
+        # The latest items are copies of the re-linked items
+        self.write_archive_documents()
+        self.precompress_archive()
+        if linked_enclosures:
+            return linked_enclosures
+        return None
+
+    # Other methods
+
+    def relink_archive_tree(self, archive_path):  # noqa: MC0001
+        """
+        Re-link enclosures for the items in one archived feed or page document.
+        """
+        # Parse this feed's archive XML
+        archive_tree = self.load_archive_tree(archive_path)
         archive_format = formats.FeedFormat.from_tree(self, archive_tree)
+        archive_items_parent = archive_format.get_items_parent(archive_tree.getroot())
+        archive_items = [
+            (
+                archive_item_elem,
+                {
+                    url_result: pathlib.Path(
+                        urllib.parse.unquote(
+                            urllib.parse.urlsplit(url_result).path.lstrip("/"),
+                        ),
+                    )
+                    for url_result in formats.all_xpaths_results(
+                        archive_item_elem,
+                        archive_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS,
+                    )
+                },
+            )
+            for archive_item_elem in archive_format.iter_items(archive_tree.getroot())
+        ]
+        self.parse_items(
+            archive_format,
+            archive_items_parent,
+            [archive_item_elem for archive_item_elem, _ in archive_items],
+        )
+        self.prefetch_plugins(archive_format, archive_items_parent, archive_items)
         attr_prefixes = [
             f"{{{self.NAMESPACE}}}enclosure-link-",
             # BBB: old format compatibility
@@ -227,8 +650,7 @@ class ArchiveFeed:
         # Update the links for each item in this feed
         is_modified = False
         linked_enclosures = {}
-        for archive_item_elem in archive_format.iter_items(archive_tree.getroot()):
-            item_enclosure_paths = {}
+        for archive_item_elem, item_enclosure_paths in archive_items:
             for url_result in formats.all_xpaths_results(
                 archive_item_elem,
                 archive_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS,
@@ -249,11 +671,6 @@ class ArchiveFeed:
                         enclosure_path.unlink()
                     del url_result.getparent().attrib[attr]
                     is_modified = True
-                item_enclosure_paths[url_result] = pathlib.Path(
-                    urllib.parse.unquote(
-                        urllib.parse.urlsplit(url_result).path.lstrip("/"),
-                    ),
-                )
             item_enclosures = self.link_item_enclosures(
                 remote_format=archive_format,
                 feed_elem=archive_format.get_items_parent(archive_tree.getroot()),
@@ -262,11 +679,6 @@ class ArchiveFeed:
             )
             if item_enclosures:
                 is_modified = True
-            if is_modified:  # pragma: no cover
-                # Pretty format the feed for readability
-                etree.indent(archive_tree)
-                # Update the archived feed file
-                archive_tree.write(str(self.path))
             linked_enclosures.update(
                 (
                     url_result,
@@ -275,31 +687,41 @@ class ArchiveFeed:
                 )
                 for url_result, enclosure_paths in item_enclosures.items()
             )
-        if linked_enclosures:
-            return linked_enclosures
-        return None
+        if is_modified:
+            # Update the archived feed file once for all the re-linked items
+            self.write_archive_tree(archive_tree, archive_path)
+        return linked_enclosures
 
-    # Other methods
-
-    def download_item_enclosures(self, remote_format, remote_item_elem, remote_item_id):
+    @staticmethod
+    def list_item_urls(remote_format, remote_item_elem):
         """
-        Download all the enclosures from a feed item.
+        Return the URLs of a feed item's assets and of its enclosures to download.
         """
-        item_asset_urls = formats.all_xpaths_results(
-            remote_item_elem,
-            remote_format.DOWNLOAD_ITEM_ASSET_URLS_XPATHS,
-        )
-        item_enclosure_urls = formats.all_xpaths_results(
-            remote_item_elem,
-            remote_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS,
+        return (
+            formats.all_xpaths_results(
+                remote_item_elem,
+                remote_format.DOWNLOAD_ITEM_ASSET_URLS_XPATHS,
+            ),
+            formats.all_xpaths_results(
+                remote_item_elem,
+                remote_format.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS,
+            ),
         )
+
+    def download_item_enclosures(
+        self,
+        remote_item_id,
+        item_asset_urls,
+        item_enclosure_urls,
+        download_results,
+    ):
+        """
+        Update a feed item's URLs from the downloads of its enclosures and assets.
+        """
         try:
-            # Download enclosures and assets only for this item.
-            item_asset_paths = self.download_urls(
-                item_asset_urls,
-            )
-            item_enclosure_paths = self.download_urls(
-                item_enclosure_urls,
+            item_download_paths = self.update_downloaded_urls(
+                item_asset_urls + item_enclosure_urls,
+                download_results,
             )
         except Exception:  # pylint: disable=broad-except
             logger.exception(
@@ -309,40 +731,297 @@ class ArchiveFeed:
             if utils.POST_MORTEM:  # pragma: no cover
                 pdb.post_mortem()
             return None
+        item_asset_paths = {
+            url_result: item_download_paths[url_result]
+            for url_result in item_asset_urls
+            if url_result in item_download_paths
+        }
+        item_enclosure_paths = {
+            url_result: item_download_paths[url_result]
+            for url_result in item_enclosure_urls
+            if url_result in item_download_paths
+        }
         return item_asset_paths, item_enclosure_paths
 
-    def update_self(self, feed_format, archive_root):
+    def get_state_path(self):
+        """
+        Return the path of the file next to the archived feed that persists state.
+
+        Derived from the feed URL alone so that it can be located before the response
+        headers that determine the archived feed's extension/suffix.
+        """
+        url_path = self.archive.root_path / self.archive.url_to_path(self.url)
+        return url_path.parent / self.archive.truncate_path_parts(
+            pathlib.Path(f".{url_path.name}{self.STATE_SUFFIX}"),
+        )
+
+    def load_state(self):
+        """
+        Read the state persisted by the previous update of this feed.
+        """
+        state_path = self.get_state_path()
+        if not state_path.exists():
+            return {}
+        try:
+            with state_path.open(encoding="utf-8") as state_opened:
+                return json.load(state_opened)
+        except ValueError:
+            logger.exception("Could not read feed state: %r", str(state_path))
+            if utils.POST_MORTEM:  # pragma: no cover
+                pdb.post_mortem()
+            return {}
+
+    def save_state(self, remote_response, item_ids):
+        """
+        Persist the archived feed path, validator headers and item index for next time.
+
+        Omit the validators if the response is `None`, such as when some items could not
+        be downloaded, so that the next update processes the feed again.  Record the
+        archived feed's modification time and size with the sorted item IDs to detect
+        when the index is stale.
+        """
+        state = {
+            "path": str(self.path.relative_to(self.archive.root_path)),
+            "downloads": self.download_paths,
+        }
+        if remote_response is not None:
+            for header in self.VALIDATOR_HEADERS:
+                if header in remote_response.headers:
+                    state[header] = remote_response.headers[header]
+        self.index_items(state, item_ids)
+        state["documents"] = self.get_documents_config()
+        if self.schedule:
+            state["schedule"] = self.schedule
+        self.write_state(state)
+
+    def index_items(self, state, item_ids):
+        """
+        Record the IDs of the archived feed's items in the state.
+        """
+        feed_stat = self.path.stat()
+        state["items"] = {
+            "mtime-ns": feed_stat.st_mtime_ns,
+            "size": feed_stat.st_size,
+            "ids": sorted(item_ids),
+        }
+
+    def get_documents_config(self):
+        """
+        Return the options the documents derived from the archived feed depend on.
+        """
+        return {"page-items": self.page_items, "latest-items": self.latest_items}
+
+    def is_documents_stale(self, state):
+        """
+        Return true if the pages or the feed of the latest items are out of date.
+
+        They're otherwise only written when new items are added to the archived feed, so
+        check if they're missing or the options they're written with have changed since.
+        """
+        if self.get_latest_path().exists() != bool(self.latest_items):
+            return True
+        documents = state.get(
+            "documents",
+            {"page-items": self.PAGE_ITEMS, "latest-items": self.LATEST_ITEMS},
+        )
+        return documents != self.get_documents_config()
+
+    def write_state(self, state):
+        """
+        Write the state to the file next to the archived feed.
+        """
+        state_path = self.get_state_path()
+        logger.debug("Writing feed state: %r", str(state_path))
+        with state_path.open("w", encoding="utf-8") as state_opened:
+            json.dump(state, state_opened, indent=2)
+
+    def load_item_ids(self, state):
+        """
+        Return the IDs of the items in the archived feed from the index in the state.
+
+        Return `None` if the index is missing or stale, such as when the archived feed
+        was modified since the last update, to rebuild it from the archived feed.
+        """
+        item_index = state.get("items")
+        if self.archive.recreate or not item_index or not self.path.is_file():
+            return None
+        feed_stat = self.path.stat()
+        if (item_index["mtime-ns"], item_index["size"]) != (
+            feed_stat.st_mtime_ns,
+            feed_stat.st_size,
+        ):
+            logger.debug("Rebuilding stale feed item index: %r", str(self.path))
+            return None
+        return set(item_index["ids"])
+
+    def learn_update_interval(self, new_items, published=()):
+        """
+        Adapt how often the daemon updates this feed to how often it publishes items.
+
+        Estimate the time between items from the median time between the publish dates
+        of the latest items or, if the items have no dates, from the number of new items
+        since the last update.  If the feed hasn't published for longer than that, use
+        how long it's been instead.  Then update the feed a few times for each expected
+        item within the configured bounds.  Only the dates of the new items are given,
+        those of the latest items before them are kept in the schedule.
+        """
+        if not self.is_adaptive:
+            return
+        now = time.time()
+        if published:
+            published = sorted(set(self.schedule.get("recent", ())).union(published))
+            self.schedule["recent"] = published = published[-self.CADENCE_ITEMS :]
+        published_gaps = [
+            later - earlier for earlier, later in zip(published, published[1:])
+        ]
+        if any(published_gaps):
+            self.schedule["cadence"] = statistics.median(published_gaps)
+        elif new_items and "updated" in self.schedule:
+            # All items are new on the first update, so only learn from later updates
+            self.schedule["cadence"] = (now - self.schedule["updated"]) / new_items
+            self.schedule["published"] = now
+        if published:
+            self.schedule["published"] = published[-1]
+        self.schedule["updated"] = now
+
+        if "cadence" in self.schedule or "published" in self.schedule:
+            cadence = max(
+                self.schedule.get("cadence", 0),
+                now - self.schedule.get("published", now),
+            )
+            self.update_interval = self.clamp_update_interval(
+                cadence / self.UPDATES_PER_ITEM,
+            )
+        self.schedule["interval"] = self.update_interval
+        logger.debug(
+            "Learned update interval: %r -> %ss",
+            self.url,
+            self.update_interval,
+        )
+
+    def clamp_update_interval(self, update_interval):
+        """
+        Return the update interval within the configured bounds.
+        """
+        return min(
+            max(update_interval, self.min_update_interval),
+            self.max_update_interval,
+        )
+
+    def get_conditional_headers(self, state):
+        """
+        Return request headers to skip downloading the feed if unchanged.
+        """
+        if (
+            self.archive.recreate
+            or "path" not in state
+            or not (self.archive.root_path / state["path"]).is_file()
+        ):
+            # Request the full feed to re-create or restore the archived feed
+            return {}
+        return {
+            conditional_header: state[header]
+            for header, conditional_header in self.VALIDATOR_HEADERS.items()
+            if header in state
+        }
+
+    def update_self(self, feed_format, archive_root, path=None):
         """
         Update the `<link rel="self" href="..." ...` URL in the archived feed.
 
         Use the absolute URL so that it can be used as a base URL for other URLs in the
         feed XML.
         """
+        self_url = self.get_archive_url(self.path if path is None else path)
+        for self_link_elem in formats.compile_xpath(feed_format.SELF_LINK_XPATH)(
+            feed_format.get_items_parent(archive_root),
+        ):
+            self_link_elem.attrib["href"] = self_url
+
+    def get_archive_url(self, path):
+        """
+        Return the absolute URL of a file in the archive from the configured base URL.
+        """
         archive_base_url_split = urllib.parse.urlsplit(
             self.config.get("base-url") or self.archive.global_config["base-url"]
         )
         base_url_path = pathlib.PurePosixPath(
             archive_base_url_split.path
-        ) / urllib.parse.quote(os.path.relpath(self.path, self.archive.root_path))
-        base_url_split = archive_base_url_split._replace(path=str(base_url_path))
-        for self_link_elem in feed_format.get_items_parent(archive_root).xpath(
-            feed_format.SELF_LINK_XPATH
-        ):
-            self_link_elem.attrib["href"] = base_url_split.geturl()
+        ) / urllib.parse.quote(os.path.relpath(path, self.archive.root_path))
+        return archive_base_url_split._replace(path=str(base_url_path)).geturl()
 
-    def load_remote_tree(self, remote_response):
+    def request_remote_tree(self, headers):
         """
         Request the feed from the remote URL, parse the XML, and return the tree.
 
-        Also do any pre-processing needed to start updating the archive.
+        Feed the response body to the parser as it's streamed so that parsing overlaps
+        with the transfer and the whole body is never held in memory.  Return the
+        response and the tree, or `None` for the tree if the feed is unchanged.
         """
-        logger.debug("Parsing remote XML: %r", self.url)
-        remote_root = etree.fromstring(  # nosec: B320
-            remote_response.content,
-            base_url=str(remote_response.url),
-            parser=utils.XML_PARSER,
-        )
-        return etree.ElementTree(remote_root)
+        logger.debug("Requesting feed: %r", self.url)
+        fetch_start = time.perf_counter()
+        with self.archive.client.stream(
+            "GET",
+            self.url,
+            headers=headers,
+        ) as remote_response:
+            self.count_metric("fetch_seconds", time.perf_counter() - fetch_start)
+            if remote_response.status_code == 304:
+                return remote_response, None
+            logger.debug("Parsing remote XML: %r", self.url)
+            parse_start = time.perf_counter()
+            remote_parser = utils.get_pull_parser(str(remote_response.url))
+            for data in remote_response.iter_bytes():
+                remote_parser.feed(data)
+            remote_tree = etree.ElementTree(remote_parser.close())
+        self.count_metric("parse_seconds", time.perf_counter() - parse_start)
+        return remote_response, remote_tree
+
+    async def request_remote_tree_async(self, executor, headers):
+        """
+        Request and parse the remote feed as it's streamed from the engine event loop.
+
+        Parsing is delegated to one of the engine's worker threads which parses the
+        response body as the event loop queues it.
+        """
+        logger.debug("Requesting feed: %r", self.url)
+        loop = asyncio.get_running_loop()
+        fetch_start = time.perf_counter()
+        async with self.archive.async_client.stream(
+            "GET",
+            self.url,
+            headers=headers,
+        ) as remote_response:
+            self.count_metric("fetch_seconds", time.perf_counter() - fetch_start)
+            if remote_response.status_code == 304:
+                return remote_response, None
+            logger.debug("Parsing remote XML: %r", self.url)
+            parse_start = time.perf_counter()
+            remote_queue = queue.SimpleQueue()
+            remote_future = loop.run_in_executor(
+                executor,
+                self.run_worker_profiled,
+                utils.parse_queued,
+                str(remote_response.url),
+                remote_queue,
+            )
+            try:
+                # Queue the body in batches to avoid feeding the parser every small
+                # network read
+                async for data in remote_response.aiter_bytes(
+                    chunk_size=self.ASYNC_PARSE_BYTES,
+                ):
+                    remote_queue.put(data)
+            except BaseException:
+                # The transfer failed, so ignore the parser's errors
+                remote_future.cancel()
+                raise
+            finally:
+                # Always let the parsing thread finish
+                remote_queue.put(None)
+            remote_root = await remote_future
+        self.count_metric("parse_seconds", time.perf_counter() - parse_start)
+        return remote_response, etree.ElementTree(remote_root)
 
     def find_archive_path(self):
         """
@@ -352,9 +1031,12 @@ class ArchiveFeed:
         if not path.exists():
             archive_files = []
             for archive_file in path.parent.glob(f"{path.stem}.*"):
-                guessed_type, _ = mimetypes.guess_type(archive_file)
-                if guessed_type is not None and (
-                    guessed_type.endswith("/xml") or guessed_type.endswith("+xml")
+                guessed_type, guessed_encoding = mimetypes.guess_type(archive_file)
+                # Skip precompressed sidecars such as `*.rss.gz`
+                if (
+                    guessed_type is not None
+                    and guessed_encoding is None
+                    and (guessed_type.endswith("/xml") or guessed_type.endswith("+xml"))
                 ):
                     archive_files.append(archive_file)
             if not archive_files:
@@ -368,18 +1050,16 @@ class ArchiveFeed:
             path = archive_files[0]
         return path
 
-    def load_archive_tree(self):
+    def load_archive_tree(self, path=None):
         """
         Parse the local feed XML in the archive and return the tree.
         """
+        if path is None:
+            path = self.path
         archive_tree = None
-        if (
-            not self.archive.recreate
-            and self.path.exists()
-            and self.path.read_text().strip()
-        ):
-            logger.debug("Parsing archive XML: %r", self.url)
-            with self.path.open() as feed_archive_opened:
+        if not self.archive.recreate and path.exists() and path.read_text().strip():
+            logger.debug("Parsing archive XML: %r", str(path))
+            with path.open() as feed_archive_opened:
                 # Try to parse the local archive version of the feed if possible.  If
                 # there are errors parsing it, then treat it as if it's the first time
                 # archiving this feed.
@@ -397,12 +1077,14 @@ class ArchiveFeed:
                         pdb.post_mortem()
         return archive_tree
 
-    def get_archive_tree(self, remote_tree, download_paths, remote_format=None):
+    def iter_archive_tree(self, remote_tree, download_paths, remote_format=None):
         """
         Parse the archive feed XML if it exists or initialize an empty archive feed.
 
         If there is no local feed XML in the archive, such as the first time the feed is
-        updated, then initialize the archive tree from the remote tree.
+        updated, then initialize the archive tree from the remote tree.  Yield the URLs
+        of the feed-level assets to download as `iter_update()` does and return the
+        archive tree.
 
         Also do any pre-processing needed to start updating the archive.
         """
@@ -443,12 +1125,15 @@ class ArchiveFeed:
 
             # Consistent with initial download of the feed, only download assets for the
             # initial version of the feed.
+            feed_url_results = formats.all_xpaths_results(
+                archive_root,
+                remote_format.DOWNLOAD_FEED_URLS_XPATHS,
+            )
+            download_results = yield self.get_unique_urls(feed_url_results)
             try:
-                archive_download_paths = self.download_urls(
-                    formats.all_xpaths_results(
-                        archive_root,
-                        remote_format.DOWNLOAD_FEED_URLS_XPATHS,
-                    ),
+                archive_download_paths = self.update_downloaded_urls(
+                    feed_url_results,
+                    download_results,
                 )
             except Exception:  # pragma: no cover, pylint: disable=broad-except
                 logger.exception(
@@ -463,96 +1148,630 @@ class ArchiveFeed:
                 "Writing initialized feed: %r",
                 str(self.path),
             )
-            etree.indent(archive_tree)
-            archive_tree.write(str(self.path))
+            self.write_archive_tree(archive_tree)
 
         return archive_tree
 
-    # TODO: Refactor to reduce complexity and improve readability and testibility
-    def download_urls(  # noqa: MC0001
+    def write_archive_tree(self, archive_tree, path=None):
+        """
+        Pretty format the archive feed XML and atomically replace the archived feed.
+
+        Write to a temporary file next to the archived feed and then rename it over the
+        archived feed so that an interrupted write never leaves a truncated feed.
+        """
+        if path is None:
+            path = self.path
+        # Pretty format the feed for readability
+        etree.indent(archive_tree)
+        # The `~` suffix is ignored as a backup file by static site servers and tools
+        tmp_path = path.parent / self.archive.truncate_path_parts(
+            pathlib.Path(f".{path.name}~"),
+        )
+        try:
+            archive_tree.write(str(tmp_path))
+            os.replace(tmp_path, path)
+            self.written_paths.add(path)
+        except BaseException:  # pragma: no cover
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+
+    def update_archive_metadata(self, remote_response, archive_mtime_ns):
+        """
+        Reflect the remote feed response in the archived feed if it was written.
+
+        Leave the modification time of an archived feed that wasn't written as it was so
+        that its sidecars aren't written again.
+        """
+        if self.path.stat().st_mtime_ns != archive_mtime_ns:
+            update_download_metadata(remote_response, self.path)
+
+    def precompress_archive(self):
+        """
+        Write compressed sidecars of the archived feed and the documents next to it.
+
+        Do so only once the feed's modification time has been updated from the remote
+        feed response since sidecars are otherwise only written again when that changes.
+        Always write them again for the documents written since, which may keep the
+        same time, such as when retrying items that previously failed.
+        """
+        for path in [self.path, self.get_latest_path()] + self.list_page_paths():
+            if path.exists():
+                self.archive.precompress(path, is_changed=path in self.written_paths)
+        self.written_paths.clear()
+
+    def get_first_item_idx(self, feed_format, items_parent):
+        """
+        Return the lowest child index for the first item, or after the last child.
+        """
+        first_item_idx = 0
+        for first_item_idx, item_sibling in enumerate(items_parent.iterchildren()):
+            if not isinstance(item_sibling.tag, str):
+                # Ignore comments or other unusual XML detritus/artifacts
+                # `ValueError: Invalid tag name '<cyfunction Comment at 0x...>'`
+                continue
+            item_sibling_tag = etree.QName(item_sibling.tag).localname
+            if item_sibling_tag.lower() == feed_format.ITEM_TAG:
+                return first_item_idx
+        return first_item_idx + 1 if len(items_parent) else 0
+
+    def get_infix_path(self, infix):
+        """
+        Return the path of another document named after the archived feed.
+        """
+        return self.path.with_name(
+            self.path.stem[
+                : self.archive.root_stat.f_namemax - len(infix) - len(self.path.suffix)
+            ]
+            + infix
+            + self.path.suffix,
+        )
+
+    def get_page_path(self, page_number):
+        """
+        Return the path of one of the archived feed's RFC 5005 archive page documents.
+        """
+        return self.get_infix_path(f"{self.PAGE_INFIX}{page_number}")
+
+    def get_latest_path(self):
+        """
+        Return the path of the feed of only the latest items.
+        """
+        return self.get_infix_path(self.LATEST_INFIX)
+
+    def list_page_paths(self):
+        """
+        Return the paths of the archive page documents that exist, oldest first.
+        """
+        page_paths = []
+        page_path = self.get_page_path(1)
+        while page_path.exists():
+            page_paths.append(page_path)
+            page_path = self.get_page_path(len(page_paths) + 1)
+        return page_paths
+
+    def page_archive_tree(self, feed_format, archive_tree):
+        """
+        Move the oldest items of the archived feed into new RFC 5005 archive pages.
+
+        Keep at most `page-items` items in the current, subscribed, feed document.  Each
+        new page holds exactly that many items, links to the previous page and is never
+        changed by later updates, so clients that support paging only request the
+        current document and new pages.  Re-linking enclosures is the exception.  Return
+        true if any items were moved.
+        """
+        archive_root = archive_tree.getroot()
+        items_parent = feed_format.get_items_parent(archive_root)
+        item_elems = list(feed_format.iter_items(archive_root))
+        if len(item_elems) <= self.page_items:
+            return False
+        page_tree = self.copy_archive_tree(feed_format, archive_tree)
+        page_items_parent = feed_format.get_items_parent(page_tree.getroot())
+        feed_format.add_feed_elem(
+            page_items_parent,
+            feed_format.HISTORY_NAMESPACE,
+            "archive",
+        )
+        feed_format.set_link(
+            page_items_parent, "current", self.get_archive_url(self.path)
+        )
+
+        page_paths = self.list_page_paths()
+        while len(item_elems) > self.page_items:
+            page_path = self.get_page_path(len(page_paths) + 1)
+            logger.info("Writing archive page: %r", str(page_path))
+            feed_format.set_link(
+                page_items_parent,
+                "self",
+                self.get_archive_url(page_path),
+            )
+            if page_paths:
+                feed_format.set_link(
+                    page_items_parent,
+                    "prev-archive",
+                    self.get_archive_url(page_paths[-1]),
+                )
+            page_item_elems = item_elems[-self.page_items :]
+            del item_elems[-self.page_items :]
+            # Also removes the items from the current document
+            page_items_parent.extend(page_item_elems)
+            self.write_archive_tree(page_tree, page_path)
+            for page_item_elem in page_item_elems:
+                page_items_parent.remove(page_item_elem)
+            page_paths.append(page_path)
+
+        feed_format.set_link(
+            items_parent,
+            "prev-archive",
+            self.get_archive_url(page_paths[-1]),
+        )
+        return True
+
+    def copy_archive_tree(self, feed_format, archive_tree, items=0):
+        """
+        Return a copy of the archived feed with only the given number of newest items.
+
+        Avoids copying all the items of large archived feeds.  The items not copied are
+        put back together after the copied items, which moves any non-item elements
+        interspersed between them, but as with `utils.copy_empty_items_parent()`, that's
+        rare enough to ignore.
+        """
+        items_parent = feed_format.get_items_parent(archive_tree.getroot())
+        skipped_item_elems = list(feed_format.iter_items(archive_tree.getroot()))[
+            items:
+        ]
+        if not skipped_item_elems:
+            return copy.deepcopy(archive_tree)
+        skipped_idx = items_parent.index(skipped_item_elems[0])
+        for item_elem in skipped_item_elems:
+            items_parent.remove(item_elem)
+        tree_copy = copy.deepcopy(archive_tree)
+        for item_idx, item_elem in enumerate(skipped_item_elems, start=skipped_idx):
+            items_parent.insert(item_idx, item_elem)
+        return tree_copy
+
+    def write_latest_tree(self, feed_format, archive_tree):
+        """
+        Write the feed of only the newest `latest-items` items of the archived feed.
+
+        Fill it from the newest archive pages when the current document holds fewer
+        items.
+        """
+        latest_path = self.get_latest_path()
+        latest_tree = self.copy_archive_tree(
+            feed_format,
+            archive_tree,
+            self.latest_items,
+        )
+        latest_root = latest_tree.getroot()
+        self.update_self(feed_format, latest_root, latest_path)
+        latest_items_parent = feed_format.get_items_parent(latest_root)
+        missing_items = self.latest_items - len(feed_format.iter_items(latest_root))
+        for page_path in reversed(self.list_page_paths()):
+            if missing_items <= 0:
+                break
+            page_tree = etree.parse(  # nosec B320
+                str(page_path),
+                parser=utils.XML_PARSER,
+            )
+            page_item_elems = feed_format.iter_items(page_tree.getroot())[
+                :missing_items
+            ]
+            latest_items_parent.extend(page_item_elems)
+            missing_items -= len(page_item_elems)
+        # Subscribers to the latest items don't page through the whole archive
+        for link_elem in formats.compile_xpath(feed_format.LINK_XPATH)(
+            latest_items_parent,
+            rel="prev-archive",
+        ):
+            latest_items_parent.remove(link_elem)
+        logger.debug("Writing latest items feed: %r", str(latest_path))
+        self.write_archive_tree(latest_tree, latest_path)
+
+    def is_archive_streamed(self):
+        """
+        Return true if the archived feed is too large to load whole to add items.
+        """
+        if (
+            self.page_items
+            or self.archive.recreate
+            or not self.path.exists()
+            or self.path.stat().st_size < self.stream_archive_bytes
+        ):
+            return False
+        # Blank archived feeds are initialized from the remote feed instead
+        with self.path.open("rb") as archive_opened:
+            return bool(archive_opened.read(1024).strip())
+
+    def load_archive_item_ids(self, feed_format, path=None):
+        """
+        Return the IDs of the archived feed's items, parsing the XML incrementally.
+
+        Return `None` if the archived feed can't be parsed so that it's handled as when
+        loading the whole archived feed.
+        """
+        if path is None:
+            path = self.path
+        item_ids = set()
+        with path.open("rb") as archive_opened:
+            try:
+                for _, elem in etree.iterparse(  # nosec B320
+                    archive_opened,
+                    resolve_entities=False,
+                ):
+                    if etree.QName(elem).localname == feed_format.ITEM_TAG:
+                        item_ids.add(feed_format.get_item_id(elem))
+                        # Free the items already seen
+                        elem.clear()
+                        while elem.getprevious() is not None:
+                            del elem.getparent()[0]
+            except SyntaxError as exc:
+                logger.warning(
+                    "Could not parse archive feed incrementally: %r\n%s",
+                    str(path),
+                    exc,
+                )
+                return None
+        return item_ids
+
+    def write_archive_documents(self, feed_format=None, archive_tree=None):
+        """
+        Page the archived feed and write, or remove, the feed of the latest items.
+
+        Load the archived feed if its tree isn't given.
+        """
+        if archive_tree is None:
+            archive_tree = self.load_archive_tree()
+            if archive_tree is None:
+                return
+            feed_format = formats.FeedFormat.from_tree(self, archive_tree)
+        logger.info("Writing documents derived from archived feed: %r", self.url)
+        if self.page_items and self.page_archive_tree(feed_format, archive_tree):
+            self.write_archive_tree(archive_tree)
+        if self.latest_items:
+            self.write_latest_tree(feed_format, archive_tree)
+        else:
+            self.remove_latest()
+
+    def remove_latest(self):
+        """
+        Remove any feed of the latest items and its sidecars, such as once disabled.
+        """
+        latest_path = self.get_latest_path()
+        for path in [latest_path] + [
+            latest_path.with_name(f"{latest_path.name}{suffix}")
+            for suffix in utils.PRECOMPRESS_SUFFIXES.values()
+        ]:
+            with contextlib.suppress(FileNotFoundError):
+                path.unlink()
+
+    def write_archive_items(self, feed_format, archive_tree, item_elems):
+        """
+        Write the archived feed tree or merge the new items into the archived feed.
+
+        The items are given oldest first and are removed from the list once merged.
+        """
+        if archive_tree is not None:
+            if self.page_items:
+                self.page_archive_tree(feed_format, archive_tree)
+            self.write_archive_tree(archive_tree)
+            if self.latest_items:
+                self.write_latest_tree(feed_format, archive_tree)
+        else:
+            self.merge_archive_items(feed_format, item_elems[::-1])
+            item_elems.clear()
+        if not self.latest_items:
+            self.remove_latest()
+
+    def merge_archive_items(
         self,
-        url_results,
-    ):  # pylint: disable=too-many-branches
+        feed_format,
+        item_elems,
+    ):  # pylint: disable=too-many-branches,too-many-locals
         """
-        Escape URLs to archive paths, download if new, and update URLs.
+        Add the items to the top of the archived feed in one pass of the archived XML.
+
+        Parse the archived feed incrementally and write the feed-level elements, then
+        the new items, then each archived item as it's parsed and removed from the
+        parsed tree, so that memory is bounded by the size of items rather than the size
+        of the archive.  Also update the feed's self link as `update_self()` does,
+        write the feed of the latest items in the same pass if enabled and atomically
+        replace the files as `write_archive_tree()` does.
         """
-        downloaded_paths = {}
-        excs = {}
+        # How many items to write to each file, `None` for all
+        merge_items = {self.path: None}
+        if self.latest_items:
+            merge_items[self.get_latest_path()] = self.latest_items
+        items_parent_xpath = formats.compile_xpath(feed_format.ITEMS_PARENT_XPATH)
+        placeholder_elem = etree.Comment(self.MERGE_PLACEHOLDER)
+        placeholder = etree.tostring(placeholder_elem)
+        items_parent = shell_elem = archive_root = None
+        level = 0
+        tmp_paths = {
+            path: path.parent
+            / self.archive.truncate_path_parts(pathlib.Path(f".{path.name}~"))
+            for path in merge_items
+        }
+
+        def write_item(item_elem):
+            """
+            Write one item, or other child of the items parent, to the files.
+            """
+            serialized = self.serialize_merge_item(shell_elem, item_elem, level)
+            is_item = (
+                isinstance(item_elem.tag, str)
+                and etree.QName(item_elem).localname == feed_format.ITEM_TAG
+            )
+            for path, tmp_opened in merge_opened.items():
+                if merge_items[path] is None:
+                    tmp_opened.write(serialized)
+                elif is_item and merge_items[path]:
+                    tmp_opened.write(serialized)
+                    merge_items[path] -= 1
+
+        def write_head():
+            """
+            Write the XML up to where the items are merged in, then the new items.
+            """
+            for path, tmp_opened in merge_opened.items():
+                self.update_self(feed_format, archive_root, path)
+                etree.indent(archive_root.getroottree())
+                tmp_opened.write(
+                    etree.tostring(archive_root.getroottree())
+                    .split(placeholder, 1)[0]
+                    .rstrip(),
+                )
+            for item_elem in item_elems:
+                write_item(item_elem)
+
+        try:
+            with contextlib.ExitStack() as exit_stack:
+                archive_opened = exit_stack.enter_context(self.path.open("rb"))
+                merge_opened = {
+                    path: exit_stack.enter_context(tmp_path.open("wb"))
+                    for path, tmp_path in tmp_paths.items()
+                }
+                for event, elem in etree.iterparse(  # nosec B320
+                    archive_opened,
+                    events=("start", "end", "comment", "pi"),
+                    resolve_entities=False,
+                ):
+                    if items_parent is None:
+                        if event == "start":
+                            archive_root = elem.getroottree().getroot()
+                            items_parents = items_parent_xpath(archive_root)
+                            if items_parents:
+                                items_parent = items_parents[0]
+                                # Serialize children without redundant namespaces
+                                shell_elem = etree.Element(
+                                    items_parent.tag,
+                                    nsmap=items_parent.nsmap,
+                                )
+                                level = len(list(items_parent.iterancestors()))
+                        continue
+                    if elem is items_parent and event == "end":
+                        if placeholder_elem.getparent() is None:
+                            # No archived items, add the new items at the end
+                            items_parent.append(placeholder_elem)
+                            write_head()
+                        continue
+                    if elem.getparent() is not items_parent or event == "start":
+                        continue
+                    if placeholder_elem.getparent() is None:
+                        if (
+                            event != "end"
+                            or etree.QName(elem).localname != feed_format.ITEM_TAG
+                        ):
+                            # Still in the feed-level elements before the first item
+                            continue
+                        elem.addprevious(placeholder_elem)
+                        write_head()
+                    write_item(elem)
+
+                if placeholder_elem.getparent() is None:
+                    raise ValueError(
+                        f"Could not find feed items in archive: {str(self.path)!r}",
+                    )
+                # The closing tags and anything after the items
+                etree.indent(archive_root.getroottree())
+                suffix = etree.tostring(archive_root.getroottree()).split(
+                    placeholder,
+                    1,
+                )[1]
+                for tmp_opened in merge_opened.values():
+                    tmp_opened.write(suffix)
+            for path, tmp_path in tmp_paths.items():
+                os.replace(tmp_path, path)
+                self.written_paths.add(path)
+        except BaseException:
+            for tmp_path in tmp_paths.values():
+                with contextlib.suppress(FileNotFoundError):
+                    tmp_path.unlink()
+            raise
+
+    @staticmethod
+    def serialize_merge_item(shell_elem, item_elem, level):
+        """
+        Serialize one item, or other child of the items parent, to merge into the XML.
+
+        Moving the item into a shell copy of the items parent without any items makes
+        its namespaces resolve to the shell's and avoids serializing the namespace
+        declarations already written with the items parent.  The shell's own tags are
+        then omitted.
+        """
+        shell_elem.append(item_elem)
+        etree.indent(shell_elem, level=level)
+        serialized = etree.tostring(shell_elem)
+        shell_elem.remove(item_elem)
+        return (
+            b"\n"
+            + b"  " * (level + 1)
+            + serialized[serialized.index(b">") + 1 : serialized.rindex(b"</")].strip()
+        )
+
+    def get_unique_urls(self, url_results):
+        """
+        Return the unique URLs to download, escaped to archive paths if new.
+        """
+        unique_urls = []
         for url_result in url_results:
             if url_result == self.url:
                 # The feed itself is handled in `self.update()`
                 continue
-            download_path = None
-            if utils.PYTHONTRACEMALLOC:  # pragma: no cover
-                # Optionally compare memory consumption
-                self.tracemalloc_snapshot = utils.compare_memory_snapshots(self)
-            if url_result in downloaded_paths:
+            if url_result in unique_urls:
                 logger.debug("Duplicate URL, skipping download: %r", url_result)
-                # Proceed below to update the URLs in the duplicate XML element
-                download_path = self.archive.root_path / downloaded_paths[url_result]
-            else:
-                # Download the URL to the escaped local path in the archive
+                continue
+            unique_urls.append(url_result)
+        return unique_urls
+
+    def update_downloaded_urls(self, url_results, download_results):
+        """
+        Update the URLs in the feed XML to the paths of their downloads.
+
+        The URLs are downloaded at once, up to the feed's download concurrency, so
+        update the URLs in the feed XML only after all downloads are finished and only
+        if all of them succeeded.
+        """
+        downloaded_urls = []
+        for url_result in url_results:
+            if url_result not in download_results:
+                continue
+            download_result = download_results[url_result]
+            if isinstance(download_result, Exception):
+                # Ensure the feed item is processed again if any problem occurred with
+                # it's downloads by leaving all of it's URLs as they were
+                raise download_result
+            downloaded_urls.append(
+                (url_result, download_result.relative_to(self.archive.root_path)),
+            )
+
+        # Update the URLs in the feed XML to the relative archive paths.  The same URL
+        # may occur more than once in the feed XML, so update each occurrence.
+        downloaded_paths = {}
+        for url_result, download_relative in downloaded_urls:
+            self.update_url(url_result, download_relative)
+            downloaded_paths[url_result] = download_relative
+        return downloaded_paths
+
+    def download_urls_concurrently(self, url_results):
+        """
+        Download unique URLs at once, return the download paths or exceptions by URL.
+        """
+        if self.download_concurrency > 1 and len(url_results) > 1:
+            with futures.ThreadPoolExecutor(
+                max_workers=min(self.download_concurrency, len(url_results)),
+                thread_name_prefix="feed-archiver-download",
+            ) as executor:
+                download_results = list(
+                    executor.map(
+                        functools.partial(
+                            self.run_worker_profiled,
+                            self.try_download_url,
+                        ),
+                        url_results,
+                    ),
+                )
+        else:
+            download_results = [
+                self.try_download_url(url_result) for url_result in url_results
+            ]
+        return dict(zip(url_results, download_results))
+
+    async def download_urls_async(self, url_results):
+        """
+        Download unique URLs at once from the engine event loop.
+        """
+        semaphore = asyncio.Semaphore(self.download_concurrency)
+
+        async def try_download_url_async(url_result):
+            async with semaphore:
                 try:
-                    download_path = self.download_url(url_result)
+                    return await self.download_url_async(url_result)
                 except Exception as exc:  # pylint: disable=broad-except
-                    excs[url_result] = exc
                     logger.exception(
                         "Problem downloading URL, removing from archive: %r",
                         url_result,
                     )
-                    if download_path is not None:  # pragma: no cover
-                        download_path.unlink()
-                    if utils.POST_MORTEM:  # pragma: no cover
-                        pdb.post_mortem()
-                    continue
-                downloaded_paths[url_result] = download_path.relative_to(
-                    self.archive.root_path,
-                )
+                    self.count_metric("download_errors")
+                    return exc
 
-            # Update the URL in the feed XML to the relative archive path.
-            # Update only after successful download to minimize inconsistent state on
-            # errors.
-            url_parent = url_result.getparent()
-            download_relative = downloaded_paths[url_result]
-            if download_relative.name == self.archive.INDEX_BASENAME:
-                download_relative = download_relative.parent
-            download_url_split = self.archive.url_split._replace(
-                # Let pathlib normalize the relative path
-                path=str(
-                    pathlib.PurePosixPath(self.archive.url_split.path)
-                    / urllib.parse.quote(str(download_relative))
-                ),
-            )
-            if url_result.attrname:
-                logger.debug(
-                    'Updating feed URL: <%s %s="%s"...>',
-                    url_result.getparent().tag,
-                    url_result.attrname,
-                    download_url_split.geturl(),
-                )
-                # Store the original remote URL in a namespace attribute
-                url_parent.attrib[
-                    f"{{{self.NAMESPACE}}}attribute-{url_result.attrname}"
-                ] = url_result
-                # Update the archived URL to the local, relative URL
-                url_parent.attrib[url_result.attrname] = download_url_split.geturl()
-            else:
-                logger.debug(
-                    "Updating feed URL: <%s>%s</%s>",
-                    url_result.getparent().tag,
-                    download_url_split.geturl(),
-                    url_result.getparent().tag,
-                )
-                # Store the original remote URL in a namespace attribute
-                url_parent.attrib[f"{{{self.NAMESPACE}}}text"] = url_result
-                # Update the URL in the archive XML to the local, relative URL
-                url_parent.text = download_url_split.geturl()
-
-        if excs:
-            # Ensure the feed item is processed again if any problem occurred with with
-            # it's downloads
-            raise list(excs.values())[0]
-        return downloaded_paths
+        download_results = await asyncio.gather(
+            *(try_download_url_async(url_result) for url_result in url_results)
+        )
+        return dict(zip(url_results, download_results))
+
+    def run_worker_profiled(self, func, *args):
+        """
+        Call the function in a worker thread, profiled by that thread's profiler if any.
+
+        Calls from more than one thread at once garble the statistics of one profiler,
+        so each worker thread gets a profiler of its own.  The statistics of all of
+        them are added to the feed's statistics when the sub-command is done.
+        """
+        if self.profiler is None:
+            return func(*args)
+        thread_id = threading.get_ident()
+        if thread_id not in self.worker_profilers:
+            self.worker_profilers[thread_id] = cProfile.Profile()
+        return self.archive.run_profiled(self.worker_profilers[thread_id], func, *args)
+
+    def try_download_url(self, url_result):
+        """
+        Download the URL, log and return any exception instead of raising it.
+        """
+        if utils.PYTHONTRACEMALLOC:  # pragma: no cover
+            # Optionally compare memory consumption
+            self.tracemalloc_snapshot = utils.compare_memory_snapshots(self)
+        try:
+            return self.download_url(url_result)
+        except Exception as exc:  # pylint: disable=broad-except
+            logger.exception(
+                "Problem downloading URL, removing from archive: %r",
+                url_result,
+            )
+            self.count_metric("download_errors")
+            if utils.POST_MORTEM:  # pragma: no cover
+                pdb.post_mortem()
+            return exc
+
+    def update_url(self, url_result, download_relative):
+        """
+        Update the URL in the feed XML to the relative URL of the archive download.
+        """
+        url_parent = url_result.getparent()
+        if download_relative.name == self.archive.INDEX_BASENAME:
+            download_relative = download_relative.parent
+        download_url_split = self.archive.url_split._replace(
+            # Let pathlib normalize the relative path
+            path=str(
+                pathlib.PurePosixPath(self.archive.url_split.path)
+                / urllib.parse.quote(str(download_relative))
+            ),
+        )
+        if url_result.attrname:
+            logger.debug(
+                'Updating feed URL: <%s %s="%s"...>',
+                url_parent.tag,
+                url_result.attrname,
+                download_url_split.geturl(),
+            )
+            # Store the original remote URL in a namespace attribute
+            url_parent.attrib[
+                f"{{{self.NAMESPACE}}}attribute-{url_result.attrname}"
+            ] = url_result
+            # Update the archived URL to the local, relative URL
+            url_parent.attrib[url_result.attrname] = download_url_split.geturl()
+        else:
+            logger.debug(
+                "Updating feed URL: <%s>%s</%s>",
+                url_parent.tag,
+                download_url_split.geturl(),
+                url_parent.tag,
+            )
+            # Store the original remote URL in a namespace attribute
+            url_parent.attrib[f"{{{self.NAMESPACE}}}text"] = url_result
+            # Update the URL in the archive XML to the local, relative URL
+            url_parent.text = download_url_split.geturl()
 
     def resolve_url(self, url):
         """
@@ -599,32 +1818,299 @@ class ArchiveFeed:
         Request a URL and stream the response to the file.
         """
         logger.info("Downloading URL into archive: %r", url_result)
-        url_split = self.resolve_url(url_result)
-        with self.archive.client.stream(
-            "GET",
-            url_split.geturl(),
-        ) as download_response:
-            download_path = self.archive.root_path / self.archive.response_to_path(
-                download_response,
+        url = self.resolve_url(url_result).geturl()
+        download_path, has_candidates = self.check_download(url)
+        if has_candidates:
+            download_path = self.head_download_path(
+                self.request_head(url),
                 url_result,
             )
-            download_relative = download_path.relative_to(self.archive.root_path)
-            if download_path.exists():
+        if download_path is not None:
+            return self.skip_download(url, download_path)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            with self.archive.host_scheduler.limit(url), self.archive.client.stream(
+                "GET",
+                url,
+            ) as download_response:
+                if self.archive.host_scheduler.is_throttled(
+                    url, download_response, attempt
+                ):
+                    continue
+                download_path = self.archive.root_path / self.archive.response_to_path(
+                    download_response,
+                    url_result,
+                )
+                if download_path.exists():
+                    return self.skip_download(url, download_path)
+                download_relative = download_path.relative_to(self.archive.root_path)
                 logger.debug(
-                    "Skipping download already in archive: %r",
+                    "Writing download into archive: %r",
                     str(download_relative),
                 )
-                return download_path
-            logger.debug("Writing download into archive: %r", str(download_relative))
-            download_path.parent.mkdir(parents=True, exist_ok=True)
-            with download_path.open("wb") as download_opened:
-                for data in download_response.iter_bytes():
-                    download_opened.write(data)
+                with open_download(download_path) as download_opened:
+                    for data in download_response.iter_bytes():
+                        download_opened.write(data)
+                self.count_metric(
+                    "download_bytes",
+                    download_response.num_bytes_downloaded,
+                )
+            break
 
         update_download_metadata(download_response, download_path)
+        self.download_paths[url] = str(download_relative)
 
         return download_path
 
+    async def download_url_async(self, url_result):
+        """
+        Request a URL and stream the response to the file from the engine event loop.
+
+        Filesystem writes are delegated to the event loop's default executor.
+        """
+        logger.info("Downloading URL into archive: %r", url_result)
+        url = self.resolve_url(url_result).geturl()
+        loop = asyncio.get_running_loop()
+        download_path, has_candidates = await loop.run_in_executor(
+            None,
+            self.run_worker_profiled,
+            self.check_download,
+            url,
+        )
+        if has_candidates:
+            head_response = await self.request_head_async(url)
+            download_path = await loop.run_in_executor(
+                None,
+                self.run_worker_profiled,
+                self.head_download_path,
+                head_response,
+                url_result,
+            )
+        if download_path is not None:
+            return self.skip_download(url, download_path)
+
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self.archive.host_scheduler.limit_async(
+                url,
+            ), self.archive.async_client.stream(
+                "GET",
+                url,
+            ) as download_response:
+                if self.archive.host_scheduler.is_throttled(
+                    url, download_response, attempt
+                ):
+                    continue
+                download_path = self.archive.root_path / self.archive.response_to_path(
+                    download_response,
+                    url_result,
+                )
+                if download_path.exists():
+                    return self.skip_download(url, download_path)
+                download_relative = download_path.relative_to(self.archive.root_path)
+                logger.debug(
+                    "Writing download into archive: %r",
+                    str(download_relative),
+                )
+                download_opened = await loop.run_in_executor(
+                    None,
+                    self.run_worker_profiled,
+                    open_download,
+                    download_path,
+                )
+                try:
+                    # Avoid a trip to the executor for every small network read
+                    async for data in download_response.aiter_bytes(
+                        chunk_size=self.ASYNC_WRITE_BYTES,
+                    ):
+                        await loop.run_in_executor(
+                            None,
+                            self.run_worker_profiled,
+                            download_opened.write,
+                            data,
+                        )
+                finally:
+                    await loop.run_in_executor(
+                        None,
+                        self.run_worker_profiled,
+                        download_opened.close,
+                    )
+                self.count_metric(
+                    "download_bytes",
+                    download_response.num_bytes_downloaded,
+                )
+            break
+
+        await loop.run_in_executor(
+            None,
+            self.run_worker_profiled,
+            update_download_metadata,
+            download_response,
+            download_path,
+        )
+        self.download_paths[url] = str(download_relative)
+
+        return download_path
+
+    def check_download(self, url):
+        """
+        Return any previous download of the URL and whether `HEAD` may find one.
+        """
+        download_path = self.lookup_download_path(url)
+        return (
+            download_path,
+            download_path is None and self.has_download_candidates(url),
+        )
+
+    def lookup_download_path(self, url):
+        """
+        Return the archive path of a URL downloaded before without sending a request.
+
+        Use the paths of previous downloads recorded in the feed state first.  Otherwise
+        the archive path can be derived from the URL alone when its suffix/extension is
+        unambiguous.  Return `None` when the URL may not have been downloaded.
+        """
+        if url in self.download_paths:
+            download_path = self.archive.root_path / self.download_paths[url]
+            if download_path.exists():
+                return download_path
+        download_path = self.archive.root_path / self.archive.url_to_path(url)
+        # Without a suffix, the `Content-Type` header determines the archive path
+        if download_path.suffix and download_path.exists():
+            return download_path
+        return None
+
+    def has_download_candidates(self, url):
+        """
+        Return true if any file in the archive may be a previous download of the URL.
+
+        Used to decide whether it's worth sending a cheap `HEAD` request to derive the
+        archive path from the `Content-Type` header.
+        """
+        url_path = self.archive.root_path / self.archive.url_to_path(url)
+        if not url_path.parent.is_dir():
+            return False
+        return any(
+            sibling_path.stem == url_path.stem
+            for sibling_path in url_path.parent.iterdir()
+        )
+
+    def request_head(self, url):
+        """
+        Send a `HEAD` request for the URL, retrying if the host asks to.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            with self.archive.host_scheduler.limit(url):
+                head_response = self.archive.client.head(url)
+            if not self.archive.host_scheduler.is_throttled(
+                url,
+                head_response,
+                attempt,
+            ):
+                return head_response
+
+    async def request_head_async(self, url):
+        """
+        Send a `HEAD` request for the URL from the engine event loop, retrying if the
+        host asks to.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            async with self.archive.host_scheduler.limit_async(url):
+                head_response = await self.archive.async_client.head(url)
+            if not self.archive.host_scheduler.is_throttled(
+                url,
+                head_response,
+                attempt,
+            ):
+                return head_response
+
+    def head_download_path(self, head_response, url_result):
+        """
+        Return the archive path from a `HEAD` response if already downloaded.
+        """
+        if not head_response.is_success:
+            # Let the `GET` request handle any errors
+            return None
+        download_path = self.archive.root_path / self.archive.response_to_path(
+            head_response,
+            url_result,
+        )
+        if download_path.exists():
+            return download_path
+        return None
+
+    def skip_download(self, url, download_path):
+        """
+        Record the archive path of a URL already downloaded and skip requesting it.
+        """
+        download_relative = download_path.relative_to(self.archive.root_path)
+        logger.debug(
+            "Skipping download already in archive: %r",
+            str(download_relative),
+        )
+        self.download_paths[url] = str(download_relative)
+        return download_path
+
+    def prefetch_plugins(self, remote_format, feed_elem, items):
+        """
+        Give enclosure plugins the matches for all the items before linking any.
+
+        The items are given with their enclosure archive paths as linked and must
+        already be richly parsed by `parse_items()`.  Only does the work of matching
+        when a plugin implements `prefetch`.
+        """
+        prefetch_plugins = [
+            enclosure_plugin
+            for enclosure_plugin in (
+                self.enclosure_plugins + self.enclosure_fallack_plugins
+            )
+            if "match-re" in enclosure_plugin.config
+            and type(enclosure_plugin).prefetch
+            is not enclosures.EnclosurePlugin.prefetch
+        ]
+        if not prefetch_plugins or not items:
+            return
+        plugin_matches = {enclosure_plugin: [] for enclosure_plugin in prefetch_plugins}
+        for item_elem, item_enclosure_paths in items:
+            feed_parsed, item_parsed = self.parse_item(
+                remote_format,
+                feed_elem,
+                item_elem,
+            )
+            for url_result, enclosure_path in item_enclosure_paths.items():
+                for enclosure_plugin, matches in plugin_matches.items():
+                    match = self.link_item_plugin_match(
+                        feed_elem=feed_elem,
+                        feed_parsed=feed_parsed,
+                        item_elem=item_elem,
+                        item_parsed=item_parsed,
+                        url_result=url_result,
+                        enclosure_path=enclosure_path,
+                        enclosure_plugin=enclosure_plugin,
+                    )
+                    if match is not None:
+                        matches.append(match)
+        for enclosure_plugin, matches in plugin_matches.items():
+            if not matches:  # pragma: no cover
+                continue
+            try:
+                enclosure_plugin.prefetch(matches)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception(
+                    "Problem prefetching with %r, continuing to linking: %r",
+                    type(enclosure_plugin),
+                    self.url,
+                )
+                if utils.POST_MORTEM:  # pragma: no cover
+                    pdb.post_mortem()
+
     def link_item_enclosures(
         self,
         remote_format,
@@ -641,8 +2127,7 @@ class ArchiveFeed:
             # parsing the item with `feedparser`.
             return link_paths
 
-        feed_parsed = utils.parse_item_feed(remote_format, feed_elem, item_elem)
-        (item_parsed,) = feed_parsed.entries
+        feed_parsed, item_parsed = self.parse_item(remote_format, feed_elem, item_elem)
         for (
             url_result,
             enclosure_path,
@@ -692,6 +2177,40 @@ class ArchiveFeed:
                     link_idx += 1
         return link_paths
 
+    def count_metric(self, name, value=1):
+        """
+        Add to one of this feed's metrics, safe to call from download worker threads.
+        """
+        with self.metrics_lock:
+            self.metrics[name] += value
+
+    def parse_items(self, feed_format, feed_elem, item_elems):
+        """
+        Richly parse all the items enclosure plugins are about to link at once.
+        """
+        self.items_parsed = {}
+        if item_elems and (self.enclosure_plugins or self.enclosure_fallack_plugins):
+            logger.debug("Richly parsing %s feed items: %r", len(item_elems), self.url)
+            self.items_parsed = utils.parse_items_feed(
+                feed_format,
+                feed_elem,
+                item_elems,
+            )
+
+    def parse_item(self, feed_format, feed_elem, item_elem):
+        """
+        Return the richly parsed feed of just the item and the parsed item.
+        """
+        item_id = feed_format.get_item_id(item_elem)
+        if item_id in self.items_parsed:
+            return self.items_parsed[item_id]
+        # Fallback to parsing the item by itself, such as when `feedparser` derives a
+        # different ID than the feed format
+        logger.debug("Richly parsing feed item by itself: %r", item_id)
+        item_feed_parsed = utils.parse_item_feed(feed_format, feed_elem, item_elem)
+        (item_parsed,) = item_feed_parsed.entries
+        return item_feed_parsed, item_parsed
+
     def list_plugin_enclosure_links(
         self,
         feed_elem,
@@ -708,9 +2227,17 @@ class ArchiveFeed:
         kwargs = {}
         match = None
         if "match-re" in enclosure_plugin.config:
-            match_kwargs = locals().copy()
-            del match_kwargs["self"]
-            match = self.link_item_plugin_match(**match_kwargs)
+            match = self.link_item_plugin_match(
+                feed_elem=feed_elem,
+                feed_parsed=feed_parsed,
+                item_elem=item_elem,
+                item_parsed=item_parsed,
+                url_result=url_result,
+                enclosure_path=enclosure_path,
+                enclosure_plugin=enclosure_plugin,
+                kwargs=kwargs,
+                match=match,
+            )
             if match is None:
                 return []
             kwargs.update(match.groupdict())
@@ -768,7 +2295,7 @@ class ArchiveFeed:
         kwargs["self"] = self
         try:
             match_string = eval(  # nosec B307, pylint: disable=eval-used
-                f"f{enclosure_plugin.config['match-string']!r}",
+                enclosure_plugin.config["match-code"],
                 globals(),
                 kwargs,
             )
@@ -850,6 +2377,7 @@ class ArchiveFeed:
             )
             link_path.parent.mkdir(parents=True, exist_ok=True)
             link_path.symlink_to(enclosure_link_target)
+            self.count_metric("links")
 
         url_result.getparent().attrib[
             f"{{{self.NAMESPACE}}}enclosure-link-{link_idx}"
@@ -857,6 +2385,27 @@ class ArchiveFeed:
         return link_path
 
 
+def send_update_step(update_steps, download_results):
+    """
+    Run the next step of an update and return whether it's done and its value.
+
+    The value is the URLs to download, or the results of the update once done.  Avoids
+    raising `StopIteration` from executor futures where it's not allowed.
+    """
+    try:
+        return False, update_steps.send(download_results)
+    except StopIteration as stop:
+        return True, stop.value
+
+
+def open_download(download_path):
+    """
+    Create the download's directory as needed and open the download file to write.
+    """
+    download_path.parent.mkdir(parents=True, exist_ok=True)
+    return download_path.open("wb")
+
+
 def update_download_metadata(download_response, download_path):
     """
     Reflect any metdata that can be extracted from the respons in the download file.
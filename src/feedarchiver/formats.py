@@ -7,6 +7,7 @@ Handle different feed XML formats.
 """
 
 import typing
+import functools
 import logging
 
 from lxml import etree  # nosec: B410
@@ -14,11 +15,23 @@ from lxml import etree  # nosec: B410
 logger = logging.getLogger(__name__)
 
 
+@functools.lru_cache(maxsize=None)
+def compile_xpath(xpath):
+    """
+    Compile an XPath, or the union of a sequence of XPaths, once per process.
+
+    Avoids re-parsing the same XPath strings for every element of every feed.
+    """
+    if not isinstance(xpath, str):
+        xpath = " | ".join(xpath)
+    return etree.XPath(xpath)
+
+
 def query_xpath(elem, xpath):
     """
     Return the XPath match raising or logging errors if not one.
     """
-    xpath_results = elem.xpath(xpath)
+    xpath_results = compile_xpath(xpath)(elem)
     if not xpath_results:  # pragma: no cover
         raise ValueError(f"Matched nothing for {elem.tag!r}: {xpath!r}")
     if len(xpath_results) != 1:  # pragma: no cover
@@ -35,7 +48,7 @@ def all_xpaths_results(elem, xpaths):
     """
     Return the results of all xpaths combined, IOW `OR`.
     """
-    return elem.xpath(" | ".join(xpaths))
+    return compile_xpath(tuple(xpaths))(elem)
 
 
 class FeedFormat:
@@ -52,10 +65,18 @@ class FeedFormat:
     DOWNLOAD_ENCLOSURE_TAGS = ["enclosure", "content"]
     DOWNLOAD_ENCLOSURE_EXPR = "@rel='enclosure'"
     DOWNLOAD_ATTR_NAMES = ["href", "url", "src"]
+    # Item elements `feedparser` reads publish, or last updated, dates from
+    ITEM_DATE_TAGS = ["pubDate", "published", "updated", "date", "issued", "modified"]
 
     # XPaths that differ between formats but can't be generalized from the above
     ITEMS_PARENT_XPATH = ""
     SELF_LINK_XPATH = "./*[local-name() = 'link' and @rel = 'self']"
+    LINK_XPATH = "./*[local-name() = 'link' and @rel = $rel]"
+
+    # Feed paging and archiving, RFC 5005, uses Atom links in all formats
+    ATOM_NAMESPACE = "http://www.w3.org/2005/Atom"
+    HISTORY_NAMESPACE = "http://purl.org/syndication/history/1.0"
+    NAMESPACE_PREFIXES = {ATOM_NAMESPACE: "atom", HISTORY_NAMESPACE: "fh"}
 
     # Map format-specific sub-classes to their corresponding root tag name.
     # Used to match a parsed feed XML tree to the corresponding format.
@@ -74,16 +95,20 @@ class FeedFormat:
 
         cls.ITEMS_XPATH = f"./*[local-name() = '{cls.ITEM_TAG}']"
         cls.ITEM_ID_XPATH = f"./*[local-name() = '{cls.ITEM_ID_TAG}']/text()"
+        item_date_tags_expr = " or ".join(
+            f"local-name() = '{item_date_tag}'" for item_date_tag in cls.ITEM_DATE_TAGS
+        )
+        cls.ITEM_DATES_XPATH = f"./*[{item_date_tags_expr}]"
 
         download_text_expr = cls.assemble_download_text_expr()
         download_attr_step = cls.assemble_download_attr_step()
         download_feed_prefix = (
             f"{cls.ITEMS_PARENT_XPATH}/*[not(local-name() = '{cls.ITEM_TAG}')"
         )
-        cls.DOWNLOAD_FEED_URLS_XPATHS = [
+        cls.DOWNLOAD_FEED_URLS_XPATHS = (
             f"{download_feed_prefix} and {download_text_expr}]/text()",
             f"{download_feed_prefix}]//{download_attr_step}",
-        ]
+        )
         download_enclosure_tags_expr = " or ".join(
             f"local-name()='{download_enclosure_tag}'"
             for download_enclosure_tag in cls.DOWNLOAD_ENCLOSURE_TAGS
@@ -91,13 +116,18 @@ class FeedFormat:
         download_enclosure_expr = (
             f"{download_enclosure_tags_expr} or {cls.DOWNLOAD_ENCLOSURE_EXPR}"
         )
-        cls.DOWNLOAD_ITEM_ASSET_URLS_XPATHS = [
+        cls.DOWNLOAD_ITEM_ASSET_URLS_XPATHS = (
             f".//*[{download_text_expr}]/text()",
             f".//*[not({download_enclosure_expr})]/{download_attr_step}",
-        ]
-        cls.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS = [
+        )
+        cls.DOWNLOAD_ITEM_ENCLOSURE_URLS_XPATHS = (
             f".//*[{download_enclosure_expr}]/{download_attr_step}",
-        ]
+        )
+
+        # Compile the XPaths, including the unions, out of the per-item hot path
+        for attr_name in dir(cls):
+            if attr_name.endswith("_XPATH") or attr_name.endswith("_XPATHS"):
+                compile_xpath(getattr(cls, attr_name))
 
         # Register this specific feed format by it's root element tag name
         cls.FEED_FORMATS[cls.ROOT_TAG] = cls
@@ -156,7 +186,13 @@ class FeedFormat:
         """
         Iterate over the feed items given a feed tree root element.
         """
-        return self.get_items_parent(feed_root).xpath(self.ITEMS_XPATH)
+        return compile_xpath(self.ITEMS_XPATH)(self.get_items_parent(feed_root))
+
+    def iter_item_dates(self, item_elem):
+        """
+        Iterate over the elements of a feed item that contain its dates.
+        """
+        return compile_xpath(self.ITEM_DATES_XPATH)(item_elem)
 
     def get_item_id(self, item_elem):
         """
@@ -169,6 +205,36 @@ class FeedFormat:
             raise ValueError(f"Empty feed item ID: {self.ITEM_ID_XPATH!r}")
         return item_id.strip()
 
+    def add_feed_elem(self, items_parent, namespace, tag):
+        """
+        Add a new feed-level element before the first item and return it.
+        """
+        feed_elem = items_parent.makeelement(
+            f"{{{namespace}}}{tag}",
+            nsmap=(
+                {}
+                if namespace in items_parent.nsmap.values()
+                else {self.NAMESPACE_PREFIXES[namespace]: namespace}
+            ),
+        )
+        item_elems = compile_xpath(self.ITEMS_XPATH)(items_parent)
+        if item_elems:
+            item_elems[0].addprevious(feed_elem)
+        else:
+            items_parent.append(feed_elem)
+        return feed_elem
+
+    def set_link(self, items_parent, rel, href):
+        """
+        Set the URL of the feed-level link with the relation, adding it if missing.
+        """
+        link_elems = compile_xpath(self.LINK_XPATH)(items_parent, rel=rel)
+        if not link_elems:
+            link_elems = [self.add_feed_elem(items_parent, self.ATOM_NAMESPACE, "link")]
+            link_elems[0].attrib["rel"] = rel
+        for link_elem in link_elems:
+            link_elem.attrib["href"] = href
+
     @classmethod
     def from_tree(cls, archive_feed, feed_tree):
         """
@@ -0,0 +1,241 @@
+# SPDX-FileCopyrightText: 2023 Ross Patterson <me@rpatterson.net>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Be polite to remote hosts by limiting concurrent requests and request rates.
+"""
+
+import time
+import datetime
+import threading
+import contextlib
+import urllib.parse
+import email.utils
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(retry_after):
+    """
+    Parse a `Retry-After` header value, either seconds or a date, into seconds.
+    """
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_datetime = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        logger.error("Could not parse `Retry-After` header: %r", retry_after)
+        return None
+    if retry_datetime.tzinfo is None:  # pragma: no cover
+        retry_datetime = retry_datetime.replace(tzinfo=datetime.timezone.utc)
+    return max(
+        0.0,
+        (retry_datetime - datetime.datetime.now(datetime.timezone.utc)).total_seconds(),
+    )
+
+
+class Host:  # pylint: disable=too-few-public-methods
+    """
+    The limits and state of requests to one remote host.
+    """
+
+    def __init__(self, netloc, max_connections, min_interval, max_retry_after):
+        """
+        Capture the limits for this host and initialize the request state.
+        """
+        self.netloc = netloc
+        self.max_connections = max_connections
+        self.min_interval = min_interval
+        self.max_retry_after = max_retry_after
+
+        self.semaphore = threading.BoundedSemaphore(max_connections)
+        # Initialized on first use from the async engine's event loop
+        self.async_semaphore = None
+        self.async_loop = None
+        # Guard the time of the next allowed request across threads
+        self.lock = threading.Lock()
+        self.next_request_time = 0.0
+
+    def reserve_delay(self):
+        """
+        Reserve the next request slot and return how long to wait until then.
+        """
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time)
+            self.next_request_time = request_time + self.min_interval
+        return request_time - now
+
+    def defer(self, delay):
+        """
+        Don't allow any requests to this host until the delay has passed.
+        """
+        with self.lock:
+            self.next_request_time = max(
+                self.next_request_time,
+                time.monotonic() + delay,
+            )
+
+
+class HostScheduler:
+    """
+    Limit concurrent requests and request rates per remote host.
+
+    Shared by all feeds in an archive so that limits apply across feeds hosted by the
+    same server, such as a podcast network's media server or CDN.
+    """
+
+    # Defaults for all hosts not otherwise configured
+    MAX_CONNECTIONS = 6
+    MIN_INTERVAL = 0.0
+    # Retry a request this many times when the host responds with `Retry-After`
+    RETRY_ATTEMPTS = 3
+    # Fail the request instead when the host asks to wait longer than this in seconds
+    MAX_RETRY_AFTER = 300.0
+    RETRY_STATUS_CODES = {429, 503}
+
+    def __init__(self, config):
+        """
+        Validate the default and per-host limits from the archive configuration.
+        """
+        self.max_connections = self.validate_limit(
+            "max-host-connections",
+            config.get("max-host-connections", self.MAX_CONNECTIONS),
+            int,
+            1,
+        )
+        self.min_interval = self.validate_limit(
+            "min-host-interval",
+            config.get("min-host-interval", self.MIN_INTERVAL),
+            (int, float),
+            0,
+        )
+        self.max_retry_after = self.validate_limit(
+            "max-retry-after",
+            config.get("max-retry-after", self.MAX_RETRY_AFTER),
+            (int, float),
+            0,
+        )
+        self.host_configs = config.get("hosts", {})
+        if not isinstance(self.host_configs, dict):  # pragma: no cover
+            raise ValueError(
+                f"`hosts` must be an object/mapping: {self.host_configs!r}",
+            )
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def validate_limit(name, value, types, minimum):
+        """
+        Ensure a configured limit is a number no less than the minimum.
+        """
+        if isinstance(value, bool) or not isinstance(value, types) or value < minimum:
+            raise ValueError(
+                f"`{name}` must be a number no less than {minimum}: {value!r}",
+            )
+        return value
+
+    def get_host(self, url):
+        """
+        Return the limits and state for the host of the URL, creating as needed.
+        """
+        netloc = urllib.parse.urlsplit(url).netloc
+        with self.lock:
+            if netloc not in self.hosts:
+                host_config = self.host_configs.get(netloc, {})
+                self.hosts[netloc] = Host(
+                    netloc,
+                    max_connections=self.validate_limit(
+                        "max-host-connections",
+                        host_config.get("max-host-connections", self.max_connections),
+                        int,
+                        1,
+                    ),
+                    min_interval=self.validate_limit(
+                        "min-host-interval",
+                        host_config.get("min-host-interval", self.min_interval),
+                        (int, float),
+                        0,
+                    ),
+                    max_retry_after=self.validate_limit(
+                        "max-retry-after",
+                        host_config.get("max-retry-after", self.max_retry_after),
+                        (int, float),
+                        0,
+                    ),
+                )
+            return self.hosts[netloc]
+
+    @contextlib.contextmanager
+    def limit(self, url):
+        """
+        Wait for a connection to the URL's host to be available and polite to make.
+        """
+        host = self.get_host(url)
+        with host.semaphore:
+            delay = host.reserve_delay()
+            if delay > 0:
+                logger.debug("Waiting %.2fs to request from %r", delay, host.netloc)
+                time.sleep(delay)
+            yield host
+
+    @contextlib.asynccontextmanager
+    async def limit_async(self, url):
+        """
+        Wait for a polite connection to the URL's host from the engine event loop.
+        """
+        host = self.get_host(url)
+        loop = asyncio.get_running_loop()
+        if host.async_loop is not loop:
+            host.async_semaphore = asyncio.Semaphore(host.max_connections)
+            host.async_loop = loop
+        async with host.async_semaphore:
+            delay = host.reserve_delay()
+            if delay > 0:
+                logger.debug("Waiting %.2fs to request from %r", delay, host.netloc)
+                await asyncio.sleep(delay)
+            yield host
+
+    def is_throttled(self, url, response, attempt):
+        """
+        Return true if the host asked us to retry the request later.
+
+        Also defer all requests to the host by the `Retry-After` header value.  Raise
+        the HTTP status error if the request has already been attempted too many times
+        or if the host asks to wait longer than its `max-retry-after` so that the feed
+        item is retried on the next update.
+        """
+        if (
+            response.status_code not in self.RETRY_STATUS_CODES
+            or "Retry-After" not in response.headers
+        ):
+            return False
+        delay = parse_retry_after(response.headers["Retry-After"])
+        if delay is None:  # pragma: no cover
+            response.raise_for_status()
+        host = self.get_host(url)
+        if delay > host.max_retry_after:
+            # Waiting would hold up all other requests to the host
+            logger.warning(
+                "Host %r asked to retry in %.2fs, more than %.2fs: %r",
+                host.netloc,
+                delay,
+                host.max_retry_after,
+                url,
+            )
+            response.raise_for_status()
+        host.defer(delay)
+        if attempt >= self.RETRY_ATTEMPTS:
+            response.raise_for_status()
+        logger.warning(
+            "Host %r asked to retry in %.2fs: %r",
+            host.netloc,
+            delay,
+            url,
+        )
+        return True
@@ -21,6 +21,8 @@ import requests_mock
 
 from .. import utils
 from .. import archive
+from .. import feed
+from ..enclosures import servarr
 from ..utils import mimetypes
 
 
@@ -262,7 +264,11 @@ def walk_archive(archive_root_path):
         for archive_basename in files:
             if (
                 archive_basename.endswith("~")
+                or archive_basename.endswith(feed.ArchiveFeed.STATE_SUFFIX)
+                or archive_basename == servarr.SonarrEnclosurePlugin.CACHE_BASENAME
                 or archive_basename == archive.Archive.FEED_CONFIGS_BASENAME
+                or pathlib.Path(archive_basename).suffix
+                in utils.PRECOMPRESS_SUFFIXES.values()
             ):  # pragma: no cover
                 continue
             archive_path = root_path / archive_basename
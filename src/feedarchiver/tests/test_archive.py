@@ -7,6 +7,9 @@ Test the feed-archiver representation of an archive of syndication feeeds.
 """
 
 import typing
+import pathlib
+import tempfile
+import logging
 import unittest
 from unittest import mock
 
@@ -80,6 +83,45 @@ class FeedarchiverArchiveTests(tests.FeedarchiverTestCase):
             "Archive updated feed items not empty",
         )
 
+    @mock.patch("feedarchiver.feed.ArchiveFeed")
+    def test_feeds_updated_concurrently(self, mock_feed_class):
+        """
+        Feeds may be updated at once in a pool of workers.
+        """
+        mock_update_method = mock_feed_class.return_value.update
+        mock_update_method.side_effect = [
+            self.UPDATE_RETURN_VALUE,
+            ValueError("Problem updating feed"),
+        ]
+        self.archive.jobs = 2
+        self.archive.load_config()
+        mock_feed_class.return_value.config = mock_feed_class.mock_calls[0][2]["config"]
+        mock_feed_class.return_value.path = self.feed_path
+        mock_feed_class.return_value.url = self.feed_url
+
+        with self.assertLogs(archive.logger, level=logging.ERROR) as logged_msgs:
+            updated_feeds = self.archive.update()
+
+        self.assertEqual(
+            mock_update_method.call_count,
+            2,
+            "Wrong number of archive feeds updates",
+        )
+        self.assertEqual(
+            len(logged_msgs.records),
+            1,
+            "Wrong number of feed exceptions logged",
+        )
+        self.assertEqual(
+            updated_feeds,
+            {self.feed_url: self.UPDATE_RETURN_VALUE},
+            "Wrong archive updates from concurrent feed updates",
+        )
+        self.assertTrue(
+            (self.archive.root_path / self.archive.INDEX_BASENAME).is_file(),
+            "Archive HTML index not written after concurrent feed updates",
+        )
+
 
 class FeedarchiverInvalidArchiveTests(unittest.TestCase):
     """
@@ -93,6 +135,26 @@ class FeedarchiverInvalidArchiveTests(unittest.TestCase):
         with self.assertRaises(ValueError, msg="Wrong empty config error"):
             archive.Archive(tests.FeedarchiverTestCase.ARCHIVES_PATH / "empty")
 
+    def test_archive_invalid_jobs(self):
+        """
+        An archive with an invalid number of jobs raises a helpful error.
+        """
+        with self.assertRaises(ValueError, msg="Wrong invalid jobs error"):
+            archive.Archive(
+                tests.FeedarchiverTestCase.ARCHIVES_PATH / "simple",
+                jobs=0,
+            )
+
+    def test_archive_invalid_engine(self):
+        """
+        An archive with an unknown engine raises a helpful error.
+        """
+        with self.assertRaises(ValueError, msg="Wrong invalid engine error"):
+            archive.Archive(
+                tests.FeedarchiverTestCase.ARCHIVES_PATH / "simple",
+                engine="foo",
+            )
+
     def test_archive_wo_feeds(self):
         """
         An archive with no feeds configured raises a helpful error.
@@ -102,3 +164,82 @@ class FeedarchiverInvalidArchiveTests(unittest.TestCase):
         )
         with self.assertRaises(ValueError, msg="Wrong empty feeds error"):
             feed_archive.load_config()
+
+    def test_archive_profile_sample(self):
+        """
+        Only the given fraction of runs are profiled.
+        """
+        with self.assertRaises(ValueError, msg="Wrong invalid profile sample error"):
+            archive.Archive(
+                tests.FeedarchiverTestCase.ARCHIVES_PATH / "simple",
+                profile_dir="profile",
+                profile_sample=0,
+            )
+        with mock.patch("random.random", return_value=0.5):
+            self.assertFalse(
+                archive.Archive(
+                    tests.FeedarchiverTestCase.ARCHIVES_PATH / "simple",
+                    profile_dir="profile",
+                    profile_sample=0.25,
+                ).is_profiled(),
+                "Run profiled outside the sample",
+            )
+            self.assertTrue(
+                archive.Archive(
+                    tests.FeedarchiverTestCase.ARCHIVES_PATH / "simple",
+                    profile_dir="profile",
+                    profile_sample=0.75,
+                ).is_profiled(),
+                "Run not profiled inside the sample",
+            )
+
+    def test_archive_invalid_precompress(self):
+        """
+        An unknown precompressed sidecar encoding raises a helpful error.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = pathlib.Path(tmp_dir)
+            (archive_path / archive.Archive.FEED_CONFIGS_BASENAME).write_text(
+                (
+                    tests.FeedarchiverTestCase.ARCHIVES_PATH
+                    / "simple"
+                    / archive.Archive.FEED_CONFIGS_BASENAME
+                )
+                .read_text()
+                .replace("defaults:\n", 'defaults:\n  precompress: ["zstd"]\n', 1),
+            )
+            feed_archive = archive.Archive(archive_path)
+            with self.assertRaises(ValueError, msg="Wrong invalid precompress error"):
+                feed_archive.load_config()
+
+    def test_archive_invalid_download_concurrency(self):
+        """
+        A download concurrency that isn't a positive integer raises a helpful error.
+        """
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_path = pathlib.Path(tmp_dir)
+            (archive_path / archive.Archive.FEED_CONFIGS_BASENAME).write_text(
+                (
+                    tests.FeedarchiverTestCase.ARCHIVES_PATH
+                    / "simple"
+                    / archive.Archive.FEED_CONFIGS_BASENAME
+                )
+                .read_text()
+                .replace("defaults:\n", "defaults:\n  download-concurrency: 0\n", 1),
+            )
+            feed_archive = archive.Archive(archive_path)
+            with self.assertRaises(
+                ValueError,
+                msg="Wrong invalid download concurrency error",
+            ):
+                feed_archive.load_config()
+
+    def test_archive_daemon_invalid_config(self):
+        """
+        The daemon raises a helpful error if the initial configuration is invalid.
+        """
+        feed_archive = archive.Archive(
+            tests.FeedarchiverTestCase.ARCHIVES_PATH / "empty-feeds",
+        )
+        with self.assertRaises(ValueError, msg="Wrong daemon invalid config error"):
+            feed_archive.daemon()
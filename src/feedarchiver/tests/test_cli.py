@@ -9,14 +9,17 @@ Test the feed-archiver Command-Line Interface.
 import sys
 import os
 import io
+import json
 import runpy
 import subprocess  # nosec B404
 import contextlib
 import pathlib
+from unittest import mock
 
 
 import feedarchiver
 
+from .. import archive
 from .. import tests
 
 
@@ -25,6 +28,20 @@ class FeedarchiverCLITests(tests.FeedarchiverTestCase):
     Test the feed-archiver Command-Line Interface.
     """
 
+    # Dependencies that should only be imported when a sub-command actually runs
+    STARTUP_HEAVY_MODULES = {
+        "feedarchiver.archive",
+        "feedarchiver.utils",
+        "httpx",
+        "yaml",
+        "user_agent",
+        "lxml",
+        "feedparser",
+        "arrapi",
+        "tenacity",
+        "pdb",
+    }
+
     def test_importable(self):
         """
         The Python package is on `sys.path` and thus importable.
@@ -39,6 +56,46 @@ class FeedarchiverCLITests(tests.FeedarchiverTestCase):
             "The Python package not importable",
         )
 
+    def test_import_startup(self):
+        """
+        Importing the package and parsing the CLI doesn't import heavy dependencies.
+
+        Shell tab completion imports the package on every TAB press so anything
+        imported at module load slows down completion and `--help`.
+        """
+        import_process = subprocess.run(  # nosec B603
+            [
+                sys.executable,
+                "-c",
+                "import sys, json, feedarchiver; "
+                "feedarchiver.parser.parse_args(['update']); "
+                "print(json.dumps(sorted(sys.modules)))",
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        imported_modules = set(json.loads(import_process.stdout))
+        self.assertFalse(
+            imported_modules & self.STARTUP_HEAVY_MODULES,
+            "Heavy dependencies imported on startup",
+        )
+
+    def test_engine_choices(self):
+        """
+        The CLI `--engine` choices match those the archive supports.
+        """
+        (engine_action,) = [
+            action
+            for action in feedarchiver.parser_update._actions  # pylint: disable=W0212
+            if action.dest == "engine"
+        ]
+        self.assertEqual(
+            tuple(engine_action.choices),
+            archive.Archive.ENGINES,
+            "CLI `--engine` choices out of sync with the archive",
+        )
+
     def get_cli_error_messages(self, args):
         """
         Run the CLI script and return any error messages.
@@ -78,6 +135,26 @@ class FeedarchiverCLITests(tests.FeedarchiverTestCase):
         finally:
             os.chdir(cwd)
 
+    def test_cli_daemon(self):
+        """
+        The command line supports running as a daemon.
+        """
+        with mock.patch.object(
+            archive.Archive,
+            "daemon",
+            return_value=None,
+        ) as daemon_mock:
+            feedarchiver.main(
+                args=[
+                    "--archive-dir",
+                    str(self.archive.root_path),
+                    "daemon",
+                    "-j",
+                    "2",
+                ],
+            )
+        daemon_mock.assert_called_once_with()
+
     def test_cli_option_errors(self):
         """
         The command line script displays useful messages for invalid option values.
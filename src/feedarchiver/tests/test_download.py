@@ -7,14 +7,27 @@ Test the feed-archiver downloading of enclosures, assets, etc..
 """
 
 import os
+import gzip
+import time
 import datetime
+import threading
+import logging
 import pathlib
+import tempfile
+import pstats
 import urllib
+from unittest import mock
 
 from lxml import etree  # nosec: B410
+import httpx
 import respx.models
+import yaml
 
 from .. import utils
+from .. import formats
+from .. import enclosures
+from .. import archive
+from .. import feed
 from .. import tests
 
 
@@ -95,6 +108,248 @@ class FeedarchiverDownloadTests(tests.FeedarchiverDownloadsTestCase):
             self.archive.root_path / self.ENCLOSURE_RELATIVE.with_suffix(".mp3"),
         )
 
+    def test_downloads_skip_requests(self):
+        """
+        URLs already downloaded into the archive are not requested again.
+        """
+        orig_request_mocks = self.mock_remote(self.archive_feed)
+        self.archive_feed.update()
+        enclosure_archive_path = (
+            self.archive.root_path / self.ENCLOSURE_RELATIVE.with_suffix(".mp3")
+        )
+        _, enclosure_request_mock = orig_request_mocks[self.ENCLOSURE_URL]
+        _, image_request_mock = orig_request_mocks[
+            "https://foo.example.com/podcast/image.png"
+        ]
+        self.assertEqual(
+            enclosure_request_mock.call_count,
+            1,
+            "Wrong number of enclosure requests",
+        )
+
+        # Known URLs are looked up in the feed state
+        self.archive_feed.path.unlink()
+        self.archive_feed.update()
+        self.assertEqual(
+            (enclosure_request_mock.call_count, image_request_mock.call_count),
+            (1, 1),
+            "Known URLs requested again",
+        )
+
+        # Without state, use the path derived from the URL or from a `HEAD` request
+        head_request_mock = self.client_mock.head(self.ENCLOSURE_URL).respond(
+            headers={"Content-Type": "audio/mpeg"},
+        )
+        self.archive_feed.get_state_path().unlink()
+        self.archive_feed.path.unlink()
+        self.archive_feed.update()
+        self.assertEqual(
+            (enclosure_request_mock.call_count, image_request_mock.call_count),
+            (1, 1),
+            "Downloaded URLs requested again without feed state",
+        )
+        self.assertEqual(
+            head_request_mock.call_count,
+            1,
+            "Wrong number of `HEAD` requests for URL without a suffix",
+        )
+        self.assertEqual(
+            self.archive_feed.download_paths[self.ENCLOSURE_URL],
+            str(enclosure_archive_path.relative_to(self.archive.root_path)),
+            "Wrong recorded download archive path",
+        )
+
+        # Fallback to the `GET` request if the `HEAD` response is different
+        head_request_mock.respond(headers={"Content-Type": "text/html"})
+        self.archive_feed.get_state_path().unlink()
+        self.archive_feed.path.unlink()
+        self.archive_feed.update()
+        self.assertEqual(
+            (enclosure_request_mock.call_count, image_request_mock.call_count),
+            (2, 1),
+            "Wrong number of requests when `HEAD` response is different",
+        )
+        self.assertTrue(
+            enclosure_archive_path.is_file(),
+            "Archived download missing after fallback request",
+        )
+
+    def test_downloads_checkpoint_items(self):
+        """
+        The archived feed is written once per update unless checkpoints are configured.
+        """
+        self.mock_remote(self.archive_feed)
+        with mock.patch.object(
+            self.archive_feed,
+            "write_archive_tree",
+            wraps=self.archive_feed.write_archive_tree,
+        ) as write_mock:
+            updated_items, _ = self.archive_feed.update()
+        self.assertGreater(len(updated_items), 1, "Too few items to test checkpoints")
+        self.assertEqual(
+            write_mock.call_count,
+            # Once to initialize the archived feed and once for all added items
+            2,
+            "Wrong number of archived feed writes",
+        )
+        self.assertEqual(
+            [tmp_path.name for tmp_path in self.archive_feed.path.parent.glob("*~")],
+            [],
+            "Temporary archived feed file left behind",
+        )
+
+        # Write the archived feed after every other item
+        self.archive_feed.path.unlink()
+        self.archive_feed.checkpoint_items = 2
+        with mock.patch.object(
+            self.archive_feed,
+            "write_archive_tree",
+            wraps=self.archive_feed.write_archive_tree,
+        ) as write_mock:
+            updated_items, _ = self.archive_feed.update()
+        self.assertEqual(
+            write_mock.call_count,
+            1 + -(-len(updated_items) // 2),
+            "Wrong number of archived feed checkpoint writes",
+        )
+
+    def test_downloads_concurrency(self):
+        """
+        A feed's downloads are requested at once up to its download concurrency.
+        """
+        self.mock_remote(self.archive_feed)
+        in_flight = []
+        max_in_flight = []
+        in_flight_lock = threading.Lock()
+        orig_download_url = self.archive_feed.download_url
+
+        def download_url(url_result):
+            """
+            Record how many downloads are in flight at once.
+            """
+            with in_flight_lock:
+                in_flight.append(url_result)
+                max_in_flight.append(len(in_flight))
+            try:
+                # Give the other downloads a chance to start
+                time.sleep(0.05)
+                return orig_download_url(url_result)
+            finally:
+                with in_flight_lock:
+                    in_flight.remove(url_result)
+
+        for download_concurrency in (1, 2):
+            with self.subTest(
+                msg="Test one download concurrency",
+                download_concurrency=download_concurrency,
+            ):
+                max_in_flight.clear()
+                if self.archive_feed.path is not None:
+                    self.archive_feed.path.unlink()
+                self.archive_feed.download_concurrency = download_concurrency
+                with mock.patch.object(
+                    self.archive_feed,
+                    "download_url",
+                    side_effect=download_url,
+                ):
+                    self.archive_feed.update()
+                self.assertGreater(
+                    len(max_in_flight),
+                    download_concurrency,
+                    "Too few downloads to test concurrency",
+                )
+                self.assertEqual(
+                    max(max_in_flight),
+                    download_concurrency,
+                    "Wrong number of downloads in flight at once",
+                )
+
+    def test_downloads_partial_failure(self):
+        """
+        A failed download leaves all an item's URLs unchanged and re-raises the error.
+        """
+        self.mock_remote(self.archive_feed)
+        self.client_mock.head(self.ENCLOSURE_URL).respond(405)
+        self.client_mock.get(self.ENCLOSURE_URL).mock(side_effect=httpx.ConnectError)
+        remote_tree = etree.parse(  # nosec: B320
+            str(
+                self.REMOTES_PATH
+                / self.EXAMPLE_RELATIVE
+                / self.REMOTE_MOCK
+                / self.FEED_ARCHIVE_RELATIVE
+            ),
+            parser=utils.XML_PARSER,
+        )
+        remote_format = formats.FeedFormat.from_tree(self.archive_feed, remote_tree)
+        (remote_item_elem,) = remote_tree.xpath(
+            f'.//item[enclosure/@url="{self.ENCLOSURE_URL}"]',
+        )
+        orig_item_bytes = etree.tostring(remote_item_elem)
+        item_asset_urls, item_enclosure_urls = self.archive_feed.list_item_urls(
+            remote_format,
+            remote_item_elem,
+        )
+        url_results = item_asset_urls + item_enclosure_urls
+        download_results = self.archive_feed.download_urls_concurrently(
+            self.archive_feed.get_unique_urls(url_results),
+        )
+        self.assertTrue(
+            [
+                download_result
+                for download_result in download_results.values()
+                if isinstance(download_result, pathlib.Path)
+            ],
+            "No successful downloads to test partial failure",
+        )
+
+        with self.assertRaises(
+            Exception,
+            msg="Partial download failure not re-raised",
+        ) as exc_context:
+            self.archive_feed.update_downloaded_urls(url_results, download_results)
+        self.assertIs(
+            exc_context.exception,
+            download_results[self.ENCLOSURE_URL],
+            "Wrong partial download failure exception",
+        )
+        self.assertEqual(
+            etree.tostring(remote_item_elem),
+            orig_item_bytes,
+            "Item URLs re-written despite a failed download",
+        )
+
+    def test_downloads_retry_precompressed(self):
+        """
+        Sidecars are written again when retrying items adds them to the archived feed.
+        """
+        self.archive.precompress_encodings = ["gzip"]
+        self.mock_remote(self.archive_feed)
+        self.client_mock.head(self.ENCLOSURE_URL).respond(405)
+        self.client_mock.get(self.ENCLOSURE_URL).mock(side_effect=httpx.ConnectError)
+        with self.assertLogs(feed.logger, level=logging.ERROR):
+            self.archive_feed.update()
+        feed_mtime = self.feed_path.stat().st_mtime_ns
+        failed_feed_bytes = self.feed_path.read_bytes()
+
+        # Retry against the unchanged remote feed
+        self.mock_remote(self.archive_feed)
+        self.archive_feed.update()
+        self.assertEqual(
+            self.feed_path.stat().st_mtime_ns,
+            feed_mtime,
+            "Retried archived feed not given the unchanged remote feed's time",
+        )
+        self.assertNotEqual(
+            self.feed_path.read_bytes(),
+            failed_feed_bytes,
+            "Retried item not added to the archived feed",
+        )
+        self.assertEqual(
+            gzip.decompress(self.feed_path.with_suffix(".rss.gz").read_bytes()),
+            self.feed_path.read_bytes(),
+            "Stale gzip sidecar of retried archived feed",
+        )
+
     def test_downloads(self):  # pylint: disable=too-many-locals
         """
         All files in the archive after update correspond to the fixture.
@@ -277,3 +532,387 @@ class FeedarchiverDownloadTests(tests.FeedarchiverDownloadsTestCase):
                         1,
                         "Request made for already archived download",
                     )
+
+    def test_downloads_async_engine(self):
+        """
+        The async engine downloads everything to the same archive paths.
+        """
+        orig_request_mocks = self.mock_remote(self.archive_feed)
+        self.archive.engine = "async"
+        profile_dir = tempfile.TemporaryDirectory(  # pylint: disable=R1732
+            suffix=".pstats",
+        )
+        self.addCleanup(profile_dir.cleanup)
+        self.archive.profile_dir = pathlib.Path(profile_dir.name)
+        self.archive.update()
+        self.archive.profile_dir = None
+
+        # Work in the worker threads is in the feed's profile statistics
+        ((feed_stats_path,),) = (
+            list((run_path / self.archive.PROFILE_FEEDS_DIRNAME).iterdir())
+            for run_path in pathlib.Path(profile_dir.name).iterdir()
+        )
+        feed_functions = {
+            function_name
+            for _, _, function_name in pstats.Stats(str(feed_stats_path)).stats
+        }
+        self.assertLessEqual(
+            {"parse_queued", "send_update_step", "update_download_metadata"},
+            feed_functions,
+            "Worker threads missing from the async engine feed profile statistics",
+        )
+
+        remote_mock_path = self.REMOTES_PATH / self.EXAMPLE_RELATIVE / "orig"
+        archive_feed = self.archive.archive_feeds[0]
+        for archive_path, archive_relative in tests.walk_archive(
+            self.archive.root_path,
+        ):
+            if archive_path.name == self.archive.INDEX_BASENAME and (
+                archive_path.parent == self.archive.root_path
+            ):
+                continue
+            with self.subTest(
+                msg="Test one feed download",
+                archive_relative=str(archive_relative),
+            ):
+                download_url, mock_path = self.archive_relative_to_remote_url(
+                    archive_relative,
+                    remote_mock_path,
+                )
+                self.assertIn(
+                    download_url,
+                    orig_request_mocks,
+                    "No mock registered for download request",
+                )
+                _, download_request_mock = orig_request_mocks[download_url]
+                self.assertEqual(
+                    download_request_mock.call_count,
+                    1,
+                    f"Wrong number of requests: {download_url!r}",
+                )
+                if archive_path != archive_feed.path:
+                    self.assertEqual(
+                        archive_path.read_bytes(),
+                        mock_path.read_bytes(),
+                        "Different archived download content from remote",
+                    )
+        self.assertEqual(
+            archive_feed.path,
+            self.archive.root_path / self.FEED_ARCHIVE_RELATIVE,
+            "Wrong archive feed path from async engine",
+        )
+        self.assertIsNone(
+            self.archive.loop,
+            "Async engine event loop not cleaned up",
+        )
+
+        # Re-process all items with existing downloads in the archive
+        archive_feed.path.unlink()
+        self.archive.update()
+        self.assertTrue(
+            archive_feed.path.is_file(),
+            "Archive feed not re-written by async engine",
+        )
+
+        # Fallback to the `GET` request if the `HEAD` request isn't supported
+        head_request_mock = self.client_mock.head(self.ENCLOSURE_URL).respond(405)
+        archive_feed.get_state_path().unlink()
+        archive_feed.path.unlink()
+        self.archive.update()
+        self.assertEqual(
+            head_request_mock.call_count,
+            1,
+            "Wrong number of `HEAD` requests from async engine",
+        )
+        _, enclosure_request_mock = orig_request_mocks[self.ENCLOSURE_URL]
+        self.assertEqual(
+            enclosure_request_mock.call_count,
+            2,
+            "Wrong number of requests when `HEAD` isn't supported by async engine",
+        )
+
+        # Sub-commands without an `async` variant run in the worker threads
+        self.archive.relink()
+        self.assertEqual(
+            self.archive.archive_feeds[0].path,
+            self.archive.root_path / self.FEED_ARCHIVE_RELATIVE,
+            "Archive feed not re-linked by async engine",
+        )
+
+    def test_downloads_profile(self):
+        """
+        Profiling writes statistics for each feed and for the whole run.
+        """
+        self.mock_remote(self.archive_feed)
+        profile_dir = tempfile.TemporaryDirectory(  # pylint: disable=R1732
+            suffix=".pstats",
+        )
+        self.addCleanup(profile_dir.cleanup)
+        self.archive.profile_dir = pathlib.Path(profile_dir.name)
+        self.archive.update()
+        # Also profile feeds processed in worker threads
+        self.archive.jobs = 2
+        self.archive.relink()
+
+        run_paths = {
+            run_path.name.rsplit("-", 1)[-1]: run_path
+            for run_path in self.archive.profile_dir.iterdir()
+        }
+        self.assertEqual(
+            sorted(run_paths),
+            ["relink", "update"],
+            "Wrong profiled run directories",
+        )
+        for command, run_path in run_paths.items():
+            with self.subTest(msg="Test one profiled run", command=command):
+                (feed_stats_path,) = (
+                    run_path / self.archive.PROFILE_FEEDS_DIRNAME
+                ).iterdir()
+                self.assertEqual(
+                    feed_stats_path.stem,
+                    utils.quote_basename(self.archive_feed.url),
+                    "Wrong feed profile statistics file name",
+                )
+                feed_functions = {
+                    function_name
+                    for _, _, function_name in pstats.Stats(
+                        str(feed_stats_path),
+                    ).stats
+                }
+                self.assertIn(
+                    command,
+                    feed_functions,
+                    "Feed sub-command missing from the feed profile statistics",
+                )
+                if command == "update":
+                    self.assertIn(
+                        "download_url",
+                        feed_functions,
+                        "Download workers missing from the feed profile statistics",
+                    )
+                run_functions = {
+                    function_name
+                    for _, _, function_name in pstats.Stats(
+                        str(run_path / self.archive.PROFILE_RUN_BASENAME),
+                    ).stats
+                }
+                self.assertIn(
+                    "load_config",
+                    run_functions,
+                    "Loading the configuration missing from the run statistics",
+                )
+                self.assertLessEqual(
+                    feed_functions,
+                    run_functions,
+                    "Feed profile statistics missing from the run statistics",
+                )
+        self.assertIsNone(self.archive.profiler, "Run profiler not cleaned up")
+
+        # Runs started within the same second don't share a directory
+        with mock.patch("time.strftime", return_value="20230101T000000"):
+            profile_paths = {self.archive.make_profile_path("update") for _ in range(3)}
+        self.assertEqual(
+            len(profile_paths),
+            3,
+            "Runs started within the same second share a profile directory",
+        )
+
+        # Feeds that fail before any step of the update are still profiled
+        self.archive.engine = "async"
+        self.client_mock.get(self.archive_feed.url).mock(
+            side_effect=httpx.ConnectError("Connection refused"),
+        )
+        with mock.patch("time.strftime", return_value="20230102T000000"):
+            self.archive.update()
+        self.assertTrue(
+            (
+                self.archive.profile_dir
+                / "20230102T000000-update"
+                / self.archive.PROFILE_RUN_BASENAME
+            ).is_file(),
+            "Run profile statistics missing when a feed fails",
+        )
+
+    def test_downloads_metrics(self):
+        """
+        Each run writes metrics for the whole run and each feed when configured.
+        """
+        self.mock_remote(self.archive_feed)
+        archive_config = yaml.safe_load(self.archive.config_path.read_text())
+        archive_config["defaults"]["metrics-dir"] = "metrics"
+        self.archive.config_path.write_text(yaml.safe_dump(archive_config))
+        self.archive.update()
+
+        metrics_path = self.archive.root_path / "metrics" / "feed-archiver-update.prom"
+        metrics = {}
+        for metrics_line in metrics_path.read_text().splitlines():
+            if metrics_line.startswith("#"):
+                continue
+            metric_sample, metric_value = metrics_line.rsplit(" ", 1)
+            metrics[metric_sample] = float(metric_value)
+        feed_labels = archive.format_metric_labels(
+            command="update",
+            feed=self.archive_feed.url,
+        )
+        self.assertIn(
+            'feed_archiver_run_duration_seconds{command="update"}',
+            metrics,
+            "Run duration missing from metrics",
+        )
+        self.assertEqual(
+            {
+                metric_name: metrics[f"feed_archiver_feed_{metric_name}{feed_labels}"]
+                for metric_name in ("success", "new_items", "download_errors")
+            },
+            {"success": 1, "new_items": 4, "download_errors": 1},
+            "Wrong feed metrics",
+        )
+        for metric_name in (
+            "duration_seconds",
+            "fetch_seconds",
+            "parse_seconds",
+            "download_bytes",
+            "links",
+        ):
+            with self.subTest(msg="Test one measured feed metric", name=metric_name):
+                self.assertGreater(
+                    metrics[f"feed_archiver_feed_{metric_name}{feed_labels}"],
+                    0,
+                    "Feed metric not measured",
+                )
+
+    def wait_for(self, condition, msg):
+        """
+        Wait for the condition to become true in the daemon's threads.
+        """
+        deadline = time.monotonic() + 10
+        while not condition():
+            if time.monotonic() > deadline:  # pragma: no cover
+                self.fail(msg)
+            time.sleep(0.01)
+
+    def test_downloads_daemon(self):
+        """
+        The daemon updates each feed on its interval and reloads a changed config.
+        """
+        request_mocks = self.mock_remote(self.archive_feed)
+        _, feed_request_mock = request_mocks[self.archive_feed.url]
+        archive_config = yaml.safe_load(self.archive.config_path.read_text())
+        archive_config["feeds"][0]["update-interval"] = 0.05
+        self.archive.config_path.write_text(yaml.safe_dump(archive_config))
+        self.archive.DAEMON_POLL_INTERVAL = 0.01
+        daemon_thread = threading.Thread(target=self.archive.daemon)
+        daemon_thread.start()
+        self.addCleanup(daemon_thread.join, 10)
+        self.addCleanup(self.archive.daemon_stop.set)
+
+        self.wait_for(
+            lambda: feed_request_mock.call_count >= 2,
+            "Feed not updated again after the update interval",
+        )
+        self.assertTrue(
+            (self.archive.root_path / self.archive.INDEX_BASENAME).is_file(),
+            "Archive HTML index not written by the daemon",
+        )
+        # Each feed update is profiled as a run of its own
+        profile_dir = tempfile.TemporaryDirectory(  # pylint: disable=R1732
+            suffix=".pstats",
+        )
+        self.addCleanup(profile_dir.cleanup)
+        self.archive.profile_dir = pathlib.Path(profile_dir.name)
+        self.wait_for(
+            lambda: len(
+                list(
+                    self.archive.profile_dir.glob(
+                        f"*/{self.archive.PROFILE_RUN_BASENAME}",
+                    ),
+                ),
+            )
+            >= 2,
+            "Daemon feed updates not profiled as separate runs",
+        )
+        for run_stats_path in self.archive.profile_dir.glob(
+            f"*/{self.archive.PROFILE_RUN_BASENAME}",
+        ):
+            self.assertTrue(
+                (
+                    run_stats_path.parent
+                    / self.archive.PROFILE_FEEDS_DIRNAME
+                    / f"{utils.quote_basename(self.archive_feed.url)}.pstats"
+                ).is_file(),
+                "Feed profile statistics missing for a daemon feed update",
+            )
+
+        # Problems with a changed config are logged and the daemon continues
+        orig_global_config = self.archive.global_config
+        orig_host_scheduler = self.archive.host_scheduler
+        orig_archive_feeds = self.archive.archive_feeds
+        orig_plugins = dict(enclosures.PLUGINS)
+        config_stat = self.archive.config_path.stat()
+        archive_config["feeds"][0]["update-interval"] = "1h"
+        self.archive.config_path.write_text(yaml.safe_dump(archive_config))
+        os.utime(
+            self.archive.config_path,
+            ns=(config_stat.st_atime_ns, config_stat.st_mtime_ns + 10**9),
+        )
+        with self.assertLogs(archive.logger, level=logging.ERROR) as logged_msgs:
+            self.wait_for(
+                lambda: logged_msgs.records,
+                "Invalid config change not logged",
+            )
+        self.assertIn(
+            "Problem reloading configuration",
+            logged_msgs.records[0].message,
+            "Wrong invalid config change message",
+        )
+        self.assertIs(
+            self.archive.global_config,
+            orig_global_config,
+            "Global config replaced by an invalid config change",
+        )
+        self.assertIs(
+            self.archive.host_scheduler,
+            orig_host_scheduler,
+            "Host scheduler replaced by an invalid config change",
+        )
+        self.assertIs(
+            self.archive.archive_feeds,
+            orig_archive_feeds,
+            "Feeds replaced by an invalid config change",
+        )
+        self.assertEqual(
+            enclosures.PLUGINS,
+            orig_plugins,
+            "Shared plugins replaced by an invalid config change",
+        )
+
+        # Valid changes to the config are used for the next updates
+        archive_config["feeds"][0]["update-interval"] = 0.05
+        archive_config["defaults"]["metrics-dir"] = "metrics"
+        self.archive.config_path.write_text(yaml.safe_dump(archive_config))
+        os.utime(
+            self.archive.config_path,
+            ns=(config_stat.st_atime_ns, config_stat.st_mtime_ns + 2 * 10**9),
+        )
+        metrics_path = self.archive.root_path / "metrics" / "feed-archiver-daemon.prom"
+        self.wait_for(metrics_path.exists, "Changed config not used by the daemon")
+        (archive_feed,) = self.archive.archive_feeds
+        self.assertIsNot(
+            archive_feed,
+            orig_archive_feeds[0],
+            "Feed not re-loaded from the changed config",
+        )
+        self.assertEqual(
+            archive_feed.path,
+            orig_archive_feeds[0].path,
+            "Feed archive path not kept when reloading the config",
+        )
+        self.assertIs(
+            archive_feed.metrics,
+            orig_archive_feeds[0].metrics,
+            "Feed metrics not kept when reloading the config",
+        )
+
+        self.archive.daemon_stop.set()
+        daemon_thread.join(10)
+        self.assertFalse(daemon_thread.is_alive(), "Daemon not stopped")
@@ -7,13 +7,22 @@ Test updating the archive from the feed URLs.
 """
 
 import os
+import time
+import copy
+import json
+import gzip
 import datetime
+import email.utils
 import logging
+from unittest import mock
 
+import httpx
+import brotli
 from lxml import etree  # nosec: B410
 
 from .. import utils
 from .. import formats
+from .. import archive
 from .. import feed
 from .. import tests
 
@@ -142,6 +151,805 @@ class FeedarchiverFeedTests(tests.FeedarchiverTestCase):
             "Archive of feed XML is different from remote",
         )
 
+    def test_feed_not_modified(self):
+        """
+        The archive feed is not processed when the remote feed is not modified.
+        """
+        # Confirm initial fixture
+        orig_request_mocks, _ = self.update_feed(self.archive_feed)
+        _, get_mock = orig_request_mocks[self.feed_url]
+        last_modified = get_mock.calls.last.response.headers["Last-Modified"]
+        state_path = self.archive_feed.get_state_path()
+        self.assertTrue(state_path.is_file(), "Feed state not written")
+
+        # Remote feed responds that it hasn't been modified
+        get_mock.respond(304)
+        feed_stat = self.feed_path.stat()
+        updated_feeds = self.archive_feed.update()
+        self.assertEqual(
+            get_mock.calls.last.request.headers["If-Modified-Since"],
+            last_modified,
+            "Wrong conditional feed request header",
+        )
+        self.assertIsNone(updated_feeds, "Not modified feed reported as updated")
+        self.assertEqual(
+            self.archive_feed.path,
+            self.feed_path,
+            "Wrong archive feed path for not modified feed",
+        )
+        self.assertEqual(
+            self.feed_path.stat().st_mtime,
+            feed_stat.st_mtime,
+            "Not modified archive feed was written",
+        )
+        self.archive.engine = "async"
+        self.archive.update()
+        self.assertEqual(
+            self.feed_path.stat().st_mtime,
+            feed_stat.st_mtime,
+            "Not modified archive feed was written by the async engine",
+        )
+        self.archive.engine = "sync"
+
+        # Conditional requests are not sent if the archived feed is missing
+        orig_request_mocks = self.mock_remote(self.archive_feed)
+        _, get_mock = orig_request_mocks[self.feed_url]
+        self.feed_path.unlink()
+        self.archive_feed.update()
+        self.assertNotIn(
+            "If-Modified-Since",
+            get_mock.calls.last.request.headers,
+            "Conditional request sent for missing archive feed",
+        )
+
+        # A corrupt state file is treated as no state
+        state_path.write_text("{", encoding="utf-8")
+        with self.assertLogs(feed.logger, level=logging.ERROR):
+            self.archive_feed.update()
+        self.assertNotIn(
+            "If-Modified-Since",
+            get_mock.calls.last.request.headers,
+            "Conditional request sent for corrupt feed state",
+        )
+
+    def test_feed_streamed(self):
+        """
+        The remote feed XML is parsed as the response body is streamed.
+        """
+        orig_request_mocks = self.mock_remote(self.archive_feed)
+        feed_path, get_mock = orig_request_mocks[self.feed_url]
+        feed_bytes = feed_path.read_bytes()
+        get_mock.mock(
+            side_effect=lambda request: httpx.Response(
+                200,
+                headers={"Content-Type": "application/rss+xml"},
+                # Split into many chunks, including within tags and multi-byte chars
+                content=iter(
+                    feed_bytes[idx : idx + 7] for idx in range(0, len(feed_bytes), 7)
+                ),
+            ),
+        )
+        with mock.patch.object(
+            utils,
+            "get_pull_parser",
+            wraps=utils.get_pull_parser,
+        ) as parser_mock:
+            self.archive_feed.update()
+        parser_mock.assert_called_once_with(self.feed_url)
+        self.assertEqual(
+            list(tests.get_feed_items(self.feed_path)),
+            ["7bd204c6-1655-4c27-aeee-53f933c5395f"],
+            "Wrong archived feed items from a streamed response",
+        )
+
+        # The `async` engine parses the response from one worker thread as it's queued
+        async def aiter_feed_bytes(content):
+            for idx in range(0, len(content), 7):
+                yield content[idx : idx + 7]
+
+        self.archive.engine = "async"
+        get_mock.mock(
+            side_effect=lambda request: httpx.Response(
+                200,
+                headers={"Content-Type": "application/rss+xml"},
+                content=aiter_feed_bytes(feed_bytes),
+            ),
+        )
+        with mock.patch.object(
+            utils,
+            "parse_queued",
+            wraps=utils.parse_queued,
+        ) as parse_mock:
+            self.archive.update()
+        parse_mock.assert_called_once()
+        self.assertEqual(
+            list(tests.get_feed_items(self.feed_path)),
+            ["7bd204c6-1655-4c27-aeee-53f933c5395f"],
+            "Wrong archived feed items from a response streamed to the async engine",
+        )
+
+        # A failed transfer is reported instead of the parser's errors
+        async def aiter_failed_feed_bytes(content):
+            yield content[:7]
+            raise httpx.ReadError("Connection lost")
+
+        get_mock.mock(
+            side_effect=lambda request: httpx.Response(
+                200,
+                headers={"Content-Type": "application/rss+xml"},
+                content=aiter_failed_feed_bytes(feed_bytes),
+            ),
+        )
+        with self.assertLogs(archive.logger, level=logging.ERROR) as logged:
+            self.archive.update()
+        self.assertIn(
+            "httpx.ReadError",
+            logged.output[0],
+            "Wrong error for a failed transfer to the async engine",
+        )
+
+    def test_feed_streamed_archive(self):
+        """
+        New items are merged into large archived feeds as the archive is parsed.
+        """
+        self.update_feed(self.archive_feed)
+        state_path = self.archive_feed.get_state_path()
+        orig_feed_bytes = self.feed_path.read_bytes()
+        orig_feed_stat = self.feed_path.stat()
+        orig_state = json.loads(state_path.read_text(encoding="utf-8"))
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        loaded_feed_bytes = self.feed_path.read_bytes()
+        # Keep the added item's downloads to avoid requesting them again
+        orig_state["downloads"] = json.loads(state_path.read_text(encoding="utf-8"))[
+            "downloads"
+        ]
+
+        self.archive_feed.config["stream-archive-bytes"] = 0
+        self.archive_feed.load_config()
+        for is_indexed in (True, False):
+            with self.subTest(
+                msg="Merge items into the archived feed",
+                is_indexed=is_indexed,
+            ):
+                self.feed_path.write_bytes(orig_feed_bytes)
+                state_path.write_text(json.dumps(orig_state), encoding="utf-8")
+                if is_indexed:
+                    os.utime(
+                        self.feed_path,
+                        ns=(orig_feed_stat.st_atime_ns, orig_feed_stat.st_mtime_ns),
+                    )
+                with mock.patch.object(
+                    self.archive_feed,
+                    "load_archive_tree",
+                ) as load_mock:
+                    self.update_feed(self.archive_feed, remote_mock="added-item")
+                load_mock.assert_not_called()
+                self.assertEqual(
+                    self.feed_path.read_bytes(),
+                    loaded_feed_bytes,
+                    "Merged archived feed different from loading the whole archive",
+                )
+
+        # A corrupt archived feed is handled as when loading the whole archive
+        self.feed_path.write_text("{'status': 'Got JSON instead of RSS'")
+        with self.assertLogs(feed.logger, level=logging.WARNING) as logged_msgs:
+            self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertIn(
+            "Could not parse archive feed incrementally",
+            logged_msgs.records[0].message,
+            "Wrong logged record message",
+        )
+        self.assertEqual(
+            len(tests.get_feed_items(self.feed_path)),
+            2,
+            "Wrong number of items in re-initialized archived feed",
+        )
+
+    def test_merge_archive_items(self):
+        """
+        Merging items into the archived feed matches inserting them into the tree.
+        """
+        self.archive_feed.path = self.feed_path
+        self.feed_path.parent.mkdir(parents=True, exist_ok=True)
+        for feed_format_params in self.FEED_FORMAT_PARAMS:
+            feed_format_class = feed_format_params["feed_format_class"]
+            feed_format = feed_format_class(self.archive_feed)
+            for has_items in (True, False):
+                with self.subTest(
+                    msg="Merge items into one XML feed format",
+                    feed_format_class=feed_format_class,
+                    has_items=has_items,
+                ):
+                    feed_tree = etree.parse(  # nosec: B320
+                        str(self.REMOTES_PATH / feed_format_params["relative_path"]),
+                        parser=utils.XML_PARSER,
+                    )
+                    items_parent = feed_format.get_items_parent(feed_tree.getroot())
+                    (item_elem,) = feed_format.iter_items(feed_tree.getroot())
+                    if has_items:
+                        # Streamed along with the archived items
+                        item_elem.addnext(etree.Comment(" after the items "))
+                    else:
+                        items_parent.remove(item_elem)
+                    self.archive_feed.write_archive_tree(feed_tree)
+                    new_item_elem = copy.deepcopy(item_elem)
+                    (item_id_elem,) = new_item_elem.xpath(
+                        f"./*[local-name() = '{feed_format.ITEM_ID_TAG}']",
+                    )
+                    item_id_elem.text = "new-item"
+
+                    if has_items:
+                        item_elem.addprevious(copy.deepcopy(new_item_elem))
+                    else:
+                        items_parent.append(copy.deepcopy(new_item_elem))
+                    self.archive_feed.update_self(feed_format, feed_tree.getroot())
+                    self.archive_feed.write_archive_tree(feed_tree)
+                    inserted_feed_bytes = self.feed_path.read_bytes()
+                    if has_items:
+                        item_elem.getprevious().getparent().remove(
+                            item_elem.getprevious(),
+                        )
+                    else:
+                        items_parent.remove(items_parent[-1])
+                    self.archive_feed.write_archive_tree(feed_tree)
+
+                    self.archive_feed.merge_archive_items(feed_format, [new_item_elem])
+                    self.assertEqual(
+                        self.feed_path.read_bytes(),
+                        inserted_feed_bytes,
+                        "Merged archived feed different from inserting items",
+                    )
+
+        # The archived feed must contain the items parent
+        self.feed_path.write_text("<rss />")
+        with self.assertRaises(ValueError, msg="Wrong missing items parent error"):
+            self.archive_feed.merge_archive_items(formats.RssFeedFormat, [])
+
+    def test_feed_paged_archive(self):
+        """
+        The oldest items are moved into RFC 5005 archive pages.
+        """
+        self.archive_feed.config["page-items"] = 1
+        self.archive_feed.load_config()
+        self.update_feed(self.archive_feed)
+        self.assertEqual(
+            self.archive_feed.list_page_paths(),
+            [],
+            "Archive page written before the archived feed is full",
+        )
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        page_path = self.archive_feed.get_page_path(1)
+        self.assertEqual(
+            self.archive_feed.list_page_paths(),
+            [page_path],
+            "Wrong archive pages",
+        )
+        self.assertEqual(
+            list(tests.get_feed_items(self.feed_path)),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Wrong items in current feed document",
+        )
+        self.assertEqual(
+            list(tests.get_feed_items(page_path)),
+            ["7bd204c6-1655-4c27-aeee-53f933c5395f"],
+            "Wrong items in archive page",
+        )
+        feed_format = formats.RssFeedFormat(self.archive_feed)
+        archive_tree = etree.parse(str(self.feed_path))  # nosec: B320
+        archive_items_parent = feed_format.get_items_parent(archive_tree.getroot())
+        page_url = self.archive_feed.get_archive_url(page_path)
+        self.assertEqual(
+            archive_items_parent.xpath(
+                "./atom:link[@rel = 'prev-archive']/@href",
+                namespaces={"atom": feed_format.ATOM_NAMESPACE},
+            ),
+            [page_url],
+            "Wrong current feed document previous archive link",
+        )
+        page_tree = etree.parse(str(page_path))  # nosec: B320
+        page_items_parent = feed_format.get_items_parent(page_tree.getroot())
+        self.assertEqual(
+            {
+                link_elem.attrib["rel"]: link_elem.attrib["href"]
+                for link_elem in page_items_parent.iterchildren(
+                    f"{{{feed_format.ATOM_NAMESPACE}}}link",
+                )
+            },
+            {
+                "self": page_url,
+                "current": self.archive_feed.get_archive_url(self.feed_path),
+            },
+            "Wrong archive page links",
+        )
+        self.assertIsNotNone(
+            page_items_parent.find(f"{{{feed_format.HISTORY_NAMESPACE}}}archive"),
+            "Archive page not marked as archived",
+        )
+
+        # Items in pages aren't added again when rebuilding the item index
+        os.utime(self.feed_path)
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertEqual(
+            len(tests.get_feed_items(self.feed_path)),
+            1,
+            "Paged items added to the current feed document again",
+        )
+        with mock.patch.object(
+            self.archive_feed,
+            "relink_archive_tree",
+            return_value={},
+        ) as relink_mock:
+            self.archive_feed.relink()
+        self.assertEqual(
+            [relink_call.args for relink_call in relink_mock.call_args_list],
+            [(self.feed_path,), (page_path,)],
+            "Archive pages not re-linked",
+        )
+
+        # Later pages link to the previous pages and are never re-written
+        page_mtime = page_path.stat().st_mtime_ns
+        for item_id in ("foo", "bar"):
+            new_item_elem = copy.deepcopy(archive_items_parent.find("item"))
+            new_item_elem.find("guid").text = item_id
+            archive_items_parent.append(new_item_elem)
+        self.archive_feed.page_archive_tree(feed_format, archive_tree)
+        self.assertEqual(
+            [
+                list(tests.get_feed_items(page_path))
+                for page_path in self.archive_feed.list_page_paths()
+            ],
+            [["7bd204c6-1655-4c27-aeee-53f933c5395f"], ["bar"], ["foo"]],
+            "Wrong items in archive pages",
+        )
+        self.assertEqual(
+            page_path.stat().st_mtime_ns,
+            page_mtime,
+            "Archive page re-written",
+        )
+        last_page_tree = etree.parse(  # nosec: B320
+            str(self.archive_feed.get_page_path(3)),
+        )
+        self.assertEqual(
+            last_page_tree.xpath(
+                "//atom:link[@rel = 'prev-archive']/@href",
+                namespaces={"atom": feed_format.ATOM_NAMESPACE},
+            ),
+            [self.archive_feed.get_archive_url(self.archive_feed.get_page_path(2))],
+            "Wrong archive page previous archive link",
+        )
+        self.assertEqual(
+            archive_items_parent.xpath(
+                "./atom:link[@rel = 'prev-archive']/@href",
+                namespaces={"atom": feed_format.ATOM_NAMESPACE},
+            ),
+            [
+                last_page_tree.xpath(
+                    "//atom:link[@rel = 'self']/@href",
+                    namespaces={"atom": feed_format.ATOM_NAMESPACE},
+                )[0]
+            ],
+            "Wrong current feed document previous archive link",
+        )
+
+    def test_feed_latest_items(self):
+        """
+        A feed of only the latest items is written next to the archived feed.
+        """
+        self.archive_feed.config["latest-items"] = 1
+        self.archive_feed.config["page-items"] = 1
+        self.archive_feed.load_config()
+        self.update_feed(self.archive_feed)
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        latest_path = self.archive_feed.get_latest_path()
+        self.assertEqual(
+            list(tests.get_feed_items(latest_path)),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Wrong items in latest items feed",
+        )
+        feed_format = formats.RssFeedFormat(self.archive_feed)
+        latest_tree = etree.parse(str(latest_path))  # nosec: B320
+        latest_items_parent = feed_format.get_items_parent(latest_tree.getroot())
+        self.assertEqual(
+            {
+                link_elem.attrib["rel"]: link_elem.attrib["href"]
+                for link_elem in latest_items_parent.iterchildren(
+                    f"{{{feed_format.ATOM_NAMESPACE}}}link",
+                )
+            },
+            {},
+            "Archive page links in latest items feed",
+        )
+
+        # Items are filled in from the pages when the current document has fewer
+        self.archive_feed.config["latest-items"] = 3
+        self.archive_feed.load_config()
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertEqual(
+            list(tests.get_feed_items(latest_path)),
+            [
+                "de80d8ad-57b8-4e2a-8182-049e440e4976",
+                "7bd204c6-1655-4c27-aeee-53f933c5395f",
+            ],
+            "Wrong items in latest items feed filled in from the archive pages",
+        )
+
+        # The index links to the latest items next to the whole archive
+        self.archive.update_index()
+        index_tree = etree.parse(  # nosec: B320
+            str(self.archive.root_path / self.archive.INDEX_BASENAME),
+            parser=etree.HTMLParser(),
+        )
+        self.assertEqual(
+            index_tree.xpath("//li/a/@href"),
+            [str(self.feed_path), str(latest_path)],
+            "Wrong index links",
+        )
+
+    def test_feed_documents_configured(self):
+        """
+        Pages and the latest items are written once configured, even without new items.
+        """
+        self.update_feed(self.archive_feed)
+        orig_request_mocks, _ = self.update_feed(
+            self.archive_feed,
+            remote_mock="added-item",
+        )
+        _, get_mock = orig_request_mocks[self.feed_url]
+        latest_path = self.archive_feed.get_latest_path()
+        self.assertFalse(latest_path.exists(), "Latest items feed written by default")
+
+        # The remote feed is unchanged
+        self.archive_feed.config.update({"page-items": 1, "latest-items": 1})
+        self.archive_feed.load_config()
+        get_mock.respond(304)
+        self.archive_feed.update()
+        self.assertEqual(
+            [
+                list(tests.get_feed_items(path))
+                for path in [self.feed_path, latest_path]
+                + self.archive_feed.list_page_paths()
+            ],
+            [
+                ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+                ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+                ["7bd204c6-1655-4c27-aeee-53f933c5395f"],
+            ],
+            "Wrong items in documents configured while the remote feed is unchanged",
+        )
+        state = self.archive_feed.load_state()
+        self.assertIsNotNone(
+            self.archive_feed.load_item_ids(state),
+            "Item index stale after paging the archived feed",
+        )
+        with mock.patch.object(
+            self.archive_feed,
+            "load_archive_tree",
+        ) as load_mock:
+            self.archive_feed.update()
+        load_mock.assert_not_called()
+
+        # The remote feed has no new items
+        latest_path.unlink()
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertEqual(
+            list(tests.get_feed_items(latest_path)),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Missing latest items feed not written again",
+        )
+
+        # The remote feed has no new items but the item index is stale
+        latest_path.unlink()
+        os.utime(self.feed_path)
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertEqual(
+            list(tests.get_feed_items(latest_path)),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Missing latest items feed not written when rebuilding the item index",
+        )
+
+        # Re-linking also re-links the copies of the latest items
+        latest_path.write_text("<rss><channel /></rss>")
+        self.archive_feed.relink()
+        self.assertEqual(
+            list(tests.get_feed_items(latest_path)),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Latest items feed not written when re-linking",
+        )
+
+        # Once no longer configured the latest items are removed
+        latest_sidecar_path = latest_path.with_name(f"{latest_path.name}.gz")
+        latest_sidecar_path.write_bytes(b"")
+        self.archive_feed.config["latest-items"] = 0
+        self.archive_feed.load_config()
+        request_mocks = self.mock_remote(self.archive_feed, remote_mock="added-item")
+        _, get_mock = request_mocks[self.feed_url]
+        get_mock.respond(304)
+        os.utime(self.feed_path)
+        self.archive_feed.update()
+        self.assertFalse(
+            latest_path.exists() or latest_sidecar_path.exists(),
+            "Latest items feed not removed when no longer configured",
+        )
+
+        # Nothing is derived from a blank archived feed
+        self.feed_path.write_text("")
+        self.archive_feed.write_archive_documents()
+        self.assertEqual(
+            self.feed_path.read_text(),
+            "",
+            "Documents derived from a blank archived feed",
+        )
+
+    def test_feed_latest_items_streamed(self):
+        """
+        The latest items are also written when merging into large archived feeds.
+        """
+        self.archive_feed.config["latest-items"] = 1
+        self.archive_feed.config["stream-archive-bytes"] = 0
+        self.archive_feed.load_config()
+        self.update_feed(self.archive_feed)
+        with mock.patch.object(
+            self.archive_feed,
+            "load_archive_tree",
+        ) as load_mock:
+            self.update_feed(self.archive_feed, remote_mock="added-item")
+        load_mock.assert_not_called()
+        self.assertEqual(
+            list(tests.get_feed_items(self.feed_path)),
+            [
+                "de80d8ad-57b8-4e2a-8182-049e440e4976",
+                "7bd204c6-1655-4c27-aeee-53f933c5395f",
+            ],
+            "Wrong items in merged archived feed",
+        )
+        self.assertEqual(
+            list(tests.get_feed_items(self.archive_feed.get_latest_path())),
+            ["de80d8ad-57b8-4e2a-8182-049e440e4976"],
+            "Wrong items in merged latest items feed",
+        )
+
+    def test_feed_precompressed(self):
+        """
+        Compressed sidecars are written next to the archived feed and the index.
+        """
+        self.archive.precompress_encodings = ["gzip", "br"]
+        self.update_feed(self.archive_feed)
+        self.archive.update_index()
+        index_path = self.archive.root_path / self.archive.INDEX_BASENAME
+        for path in (self.feed_path, index_path):
+            with self.subTest(msg="Precompressed sidecars", path=str(path)):
+                gzip_path = path.with_name(f"{path.name}.gz")
+                self.assertEqual(
+                    gzip.decompress(gzip_path.read_bytes()),
+                    path.read_bytes(),
+                    "Wrong gzip sidecar content",
+                )
+                self.assertEqual(
+                    gzip_path.stat().st_mtime_ns,
+                    path.stat().st_mtime_ns,
+                    "Wrong gzip sidecar modification time",
+                )
+                self.assertEqual(
+                    brotli.decompress(
+                        path.with_name(f"{path.name}.br").read_bytes(),
+                    ),
+                    path.read_bytes(),
+                    "Wrong Brotli sidecar content",
+                )
+
+        # Sidecars are only written again when the source changes
+        index_mtime = index_path.stat().st_mtime_ns
+        with mock.patch.object(utils, "iter_compressed") as compress_mock:
+            self.archive.update_index()
+            self.archive.precompress(self.feed_path)
+        compress_mock.assert_not_called()
+        self.assertEqual(
+            index_path.stat().st_mtime_ns,
+            index_mtime,
+            "Unchanged HTML index re-written",
+        )
+        self.update_feed(self.archive_feed, remote_mock="added-item")
+        self.assertEqual(
+            gzip.decompress(self.feed_path.with_suffix(".rss.gz").read_bytes()),
+            self.feed_path.read_bytes(),
+            "Stale gzip sidecar content",
+        )
+
+        # The archived feed isn't given the time of a remote feed without new items
+        feed_mtime = self.feed_path.stat().st_mtime_ns
+        request_mocks = self.mock_remote(self.archive_feed, remote_mock="added-item")
+        remote_path, get_mock = request_mocks[self.feed_url]
+        get_mock.respond(
+            headers={
+                "Content-Type": "application/rss+xml",
+                "Last-Modified": email.utils.formatdate(usegmt=True),
+            },
+            content=remote_path.read_bytes(),
+        )
+        state_path = self.archive_feed.get_state_path()
+        for msg in ("item index", "stale item index"):
+            with self.subTest(msg=msg):
+                with mock.patch.object(utils, "iter_compressed") as compress_mock:
+                    self.archive_feed.update()
+                compress_mock.assert_not_called()
+                self.assertEqual(
+                    self.feed_path.stat().st_mtime_ns,
+                    feed_mtime,
+                    "Unchanged archived feed modification time updated",
+                )
+                # Rebuild the item index from the archived feed next time
+                state = json.loads(state_path.read_text())
+                del state["items"]
+                state_path.write_text(json.dumps(state))
+
+        # Sidecars of encodings no longer configured are removed
+        self.archive.precompress_encodings = ["gzip"]
+        self.archive.precompress(self.feed_path)
+        self.assertFalse(
+            self.feed_path.with_suffix(".rss.br").exists(),
+            "Sidecar of encoding no longer configured not removed",
+        )
+
+    def test_feed_adaptive_interval(self):
+        """
+        The update interval is learned from the feed's item publish dates.
+        """
+        self.archive_feed.config.update(
+            {"min-update-interval": 60, "max-update-interval": 7 * 24 * 60 * 60},
+        )
+        self.archive_feed.load_config()
+        # Nothing to learn from on the first update of a feed without dates
+        self.archive_feed.learn_update_interval(1)
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            self.archive_feed.UPDATE_INTERVAL,
+            "Interval learned without any feed history",
+        )
+        self.archive_feed.schedule.clear()
+
+        # The fixture's only item was published long ago
+        with mock.patch.object(
+            utils,
+            "parse_published_timestamps",
+            wraps=utils.parse_published_timestamps,
+        ) as published_mock:
+            orig_request_mocks, _ = self.update_feed(self.archive_feed)
+        published_mock.assert_called_once()
+        self.assertEqual(
+            len(published_mock.call_args.args[2]),
+            1,
+            "Dates read from items other than the new items",
+        )
+        _, get_mock = orig_request_mocks[self.feed_url]
+        state_path = self.archive_feed.get_state_path()
+        self.assertEqual(
+            json.loads(state_path.read_text())["schedule"]["interval"],
+            7 * 24 * 60 * 60,
+            "Wrong learned interval for a feed that stopped publishing",
+        )
+
+        # Learn from the dates of the new items and of the items before them
+        self.archive_feed.schedule["recent"].clear()
+        now = time.time()
+        with mock.patch("time.time", return_value=now):
+            self.archive_feed.learn_update_interval(1, [now - 4 * 60 * 60])
+            self.archive_feed.learn_update_interval(1, [now - 2 * 60 * 60])
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            60 * 60,
+            "Wrong learned interval from the dates of new and previous items",
+        )
+        self.archive_feed.schedule.pop("recent")
+
+        # Learn from the number of new items when items have no dates
+        with mock.patch("time.time", return_value=now + 4 * 60 * 60):
+            self.archive_feed.learn_update_interval(8)
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            15 * 60,
+            "Wrong learned interval from the number of new items",
+        )
+
+        # Back off when not modified for longer than the learned interval
+        get_mock.respond(304)
+        with mock.patch("time.time", return_value=now + 28 * 60 * 60):
+            self.archive_feed.update()
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            12 * 60 * 60,
+            "Wrong learned interval for a feed that hasn't published recently",
+        )
+
+        # Items already in the index aren't parsed again to learn the interval
+        with mock.patch(
+            "time.time",
+            return_value=now + 28 * 60 * 60,
+        ), mock.patch.object(
+            utils,
+            "parse_published_timestamps",
+        ) as published_mock:
+            self.update_feed(self.archive_feed)
+        published_mock.assert_not_called()
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            12 * 60 * 60,
+            "Wrong learned interval for a feed without new items",
+        )
+
+        # The learned interval is resumed from the state
+        self.archive_feed.update_interval = self.archive_feed.UPDATE_INTERVAL
+        self.archive_feed.load_config()
+        self.assertEqual(
+            self.archive_feed.update_interval,
+            12 * 60 * 60,
+            "Learned interval not resumed from the feed state",
+        )
+
+        # The learned schedule is kept when the configuration is reloaded
+        self.archive_feed.schedule["interval"] = 6 * 60 * 60
+        reloaded_feed = feed.ArchiveFeed(
+            archive=self.archive,
+            config=self.archive_feed.config,
+        )
+        reloaded_feed.load_config()
+        reloaded_feed.resume(self.archive_feed)
+        self.assertEqual(
+            (reloaded_feed.path, reloaded_feed.update_interval),
+            (self.archive_feed.path, 6 * 60 * 60),
+            "Learned schedule not kept when reloading the config",
+        )
+
+        # The bounds must make sense
+        self.archive_feed.config["max-update-interval"] = 30
+        with self.assertRaises(ValueError, msg="Wrong invalid bounds error"):
+            self.archive_feed.load_config()
+        self.archive_feed.config["max-update-interval"] = "1w"
+        with self.assertRaises(ValueError, msg="Wrong invalid interval error"):
+            self.archive_feed.load_config()
+
+    def test_feed_item_index(self):
+        """
+        The archived feed isn't parsed if the item index shows no new items.
+        """
+        # Confirm initial fixture
+        self.update_feed(self.archive_feed)
+        self.assertEqual(
+            self.archive_feed.load_state()["items"]["ids"],
+            ["7bd204c6-1655-4c27-aeee-53f933c5395f"],
+            "Wrong archived feed item index",
+        )
+
+        # No new items in the remote feed
+        with mock.patch.object(
+            self.archive_feed,
+            "load_archive_tree",
+            wraps=self.archive_feed.load_archive_tree,
+        ) as load_mock:
+            self.assertIsNone(
+                self.archive_feed.update(),
+                "Feed without new items reported as updated",
+            )
+        load_mock.assert_not_called()
+
+        # The index is rebuilt if the archived feed is modified outside an update
+        feed_stat = self.feed_path.stat()
+        os.utime(self.feed_path, (feed_stat.st_atime, feed_stat.st_mtime - 60))
+        with mock.patch.object(
+            self.archive_feed,
+            "load_archive_tree",
+            wraps=self.archive_feed.load_archive_tree,
+        ) as load_mock:
+            self.assertIsNone(
+                self.archive_feed.update(),
+                "Feed with a stale item index reported as updated",
+            )
+        load_mock.assert_called_once_with()
+        self.assertEqual(
+            len(tests.get_feed_items(self.feed_path)),
+            1,
+            "Wrong number of archived feed items after rebuilding the index",
+        )
+
     def test_feed_added_item(self):
         """
         Items are added to the archive feed XML as the remote feed XML changes.
@@ -0,0 +1,283 @@
+# SPDX-FileCopyrightText: 2023 Ross Patterson <me@rpatterson.net>
+#
+# SPDX-License-Identifier: MIT
+
+"""
+Test the feed-archiver politeness limits on requests to remote hosts.
+"""
+
+import time
+import email.utils
+import asyncio
+import unittest
+
+import httpx
+
+from .. import hosts
+from .. import tests
+
+
+class FeedarchiverHostsTests(unittest.TestCase):
+    """
+    Test the feed-archiver politeness limits on requests to remote hosts.
+    """
+
+    URL = "https://foo.example.com/podcast/feed.rss"
+
+    def test_host_overrides(self):
+        """
+        Limits may be configured for all hosts and overridden for specific hosts.
+        """
+        host_scheduler = hosts.HostScheduler(
+            {
+                "max-host-connections": 3,
+                "max-retry-after": 60,
+                "hosts": {
+                    "foo.example.com": {
+                        "max-host-connections": 1,
+                        "min-host-interval": 0.5,
+                        "max-retry-after": 600,
+                    },
+                },
+            },
+        )
+        host = host_scheduler.get_host(self.URL)
+        self.assertEqual(
+            (host.max_connections, host.min_interval, host.max_retry_after),
+            (1, 0.5, 600),
+            "Wrong limits for host with overrides",
+        )
+        self.assertIs(
+            host_scheduler.get_host(f"{self.URL}?bar=qux"),
+            host,
+            "Different host state for the same host",
+        )
+        other_host = host_scheduler.get_host("https://bar.example.com/media/")
+        self.assertEqual(
+            (
+                other_host.max_connections,
+                other_host.min_interval,
+                other_host.max_retry_after,
+            ),
+            (3, hosts.HostScheduler.MIN_INTERVAL, 60),
+            "Wrong limits for host without overrides",
+        )
+
+    def test_invalid_limits(self):
+        """
+        Invalid limits raise a helpful error.
+        """
+        with self.assertRaises(ValueError, msg="Wrong invalid connections error"):
+            hosts.HostScheduler({"max-host-connections": 0})
+        with self.assertRaises(ValueError, msg="Wrong invalid interval error"):
+            hosts.HostScheduler({"min-host-interval": "1s"})
+        with self.assertRaises(ValueError, msg="Wrong invalid max retry error"):
+            hosts.HostScheduler({"max-retry-after": -1})
+
+    def test_min_interval(self):
+        """
+        Requests to the same host are spaced by the minimum interval.
+        """
+        host_scheduler = hosts.HostScheduler({"min-host-interval": 0.05})
+        start = time.monotonic()
+        for _ in range(3):
+            with host_scheduler.limit(self.URL):
+                pass
+        self.assertGreaterEqual(
+            time.monotonic() - start,
+            0.1,
+            "Requests not spaced by the minimum interval",
+        )
+
+    def test_min_interval_async(self):
+        """
+        Requests from the async engine are also spaced by the minimum interval.
+        """
+        host_scheduler = hosts.HostScheduler({"min-host-interval": 0.05})
+
+        async def request_host():
+            async with host_scheduler.limit_async(self.URL):
+                pass
+
+        async def request_host_concurrently():
+            await asyncio.gather(*(request_host() for _ in range(3)))
+
+        start = time.monotonic()
+        asyncio.run(request_host_concurrently())
+        self.assertGreaterEqual(
+            time.monotonic() - start,
+            0.1,
+            "Async requests not spaced by the minimum interval",
+        )
+
+    def test_parse_retry_after(self):
+        """
+        Both forms of `Retry-After` header values are supported.
+        """
+        self.assertEqual(
+            hosts.parse_retry_after("120"),
+            120.0,
+            "Wrong seconds `Retry-After` delay",
+        )
+        retry_after = hosts.parse_retry_after(
+            email.utils.formatdate(time.time() + 60, usegmt=True),
+        )
+        self.assertGreater(retry_after, 55, "Wrong date `Retry-After` delay")
+        self.assertLessEqual(retry_after, 60, "Wrong date `Retry-After` delay")
+        with self.assertLogs(hosts.logger):
+            self.assertIsNone(
+                hosts.parse_retry_after("tomorrow"),
+                "Wrong invalid `Retry-After` delay",
+            )
+
+
+class FeedarchiverRetryAfterTests(tests.FeedarchiverDownloadsTestCase):
+    """
+    Test that downloads honour `Retry-After` responses.
+    """
+
+    def test_retry_after(self):
+        """
+        Downloads are retried after the delay the remote host asked for.
+        """
+        self.mock_remote(self.archive_feed)
+        throttled_mock = self.client_mock.get(self.ENCLOSURE_URL).mock(
+            side_effect=[
+                httpx.Response(429, headers={"Retry-After": "0"}),
+                httpx.Response(
+                    200,
+                    headers={"Content-Type": "audio/mpeg"},
+                    content=self.ENCLOSURE_MOCK_PATH.read_bytes(),
+                ),
+            ],
+        )
+        self.archive_feed.update()
+        self.assertEqual(
+            throttled_mock.call_count,
+            2,
+            "Wrong number of throttled download requests",
+        )
+        self.assertEqual(
+            (
+                self.archive.root_path / self.ENCLOSURE_RELATIVE.with_suffix(".mp3")
+            ).read_bytes(),
+            self.ENCLOSURE_MOCK_PATH.read_bytes(),
+            "Wrong download content after retrying",
+        )
+
+    def test_retry_after_async(self):
+        """
+        Downloads from the async engine are retried after the delay.
+        """
+        self.mock_remote(self.archive_feed)
+        throttled_mock = self.client_mock.get(self.ENCLOSURE_URL).mock(
+            side_effect=[
+                httpx.Response(429, headers={"Retry-After": "0"}),
+                httpx.Response(
+                    200,
+                    headers={"Content-Type": "audio/mpeg"},
+                    content=self.ENCLOSURE_MOCK_PATH.read_bytes(),
+                ),
+            ],
+        )
+        self.archive.engine = "async"
+        self.archive.update()
+        self.assertEqual(
+            throttled_mock.call_count,
+            2,
+            "Wrong number of throttled async download requests",
+        )
+
+    def test_retry_after_exhausted(self):
+        """
+        The feed item is skipped if the remote host keeps asking to retry.
+        """
+        self.mock_remote(self.archive_feed)
+        throttled_mock = self.client_mock.get(self.ENCLOSURE_URL).respond(
+            503,
+            headers={"Retry-After": "0"},
+        )
+        self.archive_feed.update()
+        self.assertEqual(
+            throttled_mock.call_count,
+            hosts.HostScheduler.RETRY_ATTEMPTS,
+            "Wrong number of throttled download requests",
+        )
+        self.assertFalse(
+            (self.archive.root_path / self.ENCLOSURE_RELATIVE).exists(),
+            "Throttled response written to the archive",
+        )
+        self.assertNotIn(
+            "foo_376d9037-bf85-4e05-913c-be5e7724c4a6",
+            tests.get_feed_items(self.archive_feed.path),
+            "Feed item with throttled download added to archive",
+        )
+
+    def test_retry_after_too_long(self):
+        """
+        The feed item is skipped if the remote host asks to wait too long.
+        """
+        self.mock_remote(self.archive_feed)
+        throttled_mock = self.client_mock.get(self.ENCLOSURE_URL).respond(
+            429,
+            headers={"Retry-After": "3600"},
+        )
+        start = time.monotonic()
+        self.archive_feed.update()
+        self.assertLess(
+            time.monotonic() - start,
+            hosts.HostScheduler.MAX_RETRY_AFTER,
+            "Waited for a `Retry-After` longer than the maximum",
+        )
+        self.assertEqual(
+            throttled_mock.call_count,
+            1,
+            "Retried a download the host asked to wait too long for",
+        )
+        self.assertNotIn(
+            "foo_376d9037-bf85-4e05-913c-be5e7724c4a6",
+            tests.get_feed_items(self.archive_feed.path),
+            "Feed item with throttled download added to archive",
+        )
+
+    def test_retry_after_head(self):
+        """
+        `HEAD` requests are also retried after the delay the remote host asked for.
+        """
+        self.assert_retry_after_head()
+
+    def test_retry_after_head_async(self):
+        """
+        `HEAD` requests from the async engine are also retried after the delay.
+        """
+        self.archive.engine = "async"
+        self.assert_retry_after_head()
+
+    def assert_retry_after_head(self):
+        """
+        Assert that a throttled `HEAD` request is retried instead of downloading.
+        """
+        orig_request_mocks = self.mock_remote(self.archive_feed)
+        self.archive.update()
+        archive_feed = self.archive.archive_feeds[0]
+        # Re-process the items so that existing downloads are looked up
+        archive_feed.get_state_path().unlink()
+        archive_feed.path.unlink()
+        head_mock = self.client_mock.head(self.ENCLOSURE_URL).mock(
+            side_effect=[
+                httpx.Response(503, headers={"Retry-After": "0"}),
+                httpx.Response(200, headers={"Content-Type": "audio/mpeg"}),
+            ],
+        )
+        self.archive.update()
+        self.assertEqual(
+            head_mock.call_count,
+            2,
+            "Wrong number of throttled `HEAD` requests",
+        )
+        _, enclosure_request_mock = orig_request_mocks[self.ENCLOSURE_URL]
+        self.assertEqual(
+            enclosure_request_mock.call_count,
+            1,
+            "Download requested again despite the `HEAD` request",
+        )
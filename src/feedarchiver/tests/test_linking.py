@@ -8,9 +8,16 @@ Test the feed-archiver linking of enclosures into media libraries.
 
 import os
 import pathlib
+import copy
+import sqlite3
+import contextlib
 import logging
+from unittest import mock
 
 import feedarchiver
+from .. import utils
+from .. import enclosures
+from ..enclosures import servarr
 from .. import archive
 from .. import feed
 from .. import tests
@@ -65,6 +72,284 @@ class FeedarchiverDownloadTests(tests.FeedarchiverDownloadsTestCase):
             "Item enclosure symlink to wrong target",
         )
 
+    def test_feed_parsed_once(self):
+        """
+        The new items are richly parsed at once for all items linked by plugins.
+        """
+        # Left over from a previous update
+        self.archive_feed.items_parsed = {"foo-item-id": ({}, {})}
+        with mock.patch.object(
+            utils,
+            "parse_items_feed",
+            wraps=utils.parse_items_feed,
+        ) as parse_mock, mock.patch.object(
+            utils,
+            "parse_item_feed",
+            wraps=utils.parse_item_feed,
+        ) as parse_item_mock:
+            updated_items, _ = self.update_feed(self.archive_feed)[1]
+        self.assertGreater(len(updated_items), 1, "Too few items to test parsing")
+        # The same parse is used for prefetching and linking
+        parse_mock.assert_called_once()
+        parse_item_mock.assert_not_called()
+        self.assertTrue(self.archive_feed.items_parsed, "No richly parsed items")
+        for item_feed_parsed, item_parsed in self.archive_feed.items_parsed.values():
+            self.assertEqual(
+                item_feed_parsed.entries,
+                [item_parsed],
+                "Richly parsed feed for an item includes other items",
+            )
+            for enclosure_parsed in item_parsed.enclosures:
+                self.assertTrue(
+                    enclosure_parsed.href.startswith(self.archive.url),
+                    "Richly parsed item enclosure URL not from the archive",
+                )
+
+    def test_feed_parsed_item_fallback(self):
+        """
+        Items missing from the richly parsed feed are parsed by themselves.
+        """
+        with mock.patch.object(
+            utils,
+            "parse_items_feed",
+            return_value={},
+        ):
+            self.update_feed(self.archive_feed)
+        self.assertTrue(
+            (
+                self.archive_feed.archive.root_path
+                / "Music"
+                / "Podcasts"
+                / self.FEED_BASENAME
+                / self.ITEM_DOWNLOAD_BASENAME
+            ).is_symlink(),
+            "Item enclosure missing from symlinks hierarchy",
+        )
+
+    def test_shared_plugins(self):
+        """
+        Feeds with identical plugin configs share the same plugin instances.
+        """
+        other_feed = feed.ArchiveFeed(
+            archive=self.archive,
+            config=copy.deepcopy(self.archive_feed.config),
+        )
+        other_feed.load_config()
+        self.assertIs(
+            other_feed.enclosure_plugins[-1],
+            self.archive_feed.enclosure_plugins[-1],
+            "Different plugin instances for identical configs",
+        )
+        other_feed.config["enclosures"][0]["stem-append"] = "-qux"
+        other_feed.load_config()
+        self.assertIsNot(
+            other_feed.enclosure_plugins[-1],
+            self.archive_feed.enclosure_plugins[-1],
+            "Same plugin instance for different configs",
+        )
+
+    def test_sonarr_cache(self):
+        """
+        Sonarr API responses are cached between runs until they expire or miss.
+        """
+        request_mocks = self.mock_remote(self.archive_feed)
+        self.archive_feed.update()
+        sonarr_mocks = {
+            path: request_mocks[f"{self.SONARR_URL}/api/v3/{path}"][1]
+            for path in (
+                "series?apikey=secret",
+                "series/7?apikey=secret",
+                "episode?apikey=secret&seriesId=7",
+                "episodeFile?apikey=secret&seriesId=7",
+            )
+        }
+        self.assertEqual(
+            {path: mock.call_count for path, mock in sonarr_mocks.items()},
+            dict.fromkeys(sonarr_mocks, 1),
+            "Wrong number of Sonarr requests for the first run",
+        )
+
+        # The next run uses the cache but refreshes the episodes when one is missing
+        feedarchiver.main(
+            args=["--archive-dir", str(self.archive.root_path), "relink"],
+        )
+        self.assertEqual(
+            {path: mock.call_count for path, mock in sonarr_mocks.items()},
+            {
+                "series?apikey=secret": 1,
+                "series/7?apikey=secret": 1,
+                "episode?apikey=secret&seriesId=7": 2,
+                "episodeFile?apikey=secret&seriesId=7": 2,
+            },
+            "Wrong number of Sonarr requests using the cache",
+        )
+
+        # Expired responses are requested again
+        with contextlib.closing(
+            sqlite3.connect(
+                str(
+                    self.archive.root_path
+                    / servarr.SonarrEnclosurePlugin.CACHE_BASENAME
+                )
+            )
+        ) as connection, connection:
+            connection.execute("UPDATE responses SET expires = 0")
+        feedarchiver.main(
+            args=["--archive-dir", str(self.archive.root_path), "relink"],
+        )
+        self.assertEqual(
+            {path: mock.call_count for path, mock in sonarr_mocks.items()},
+            {
+                "series?apikey=secret": 2,
+                "series/7?apikey=secret": 2,
+                "episode?apikey=secret&seriesId=7": 3,
+                "episodeFile?apikey=secret&seriesId=7": 3,
+            },
+            "Wrong number of Sonarr requests after the cache expired",
+        )
+
+        # The cache may be disabled
+        with mock.patch.object(servarr.SonarrEnclosurePlugin, "cache_ttl", 0):
+            feedarchiver.main(
+                args=["--archive-dir", str(self.archive.root_path), "relink"],
+            )
+        self.assertEqual(
+            sonarr_mocks["series?apikey=secret"].call_count,
+            3,
+            "Wrong number of Sonarr requests with the cache disabled",
+        )
+
+    def test_sonarr_daemon_cache(self):
+        """
+        Daemon updates don't re-use Sonarr API responses requested by earlier updates.
+        """
+        request_mocks = self.mock_remote(self.archive_feed)
+        self.archive_feed.update()
+        series_mock = request_mocks[f"{self.SONARR_URL}/api/v3/series?apikey=secret"][1]
+        episode_mock = request_mocks[
+            f"{self.SONARR_URL}/api/v3/episode?apikey=secret&seriesId=7"
+        ][1]
+        (sonarr_plugin,) = [
+            enclosure_plugin
+            for enclosure_plugin in self.archive_feed.enclosure_plugins
+            if isinstance(enclosure_plugin, servarr.SonarrEnclosurePlugin)
+        ]
+        sonarr_plugin.get_episode_paths(7, refresh=True)
+        self.assertEqual(
+            (series_mock.call_count, episode_mock.call_count),
+            (1, 1),
+            "Responses requested during the update not re-used",
+        )
+
+        # The next daemon update uses the cache but refreshing requests again
+        self.archive.run_daemon_update(self.archive_feed)
+        sonarr_plugin.get_series_by_title()
+        sonarr_plugin.get_episode_paths(7, refresh=True)
+        self.assertEqual(
+            (series_mock.call_count, episode_mock.call_count),
+            (1, 2),
+            "Wrong number of Sonarr requests refreshing in the next daemon update",
+        )
+
+        # Expired responses are requested again by the next daemon update
+        with contextlib.closing(sonarr_plugin.connect_cache()) as connection:
+            with connection:
+                connection.execute("UPDATE responses SET expires = 0")
+        self.archive.run_daemon_update(self.archive_feed)
+        self.assertIn(
+            "Qux Series Title",
+            sonarr_plugin.series_by_title,
+            "Series missing after the cache expired",
+        )
+        self.assertEqual(
+            series_mock.call_count,
+            2,
+            "Expired Sonarr response not requested in the next daemon update",
+        )
+
+    def test_sonarr_prefetch(self):
+        """
+        Sonarr data for all of a feed's new items is requested before linking.
+        """
+        request_mocks = self.mock_remote(self.archive_feed)
+        sonarr_mocks = [
+            request_mocks[f"{self.SONARR_URL}/api/v3/{path}"][1]
+            for path in (
+                "series/7?apikey=secret",
+                "episode?apikey=secret&seriesId=7",
+                "episodeFile?apikey=secret&seriesId=7",
+            )
+        ]
+        prefetched_counts = []
+        orig_prefetch = servarr.SonarrEnclosurePlugin.prefetch
+
+        def prefetch(plugin, matches):
+            """
+            Capture the Sonarr requests sent by prefetching.
+            """
+            orig_prefetch(plugin, matches)
+            prefetched_counts.extend(
+                sonarr_mock.call_count for sonarr_mock in sonarr_mocks
+            )
+
+        with mock.patch.object(
+            servarr.SonarrEnclosurePlugin,
+            "prefetch",
+            autospec=True,
+            side_effect=prefetch,
+        ) as prefetch_mock:
+            self.archive_feed.update()
+        prefetch_mock.assert_called_once()
+        (_, matches), _ = prefetch_mock.call_args
+        self.assertEqual(
+            {match.group("series_title") for match in matches},
+            {"Qux Series Title"},
+            "Wrong prefetched Sonarr matches",
+        )
+        self.assertEqual(
+            prefetched_counts,
+            [1, 1, 1],
+            "Sonarr data not requested by prefetching",
+        )
+        self.assertEqual(
+            [sonarr_mock.call_count for sonarr_mock in sonarr_mocks],
+            [1, 1, 1],
+            "Sonarr data requested again when linking",
+        )
+
+        # Problems prefetching are logged and linking continues
+        feed_links_path = (
+            self.archive.root_path / "Music" / "Podcasts" / self.FEED_BASENAME
+        )
+        self.archive_feed.path.unlink()
+        for link_path in feed_links_path.iterdir():
+            link_path.unlink()
+        with mock.patch.object(
+            servarr.SonarrEnclosurePlugin,
+            "prefetch",
+            side_effect=ValueError("Sonarr is down"),
+        ), self.assertLogs(feed.logger, level=logging.ERROR) as logged_msgs:
+            self.archive_feed.update()
+        self.assertTrue(
+            [
+                logged_record
+                for logged_record in logged_msgs.records
+                if logged_record.message.startswith("Problem prefetching")
+            ],
+            "Prefetch problem not logged",
+        )
+        self.assertTrue(
+            (feed_links_path / self.ITEM_DOWNLOAD_BASENAME).is_symlink(),
+            "Item enclosure not linked after problem prefetching",
+        )
+
+    def test_invalid_template(self):
+        """
+        Templates that aren't valid Python f-strings raise a helpful error on load.
+        """
+        with self.assertRaises(ValueError, msg="Wrong invalid template error"):
+            enclosures.compile_template("{item_parsed.title", "template")
+
     def test_feed_relinking_existing(self):
         """
         The `relink` sub-command cleans up old links and makes new links per the config.
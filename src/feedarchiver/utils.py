@@ -14,6 +14,8 @@ import copy
 import mimetypes
 import urllib.parse
 import email
+import calendar
+import zlib
 import logging
 import tracemalloc
 
@@ -21,6 +23,11 @@ import feedparser
 
 from lxml import etree  # nosec B410
 
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
 logger = logging.getLogger(__name__)
 
 # Configure the XML parser as securely as possible since we're parsing XML from
@@ -28,6 +35,60 @@ logger = logging.getLogger(__name__)
 # https://lxml.de/FAQ.html#how-do-i-use-lxml-safely-as-a-web-service-endpoint
 XML_PARSER = etree.XMLParser(resolve_entities=False)
 
+
+def get_pull_parser(base_url):
+    """
+    Return a new parser to feed XML to incrementally, configured as `XML_PARSER` is.
+    """
+    return etree.XMLPullParser(  # nosec: B320
+        events=(),
+        base_url=base_url,
+        resolve_entities=False,
+    )
+
+
+def parse_queued(base_url, data_queue):
+    """
+    Parse the XML put on the queue until `None` is put and return the root element.
+
+    Used to feed a parser from only the one thread that created it, since `lxml`
+    parsers mustn't be used from other threads.
+    """
+    pull_parser = get_pull_parser(base_url)
+    for data in iter(data_queue.get, None):
+        pull_parser.feed(data)
+    return pull_parser.close()
+
+
+# The `Content-Encoding` of precompressed sidecar files mapped to their suffixes as
+# served by nginx's `gzip_static` and `brotli_static`
+PRECOMPRESS_SUFFIXES = {"gzip": ".gz", "br": ".br"}
+PRECOMPRESS_CHUNK_BYTES = 1024 * 1024
+
+
+def iter_compressed(source_opened, encoding):
+    """
+    Compress the opened file in chunks and yield the compressed bytes.
+
+    Use high compression levels since sidecars are only written when the source changes
+    but may be served many times, though not Brotli's highest which is many times
+    slower for large feeds.  The gzip header has no modification time so the sidecar
+    only changes when the content does.
+    """
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=9)
+        compress, finish = compressor.process, compressor.finish
+    else:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress, finish = compressor.compress, compressor.flush
+    for chunk in iter(
+        functools.partial(source_opened.read, PRECOMPRESS_CHUNK_BYTES),
+        b"",
+    ):
+        yield compress(chunk)
+    yield finish()
+
+
 TRUE_STRS = {"1", "true", "yes", "on"}
 DEBUG = (  # noqa: F841
     "DEBUG" in os.environ and os.environ["DEBUG"].strip().lower() in TRUE_STRS
@@ -201,7 +262,8 @@ def copy_empty_items_parent(feed_format, items_parent):
 # doesn't provide.  enclosure plugins, however, frequently need the richer parsing
 # support that `feedparser` *does* provide, such as parsing dates and times.  That rich
 # parsing is only needed in the rare case of new items being added to the archive's
-# version of the feed, so only do the rich parsing on a per-item basis.
+# version of the feed, so only do the rich parsing when an item needs it, see
+# `parse_items_feed()`.
 def parse_item_feed(feed_format, feed_elem, item_elem):
     """
     Reconstruct a "feed" of just one item and return the richly parsed version.
@@ -209,3 +271,50 @@ def parse_item_feed(feed_format, feed_elem, item_elem):
     item_feed_elem = copy_empty_items_parent(feed_format, feed_elem)
     item_feed_elem.append(copy.deepcopy(item_elem))
     return feedparser.parse(etree.tostring(item_feed_elem))
+
+
+def parse_items_feed(feed_format, feed_elem, item_elems):
+    """
+    Richly parse a reconstructed "feed" of many items at once.
+
+    Return the parsed "feed" of just one item and that parsed item mapped by their IDs,
+    the same as `parse_item_feed()` would return for each item, without parsing a
+    reconstructed feed for each item.
+    """
+    items_feed_elem = copy_empty_items_parent(feed_format, feed_elem)
+    items_feed_elem.extend(copy.deepcopy(item_elem) for item_elem in item_elems)
+    feed_parsed = feedparser.parse(etree.tostring(items_feed_elem))
+    items_parsed = {}
+    for entry_parsed in feed_parsed.entries:
+        item_feed_parsed = feedparser.FeedParserDict(feed_parsed)
+        item_feed_parsed["entries"] = [entry_parsed]
+        items_parsed.setdefault(
+            entry_parsed.get("id", "").strip(),
+            (item_feed_parsed, entry_parsed),
+        )
+    return items_parsed
+
+
+def parse_published_timestamps(feed_format, feed_elem, item_elems):
+    """
+    Richly parse just the dates of the items and return their sorted timestamps.
+
+    Reconstruct a "feed" of items containing only their date elements so that the rest
+    of the items are neither copied nor parsed.
+    """
+    dates_feed_elem = etree.Element(feed_elem.tag, nsmap=feed_elem.nsmap)
+    for item_elem in item_elems:
+        dates_item_elem = etree.SubElement(dates_feed_elem, item_elem.tag)
+        dates_item_elem.extend(
+            copy.deepcopy(date_elem)
+            for date_elem in feed_format.iter_item_dates(item_elem)
+        )
+    feed_parsed = feedparser.parse(etree.tostring(dates_feed_elem))
+    return sorted(
+        calendar.timegm(entry_date)
+        for entry_date in (
+            entry_parsed.get("published_parsed") or entry_parsed.get("updated_parsed")
+            for entry_parsed in feed_parsed.entries
+        )
+        if entry_date is not None
+    )